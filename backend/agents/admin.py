@@ -1,4 +1,5 @@
 from django.contrib import admin
-from .models import Agent
+from .models import Agent, AgentJob
 
 admin.site.register(Agent)
+admin.site.register(AgentJob)
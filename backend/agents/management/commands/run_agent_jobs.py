@@ -0,0 +1,31 @@
+import signal
+
+from django.core.management.base import BaseCommand
+
+from agents.services.jobs import JobWorker
+
+
+class Command(BaseCommand):
+    help = 'Run queued agent jobs (image and audio generation) on a local thread pool'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, help='Jobs to run concurrently (default: AGENT_JOBS["WORKERS"])')
+        parser.add_argument('--poll-interval', type=float, help='Seconds between queue checks when idle')
+        parser.add_argument('--once', action='store_true', help='Claim one round of jobs, wait for them and exit')
+
+    def handle(self, *args, **options):
+        config = {}
+        if options['workers']:
+            config['WORKERS'] = options['workers']
+        if options['poll_interval']:
+            config['POLL_INTERVAL'] = options['poll_interval']
+
+        worker = JobWorker(config)
+        signal.signal(signal.SIGTERM, lambda *_: worker.stop())
+        workers = worker.config['WORKERS']
+        self.stdout.write(f"Agent job worker {worker.name} running {workers} jobs at a time")
+        try:
+            worker.run(once=options['once'])
+        except KeyboardInterrupt:
+            worker.stop()
+        self.stdout.write("Agent job worker stopped")
@@ -0,0 +1,74 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agents', '0002_agentjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='agent',
+            name='category',
+            field=models.CharField(blank=True, max_length=50),
+        ),
+        migrations.AddField(
+            model_name='agent',
+            name='downloads',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='agent',
+            name='example_payload',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='agent',
+            name='is_published',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AddField(
+            model_name='agent',
+            name='price',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=8),
+        ),
+        migrations.AddField(
+            model_name='agent',
+            name='rating',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='agent',
+            name='slug',
+            field=models.SlugField(blank=True, max_length=100, null=True, unique=True),
+        ),
+        migrations.AddField(
+            model_name='agent',
+            name='supported_models',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.AddField(
+            model_name='agent',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddIndex(
+            model_name='agent',
+            index=models.Index(condition=models.Q(('is_published', True)), fields=['-downloads', '-id'], name='agent_popular_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='agent',
+            index=models.Index(condition=models.Q(('is_published', True)), fields=['category', '-downloads', '-id'], name='agent_category_popular_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='agent',
+            index=models.Index(condition=models.Q(('is_published', True)), fields=['-rating', '-id'], name='agent_rating_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='agent',
+            index=models.Index(condition=models.Q(('is_published', True)), fields=['-created_at', '-id'], name='agent_newest_idx'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+from django.db import migrations
+
+# Must stay identical to agents.services.catalog.SEARCH_DOCUMENT so the planner uses the index
+SEARCH_DOCUMENT = (
+    "setweight(to_tsvector('english', coalesce(name, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(description, '')), 'B')"
+)
+
+
+def create_search_indexes(apps, schema_editor):
+    # Full-text and trigram search are PostgreSQL features; other databases fall back to LIKE
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    schema_editor.execute(
+        f"CREATE INDEX IF NOT EXISTS agent_search_document_idx ON agents_agent USING gin (({SEARCH_DOCUMENT}))"
+    )
+    schema_editor.execute(
+        "CREATE INDEX IF NOT EXISTS agent_name_trgm_idx ON agents_agent USING gin (name gin_trgm_ops)"
+    )
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute("DROP INDEX IF EXISTS agent_search_document_idx")
+    schema_editor.execute("DROP INDEX IF EXISTS agent_name_trgm_idx")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agents', '0003_agent_marketplace'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
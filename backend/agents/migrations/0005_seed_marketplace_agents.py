@@ -0,0 +1,103 @@
+from datetime import datetime, timezone as dt_timezone
+from decimal import Decimal
+
+from django.db import migrations
+
+# Marketplace entries for the built-in agents; the Agent table is the catalog's only source
+AGENTS = {
+    'writer': {
+        'name': 'Writer Agent',
+        'description': 'AI agent specialized in creative writing and content creation',
+        'category': '✍️ Writing',
+        'example_payload': {
+            'prompt': 'Write a short story about...',
+            'max_tokens': 500,
+            'temperature': 0.8
+        }
+    },
+    'code-assistant': {
+        'name': 'Code Assistant',
+        'description': 'AI agent for code generation, debugging, and programming help',
+        'category': '💻 Developer',
+        'example_payload': {
+            'task': 'Create a function that...',
+            'language': 'python',
+            'max_tokens': 1000
+        }
+    },
+    'image-generator': {
+        'name': 'Image Generator',
+        'description': 'Create stunning AI-generated images and artwork',
+        'category': '🎨 Images',
+        'example_payload': {
+            'prompt': 'A beautiful landscape...',
+            'size': '1024x1024',
+            'quality': 'standard'
+        }
+    },
+    'voice-assistant': {
+        'name': 'Voice Assistant',
+        'description': 'Text-to-speech and speech processing capabilities',
+        'category': '🎤 Audio',
+        'example_payload': {
+            'task_type': 'text_to_speech',
+            'text': 'Hello, this is a test...',
+            'voice': 'alloy'
+        }
+    },
+    'chat-bot': {
+        'name': 'Chat Bot',
+        'description': 'Conversational AI for interactive discussions',
+        'category': '💬 Chat',
+        'example_payload': {
+            'prompt': 'Tell me about...',
+            'system_message': 'You are a helpful assistant'
+        }
+    },
+    'translator': {
+        'name': 'Translator',
+        'description': 'Multi-language translation and localization',
+        'category': '🌍 Translation',
+        'example_payload': {
+            'prompt': 'Translate to French: Hello world',
+            'system_message': 'You are a professional translator'
+        }
+    }
+}
+
+
+def seed_agents(apps, schema_editor):
+    Agent = apps.get_model('agents', 'Agent')
+    created_at = datetime(2024, 1, 1, tzinfo=dt_timezone.utc)
+    for slug, info in AGENTS.items():
+        agent, _ = Agent.objects.update_or_create(
+            slug=slug,
+            defaults={
+                'name': info['name'],
+                'description': info['description'],
+                'category': info['category'],
+                'example_payload': info['example_payload'],
+                'price': Decimal('9.99'),
+                'rating': 4.8,
+                'downloads': 1250,
+                'is_published': True,
+            },
+        )
+        # auto_now_add ignores values passed on create
+        Agent.objects.filter(pk=agent.pk).update(created_at=created_at)
+
+
+def unseed_agents(apps, schema_editor):
+    Agent = apps.get_model('agents', 'Agent')
+    Agent.objects.filter(slug__in=list(AGENTS)).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agents', '0004_agent_search_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(seed_agents, unseed_agents),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agents', '0005_seed_marketplace_agents'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='agentjob',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='agentjob',
+            name='quota_subject',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+    ]
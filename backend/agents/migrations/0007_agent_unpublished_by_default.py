@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:35
+
+from django.db import migrations, models
+
+# Slugs AgentFactory can serve when this migration was written; migrations must not import app code
+IMPLEMENTED = ['writer', 'code-assistant', 'image-generator', 'voice-assistant', 'chat-bot', 'translator']
+
+
+def unpublish_uncallable(apps, schema_editor):
+    # 0003 published every existing row, including ones /api/agents/<slug>/call/ cannot serve
+    Agent = apps.get_model('agents', 'Agent')
+    Agent.objects.filter(is_published=True).exclude(slug__in=IMPLEMENTED).update(is_published=False)
+    # The chat bot started keeping conversations after 0005 seeded its example
+    Agent.objects.filter(slug='chat-bot').update(example_payload={
+        'prompt': 'Tell me about...',
+        'system_message': 'You are a helpful assistant',
+        'conversation_id': '(returned by the previous turn; omit to start a conversation)'
+    })
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agents', '0006_agentjob_heartbeat'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='agent',
+            name='is_published',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.RunPython(unpublish_uncallable, migrations.RunPython.noop),
+    ]
@@ -1,3 +1,4 @@
+import uuid
 from django.db import models
 from django.conf import settings
 
@@ -15,6 +16,67 @@ class Agent(models.Model):
     name = models.CharField(max_length=100)
     description = models.TextField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Marketplace listing; slug is the AgentFactory key used in /api/agents/<slug>/call/
+    slug = models.SlugField(max_length=100, unique=True, null=True, blank=True)
+    category = models.CharField(max_length=50, blank=True)
+    supported_models = models.JSONField(default=list, blank=True)
+    example_payload = models.JSONField(default=dict, blank=True)
+    price = models.DecimalField(max_digits=8, decimal_places=2, default=0)
+    rating = models.FloatField(default=0)
+    downloads = models.PositiveIntegerField(default=0)
+    # Listed only once published; rows without a callable slug must stay unlisted
+    is_published = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        # One index per marketplace sort order, matching the keyset pagination
+        # predicates; full-text and trigram indexes are created in migration 0004
+        indexes = [
+            models.Index(fields=['-downloads', '-id'], name='agent_popular_idx', condition=models.Q(is_published=True)),
+            models.Index(fields=['category', '-downloads', '-id'], name='agent_category_popular_idx', condition=models.Q(is_published=True)),
+            models.Index(fields=['-rating', '-id'], name='agent_rating_idx', condition=models.Q(is_published=True)),
+            models.Index(fields=['-created_at', '-id'], name='agent_newest_idx', condition=models.Q(is_published=True)),
+        ]
 
     def __str__(self):
         return self.name
+
+class AgentJob(models.Model):
+    """A queued agent call, picked up by `manage.py run_agent_jobs`"""
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_SUCCEEDED = 'succeeded'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_SUCCEEDED, 'Succeeded'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    agent_name = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, null=True, blank=True, related_name='agent_jobs')
+    workspace = models.ForeignKey('Workspace', on_delete=models.SET_NULL, null=True, blank=True, related_name='agent_jobs')
+    worker = models.CharField(max_length=100, blank=True)
+    # Anonymous allowance the job was charged to ('' for signed-in callers), given back if it fails
+    quota_subject = models.CharField(max_length=100, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    # Bumped by the running worker; a job whose heartbeat stops is requeued
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Workers scan queued jobs oldest first
+            models.Index(fields=['status', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.agent_name} job {self.id} ({self.status})"
@@ -0,0 +1,268 @@
+import base64
+import binascii
+import logging
+import os
+import re
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Any, Optional, Tuple
+
+import requests
+from django.conf import settings
+
+from .cache import canonical_key
+from .transport import get_transport
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'ENABLED': True,
+    'DIRECTORY': None,                  # required when enabled; files are named <sha256>.<format>
+    'MAX_BYTES': 512 * 1024 * 1024,     # least recently used files are deleted above this
+    'MAX_FILE_BYTES': 50 * 1024 * 1024,
+    'URL_PREFIX': '/api/agents/audio/',
+    'DOWNLOAD_TIMEOUT': 30,
+    'CHUNK_SIZE': 64 * 1024,
+    'SENDFILE_HEADER': None,            # e.g. 'X-Accel-Redirect' to let nginx serve the file
+    'SENDFILE_PREFIX': '/protected-audio/',
+    'CACHE_CONTROL': 'public, max-age=31536000, immutable',
+}
+
+CONTENT_TYPES = {
+    'mp3': 'audio/mpeg',
+    'opus': 'audio/ogg',
+    'aac': 'audio/aac',
+    'flac': 'audio/flac',
+    'wav': 'audio/wav',
+    'pcm': 'audio/L16',
+}
+
+FILENAME = re.compile(r'^([0-9a-f]{64})\.([a-z0-9]+)$')
+
+
+def get_config() -> Dict[str, Any]:
+    return {**DEFAULTS, **getattr(settings, 'AGENT_AUDIO_CACHE', {})}
+
+
+RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class RangeNotSatisfiable(ValueError):
+    """The Range header lies outside the file"""
+
+
+def byte_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """Inclusive (start, end) for a single-range 'bytes=' header, None to send the whole file.
+
+    Multi-range and malformed headers are ignored, as RFC 9110 allows.
+    """
+    match = RANGE.match(header.strip())
+    if not match or not any(match.groups()):
+        return None
+    first, last = match.groups()
+    if not first:
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start, end = int(first), min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise RangeNotSatisfiable(f"Range {header} is outside {size} bytes")
+    return start, end
+
+
+class FileSlice:
+    """Read-only view of `length` bytes of an open file, starting at its current position"""
+
+    def __init__(self, file, length: int):
+        self._file = file
+        self._remaining = length
+
+    def read(self, size: int = -1) -> bytes:
+        if self._remaining <= 0:
+            return b''
+        size = self._remaining if size < 0 else min(size, self._remaining)
+        data = self._file.read(size)
+        self._remaining -= len(data)
+        return data
+
+    def close(self):
+        self._file.close()
+
+
+class AudioCache:
+    """Generated speech on local disk, keyed by everything that determines it.
+
+    Every process keeps its own LRU index of the directory (rebuilt from file
+    modification times on start, and touched on every hit), so the size bound
+    holds per process. Files another process stored are adopted into the
+    index on first use; a file another process evicted is simply a miss.
+    """
+
+    def __init__(self, config: Dict[str, Any]):
+        self.config = config
+        self.directory = Path(config['DIRECTORY'])
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._files: 'OrderedDict[str, int]' = OrderedDict()
+        self._total = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stored = 0
+        self.evictions = 0
+        self._load()
+
+    def _load(self):
+        entries = []
+        for path in self.directory.iterdir():
+            if FILENAME.match(path.name):
+                stat = path.stat()
+                entries.append((stat.st_mtime, path.name, stat.st_size))
+        for _, name, size in sorted(entries):
+            self._files[name] = size
+            self._total += size
+        self._evict()
+
+    @staticmethod
+    def key_for(data: Dict[str, Any]) -> str:
+        """Key for a speech request as built by BytezAudioAgent._speech_data"""
+        return canonical_key('text-to-speech', {
+            'text': str(data['input']).strip(),
+            'voice': data['voice'],
+            'model': data['model'],
+            'format': data['response_format'],
+            'speed': float(data['speed']),
+        })
+
+    def url_for(self, filename: str) -> str:
+        return f"{self.config['URL_PREFIX']}{filename}"
+
+    def path(self, filename: str) -> Optional[Path]:
+        """Local file for a cached name (marking it recently used), or None"""
+        if not FILENAME.match(filename):
+            return None
+        path = self.directory / filename
+        with self._lock:
+            if filename not in self._files:
+                # Stored by another process since this one scanned the directory
+                try:
+                    size = path.stat().st_size
+                except FileNotFoundError:
+                    return None
+                self._files[filename] = size
+                self._total += size
+                self._evict()
+                if filename not in self._files:
+                    return None
+            elif not path.exists():
+                self._total -= self._files.pop(filename)
+                return None
+            self._files.move_to_end(filename)
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return path
+
+    def lookup(self, key: str, audio_format: str) -> Optional[str]:
+        """URL of cached audio for a request key, or None"""
+        filename = f"{key}.{audio_format}"
+        found = self.path(filename) is not None
+        with self._lock:
+            if found:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return self.url_for(filename) if found else None
+
+    def store(self, key: str, audio_format: str, source: str) -> Optional[str]:
+        """Copy provider audio (URL or data: URI) into the cache; returns the local URL or None (blocking)"""
+        filename = f"{key}.{audio_format}"
+        if not FILENAME.match(filename):
+            return None
+        spool = tempfile.NamedTemporaryFile(delete=False, dir=self.directory, suffix='.part')
+        try:
+            with spool:
+                size = self._write(spool, source)
+            if size is None:
+                os.remove(spool.name)
+                return None
+            os.replace(spool.name, self.directory / filename)
+        except (OSError, requests.exceptions.RequestException) as e:
+            logger.warning(f"Could not cache generated audio: {e}")
+            if os.path.exists(spool.name):
+                os.remove(spool.name)
+            return None
+
+        with self._lock:
+            self._total += size - self._files.pop(filename, 0)
+            self._files[filename] = size
+            self.stored += 1
+            self._evict()
+        return self.url_for(filename)
+
+    def _write(self, spool, source: str) -> Optional[int]:
+        max_bytes = self.config['MAX_FILE_BYTES']
+        if source.startswith('data:'):
+            try:
+                data = base64.b64decode(source.partition(',')[2], validate=True)
+            except (binascii.Error, ValueError):
+                return None
+            if len(data) > max_bytes:
+                return None
+            spool.write(data)
+            return len(data)
+        if not source.startswith(('http://', 'https://')):
+            return None
+
+        size = 0
+        response = get_transport().request('GET', source, stream=True, timeout=self.config['DOWNLOAD_TIMEOUT'])
+        try:
+            response.raise_for_status()
+            for chunk in response.iter_content(self.config['CHUNK_SIZE']):
+                size += len(chunk)
+                if size > max_bytes:
+                    return None
+                spool.write(chunk)
+        finally:
+            response.close()
+        return size or None
+
+    def _evict(self):
+        # Caller holds the lock (or runs before the cache is shared)
+        while self._total > self.config['MAX_BYTES'] and self._files:
+            filename, size = self._files.popitem(last=False)
+            self._total -= size
+            self.evictions += 1
+            try:
+                os.remove(self.directory / filename)
+            except FileNotFoundError:
+                pass
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'files': len(self._files),
+                'bytes': self._total,
+                'hits': self.hits,
+                'misses': self.misses,
+                'stored': self.stored,
+                'evictions': self.evictions,
+            }
+
+
+_audio_cache = None
+_audio_cache_lock = threading.Lock()
+
+
+def get_audio_cache() -> Optional[AudioCache]:
+    """The process-wide audio cache, or None when disabled"""
+    global _audio_cache
+    if _audio_cache is None:
+        config = get_config()
+        if not config['ENABLED'] or not config['DIRECTORY']:
+            return None
+        with _audio_cache_lock:
+            if _audio_cache is None:
+                _audio_cache = AudioCache(config)
+    return _audio_cache
@@ -1,12 +1,70 @@
 from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
 import requests
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, Callable
+from django.conf import settings
+import functools
 import logging
 import time
+from .transport import get_transport, HTTPX_AVAILABLE
+from .limiter import get_limiter, ConcurrencyLimitExceeded
+from .resilience import get_policy, CircuitOpenError
+from .uploads import MultipartBody, SpooledUpload, get_config as get_upload_config
+
+if HTTPX_AVAILABLE:
+    import httpx
 
 logger = logging.getLogger(__name__)
 
+_blocking_executor = None
+
+
+def _get_blocking_executor() -> ThreadPoolExecutor:
+    """Shared pool for blocking provider calls made from async code.
+
+    The event loop's default executor is capped at a few dozen threads, which
+    would limit how many generations one ASGI process can keep in flight.
+    """
+    global _blocking_executor
+    if _blocking_executor is None:
+        _blocking_executor = ThreadPoolExecutor(
+            max_workers=getattr(settings, 'AGENT_BLOCKING_WORKERS', 256),
+            thread_name_prefix='agent-blocking'
+        )
+    return _blocking_executor
+
+
+async def run_blocking(func: Callable, *args, **kwargs):
+    """Run a blocking callable without stalling the event loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_blocking_executor(), functools.partial(func, *args, **kwargs))
+
+
+async def acquire_slot(limit) -> float:
+    """Await a provider concurrency slot without leaking it when the waiting task is cancelled.
+
+    The blocking acquire keeps running in its thread after a cancellation
+    (client disconnect, losing hedge), so the slot it eventually gets is
+    handed straight back.
+    """
+    loop = asyncio.get_running_loop()
+    future = loop.run_in_executor(_get_blocking_executor(), limit.acquire)
+    try:
+        return await asyncio.shield(future)
+    except asyncio.CancelledError:
+        future.add_done_callback(lambda f: f.cancelled() or f.exception() or limit.release('neutral'))
+        raise
+
+
 class BaseAgent(ABC):
+    supports_streaming = False
+    cacheable = False
+    # Identical concurrent calls may share one provider request (agents/services/singleflight.py)
+    coalescable = True
+    # Overrides for agents/services/resilience.py DEFAULTS (RETRIES, HEDGE, ...)
+    resilience: Dict[str, Any] = {}
+    
     def __init__(self, api_key: str, base_url: str):
         self.api_key = api_key
         self.base_url = base_url
@@ -22,23 +80,65 @@ class BaseAgent(ABC):
     def process(self, payload: Dict[str, Any]) -> Dict[str, Any]:
         """Process the request and return response"""
         pass
+
+    async def aprocess(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """Async entry point. Agents without a native async path run process() in a worker thread"""
+        return await run_blocking(self.process, payload)
     
-    def _make_request(self, endpoint: str, data: Dict[str, Any], method: str = 'POST', timeout: int = 30) -> Dict[str, Any]:
-        """Common request method with timeout"""
+    @staticmethod
+    def _error_of(result: Any) -> Any:
+        return result.get('error') if isinstance(result, dict) else None
+    
+    def _make_request(self, endpoint: str, data: Dict[str, Any], method: str = 'POST', timeout: int = 30,
+                      upload: Optional[SpooledUpload] = None) -> Dict[str, Any]:
+        """Common request method with timeout, retries and circuit breaking.
+
+        With `upload`, data is sent as multipart form fields and the spooled
+        file is streamed from disk as the `file` part.
+        """
+        url = f"{self.base_url}/{endpoint}"
+        try:
+            return get_policy(self).call(url, lambda: self._send_request(endpoint, data, method, timeout, upload), self._error_of)
+        except (CircuitOpenError, ConcurrencyLimitExceeded) as e:
+            return {"error": str(e)}
+    
+    def _multipart(self, data: Dict[str, Any], upload: SpooledUpload):
+        """(body, headers) for one attempt; each retry re-reads the file from the start"""
+        body = MultipartBody(data, 'file', upload, get_upload_config()['CHUNK_SIZE'])
+        headers = {**self.headers, 'Content-Type': body.content_type, 'Content-Length': str(len(body))}
+        return body, headers
+    
+    def _send_request(self, endpoint: str, data: Dict[str, Any], method: str, timeout: int,
+                      upload: Optional[SpooledUpload] = None) -> Dict[str, Any]:
+        """One provider request; failures come back as {"error": ...}.
+
+        ConcurrencyLimitExceeded is raised instead, so the resilience policy
+        neither retries local saturation nor counts it against the provider.
+        """
         try:
             url = f"{self.base_url}/{endpoint}"
             logger.info(f"Making {method} request to {url}")
             
-            if method.upper() == 'POST':
-                response = requests.post(url, json=data, headers=self.headers, timeout=timeout)
-            elif method.upper() == 'GET':
-                response = requests.get(url, params=data, headers=self.headers, timeout=timeout)
-            else:
-                raise ValueError(f"Unsupported HTTP method: {method}")
+            # Provider concurrency slot, then the shared keep-alive pool;
+            # timeout is the read timeout, connect timeout comes from settings
+            with get_limiter(self.api_key, data.get('model', endpoint)).slot() as slot:
+                if method.upper() == 'POST' and upload is not None:
+                    body, headers = self._multipart(data, upload)
+                    response = get_transport().request('POST', url, data=body, headers=headers, timeout=timeout)
+                elif method.upper() == 'POST':
+                    response = get_transport().request('POST', url, json=data, headers=self.headers, timeout=timeout)
+                elif method.upper() == 'GET':
+                    response = get_transport().request('GET', url, params=data, headers=self.headers, timeout=timeout)
+                else:
+                    raise ValueError(f"Unsupported HTTP method: {method}")
+                slot['overloaded'] = response.status_code in (429, 503)
             
             response.raise_for_status()
             return response.json()
             
+        except ConcurrencyLimitExceeded:
+            # Our own queue is full, not a provider fault: no retry, no breaker failure
+            raise
         except requests.exceptions.Timeout:
             return {"error": "Request timeout. Please try again with a smaller request."}
         except requests.exceptions.RequestException as e:
@@ -48,6 +148,61 @@ class BaseAgent(ABC):
             logger.error(f"Unexpected error: {str(e)}")
             return {"error": f"Unexpected error: {str(e)}"}
 
+    async def _amake_request(self, endpoint: str, data: Dict[str, Any], method: str = 'POST', timeout: int = 30,
+                             upload: Optional[SpooledUpload] = None) -> Dict[str, Any]:
+        """Non-blocking counterpart of _make_request"""
+        if not get_transport().async_pooling():
+            # No httpx, or a throwaway loop (WSGI): the sync keep-alive pool in a worker thread
+            return await run_blocking(self._make_request, endpoint, data, method, timeout, upload)
+
+        url = f"{self.base_url}/{endpoint}"
+        try:
+            return await get_policy(self).acall(url, lambda: self._asend_request(endpoint, data, method, timeout, upload), self._error_of)
+        except (CircuitOpenError, ConcurrencyLimitExceeded) as e:
+            return {"error": str(e)}
+
+    async def _asend_request(self, endpoint: str, data: Dict[str, Any], method: str, timeout: int,
+                             upload: Optional[SpooledUpload] = None) -> Dict[str, Any]:
+        try:
+            url = f"{self.base_url}/{endpoint}"
+            logger.info(f"Making async {method} request to {url}")
+
+            limit = get_limiter(self.api_key, data.get('model', endpoint))
+            await acquire_slot(limit)
+            outcome = 'neutral'
+            try:
+                if method.upper() == 'POST' and upload is not None:
+                    body, headers = self._multipart(data, upload)
+                    response = await get_transport().arequest('POST', url, content=body.aiter(), headers=headers, timeout=timeout)
+                elif method.upper() == 'POST':
+                    response = await get_transport().arequest('POST', url, json=data, headers=self.headers, timeout=timeout)
+                elif method.upper() == 'GET':
+                    response = await get_transport().arequest('GET', url, params=data, headers=self.headers, timeout=timeout)
+                else:
+                    raise ValueError(f"Unsupported HTTP method: {method}")
+                outcome = 'overload' if response.status_code in (429, 503) else 'ok'
+            finally:
+                limit.release(outcome)
+
+            response.raise_for_status()
+            return response.json()
+
+        except ConcurrencyLimitExceeded:
+            # Our own queue is full, not a provider fault: no retry, no breaker failure
+            raise
+        except httpx.TimeoutException:
+            return {"error": "Request timeout. Please try again with a smaller request."}
+        except httpx.HTTPError as e:
+            logger.error(f"Request failed: {str(e)}")
+            return {"error": f"Request failed: {str(e)}"}
+        except Exception as e:
+            logger.error(f"Unexpected error: {str(e)}")
+            return {"error": f"Unexpected error: {str(e)}"}
+
+    def cache_key_parts(self, payload: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Inputs that fully determine the response (model, prompt, params), or None if unknown"""
+        return None
+
     def validate_payload(self, payload: Dict[str, Any], required_fields: list) -> Optional[str]:
         """Validate required fields in payload"""
         for field in required_fields:
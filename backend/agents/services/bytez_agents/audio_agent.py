@@ -1,4 +1,6 @@
-from ..base_agent import BaseAgent
+from ..audio_cache import get_audio_cache
+from ..base_agent import BaseAgent, run_blocking
+from ..uploads import SpooledUpload, get_config as get_upload_config
 from typing import Dict, Any
 from django.conf import settings
 import base64
@@ -21,63 +23,142 @@ class BytezAudioAgent(BaseAgent):
         else:
             return {"error": f"Unknown task type: {task_type}"}
     
+    async def aprocess(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """Process audio request without blocking the event loop"""
+        task_type = payload.get('task_type', 'text_to_speech')
+        
+        if task_type == 'text_to_speech':
+            return await self.atext_to_speech(payload)
+        elif task_type == 'speech_to_text':
+            return await self.aspeech_to_text(payload)
+        else:
+            return {"error": f"Unknown task type: {task_type}"}
+    
     def text_to_speech(self, payload: Dict[str, Any]) -> Dict[str, Any]:
         """Convert text to speech"""
         error = self.validate_payload(payload, ['text'])
         if error:
             return {"error": error}
         
-        text = payload.get('text', '')
-        voice = payload.get('voice', 'alloy')
-        model = payload.get('model', 'tts-1')
+        data = self._speech_data(payload)
+        cache, key = self._audio_cache_key(data)
+        if key:
+            url = cache.lookup(key, data['response_format'])
+            if url:
+                return self._speech_response({'audio': url}, data, cached=True)
+        
+        result = self._make_request('audio/speech', data)
+        if key and 'audio' in result:
+            url = cache.store(key, data['response_format'], str(result['audio']))
+            if url:
+                result = {**result, 'audio': url}
+        return self._speech_response(result, data)
+    
+    async def atext_to_speech(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """Async variant of text_to_speech"""
+        error = self.validate_payload(payload, ['text'])
+        if error:
+            return {"error": error}
+        
+        data = self._speech_data(payload)
+        cache, key = self._audio_cache_key(data)
+        if key:
+            url = cache.lookup(key, data['response_format'])
+            if url:
+                return self._speech_response({'audio': url}, data, cached=True)
+        
+        result = await self._amake_request('audio/speech', data)
+        if key and 'audio' in result:
+            url = await run_blocking(cache.store, key, data['response_format'], str(result['audio']))
+            if url:
+                result = {**result, 'audio': url}
+        return self._speech_response(result, data)
+    
+    def speech_to_text(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """Convert speech to text"""
+        error = self.validate_payload(payload, ['audio'])
+        if error:
+            return {"error": error}
         
-        data = {
-            'model': model,
-            'input': text,
-            'voice': voice,
+        data = self._transcription_data(payload)
+        result = self._make_request('audio/transcriptions', data)
+        return self._transcription_response(result, data)
+    
+    async def aspeech_to_text(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """Async variant of speech_to_text"""
+        error = self.validate_payload(payload, ['audio'])
+        if error:
+            return {"error": error}
+        
+        data = self._transcription_data(payload)
+        result = await self._amake_request('audio/transcriptions', data)
+        return self._transcription_response(result, data)
+    
+    def transcribe_file(self, upload: SpooledUpload) -> Dict[str, Any]:
+        """Speech to text for a spooled upload, streamed to the provider as multipart"""
+        data = self._upload_transcription_data(upload.fields)
+        result = self._make_request('audio/transcriptions', data, timeout=get_upload_config()['TIMEOUT'], upload=upload)
+        return self._transcription_response(result, data)
+    
+    async def atranscribe_file(self, upload: SpooledUpload) -> Dict[str, Any]:
+        """Async variant of transcribe_file"""
+        data = self._upload_transcription_data(upload.fields)
+        result = await self._amake_request('audio/transcriptions', data, timeout=get_upload_config()['TIMEOUT'], upload=upload)
+        return self._transcription_response(result, data)
+    
+    def _upload_transcription_data(self, fields: Dict[str, Any]) -> Dict[str, Any]:
+        data = self._transcription_data(fields)
+        del data['file']
+        return data
+    
+    def _speech_data(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            'model': payload.get('model', 'tts-1'),
+            'input': payload.get('text', ''),
+            'voice': payload.get('voice', 'alloy'),
             'response_format': payload.get('format', 'mp3'),
             'speed': payload.get('speed', 1.0)
         }
-        
-        result = self._make_request('audio/speech', data)
-        
+    
+    def _audio_cache_key(self, data: Dict[str, Any]):
+        """(cache, key) for a speech request, or (None, None) when it cannot be cached"""
+        cache = get_audio_cache()
+        if cache is None:
+            return None, None
+        try:
+            return cache, cache.key_for(data)
+        except (TypeError, ValueError):
+            return None, None
+    
+    def _speech_response(self, result: Dict[str, Any], data: Dict[str, Any], cached: bool = False) -> Dict[str, Any]:
         if 'audio' in result:
             return {
                 'success': True,
                 'audio_url': result['audio'],
-                'text': text,
-                'voice': voice,
-                'model': model
+                'text': data['input'],
+                'voice': data['voice'],
+                'model': data['model'],
+                'cached': cached
             }
         else:
             return result
     
-    def speech_to_text(self, payload: Dict[str, Any]) -> Dict[str, Any]:
-        """Convert speech to text"""
-        error = self.validate_payload(payload, ['audio'])
-        if error:
-            return {"error": error}
-        
-        audio_file = payload.get('audio', '')
-        model = payload.get('model', 'whisper-1')
-        language = payload.get('language', 'en')
-        
-        data = {
-            'file': audio_file,
-            'model': model,
-            'language': language,
+    def _transcription_data(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            'file': payload.get('audio', ''),
+            'model': payload.get('model', 'whisper-1'),
+            'language': payload.get('language', 'en'),
             'response_format': 'json',
             'temperature': payload.get('temperature', 0)
         }
-        
-        result = self._make_request('audio/transcriptions', data)
-        
+    
+    def _transcription_response(self, result: Dict[str, Any], data: Dict[str, Any]) -> Dict[str, Any]:
         if 'text' in result:
             return {
                 'success': True,
                 'text': result['text'],
-                'language': language,
-                'model': model
+                'language': data['language'],
+                'model': data['model']
             }
         else:
             return result
\ No newline at end of file
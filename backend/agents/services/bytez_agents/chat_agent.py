@@ -0,0 +1,133 @@
+from ..base_agent import run_blocking
+from ..conversations import ConversationBusy, get_conversation_store
+from ..prompting import get_prompt_assembler
+from ..router import get_router
+from .text_agent import BytezTextAgent
+from typing import Dict, Any, Optional, Iterator, List, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+class BytezChatAgent(BytezTextAgent):
+    """Multi-turn chat; history lives server-side under the returned conversation_id.
+
+    Clients send only the new message (plus conversation_id after the first
+    turn). The model sees the rolling summary, the last few turns and the
+    message, so a turn costs about the same however long the chat runs.
+    """
+
+    cacheable = False
+    coalescable = False  # replies depend on (and update) the conversation
+
+    def _prompt_parts(self, payload: Dict[str, Any]) -> Tuple[str, str]:
+        system_message = payload.get('system_message', self.default_system_message)
+        # History (summary and recent turns) sits between the system message and the new message
+        return f"{system_message}\n\n{payload.get('_context', '')}User: ", str(payload.get('prompt', ''))
+
+    def _summarize(self, summary: str, turns: List[List[str]], payload: Dict[str, Any]) -> Optional[str]:
+        """New rolling summary from the old one and the turns leaving the window, or None (blocking)"""
+        store = get_conversation_store()
+        model_name = get_router().route(self, payload)[0]
+        prefix = (
+            "Update the summary of this conversation with the new messages. Keep names, facts, decisions "
+            "and open questions; write at most a short paragraph and nothing else.\n\n"
+            f"Summary so far: {summary or '(none)'}\n\nNew messages:\n"
+        )
+        try:
+            assembled = get_prompt_assembler().assemble(
+                model_name, prefix, store.transcript(turns), '\nUpdated summary:',
+                max_new_tokens=store.config['SUMMARY_MAX_TOKENS'], overflow='trim'
+            )
+            result = self._run_model(model_name, assembled.prompt, {
+                "max_new_tokens": assembled.max_new_tokens,
+                "temperature": 0.2,
+            })
+        except Exception as e:
+            logger.warning(f"Conversation summary failed: {e}")
+            return None
+        return self._handle_result(result, payload, model_name).get('output') or None
+
+    def _open(self, payload: Dict[str, Any]) -> Tuple[str, Dict[str, Any], str]:
+        """Lock and load (or start) the conversation, folding old turns into the summary when due (blocking)"""
+        store = get_conversation_store()
+        conversation_id, state, lock = store.open(payload.get('conversation_id'))
+        turns = store.overflow(state)
+        if turns:
+            store.fold(state, turns, self._summarize(state['summary'], turns, payload))
+            # Keep the summary even if the turn itself fails
+            store.save(conversation_id, state)
+        return conversation_id, state, lock
+
+    def _turn_payload(self, payload: Dict[str, Any], state: Dict[str, Any]) -> Dict[str, Any]:
+        return {**payload, '_context': get_conversation_store().context(state)}
+
+    def _close(self, conversation_id: str, state: Dict[str, Any], payload: Dict[str, Any], reply: str):
+        """Record the finished turn (blocking)"""
+        store = get_conversation_store()
+        store.append(state, payload.get('prompt', ''), reply)
+        store.save(conversation_id, state)
+
+    def _with_conversation(self, response: Dict[str, Any], conversation_id: str, state: Dict[str, Any]) -> Dict[str, Any]:
+        return {**response, "conversation_id": conversation_id, "turn": state['count']}
+
+    def _release(self, conversation_id: str, lock: str):
+        get_conversation_store().release(conversation_id, lock)
+
+    def process(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        error = self._check_request(payload)
+        if error:
+            return error
+
+        try:
+            conversation_id, state, lock = self._open(payload)
+        except ConversationBusy as e:
+            return {"error": str(e)}
+        try:
+            response = super().process(self._turn_payload(payload, state))
+            if response.get('error'):
+                return response
+            self._close(conversation_id, state, payload, response['output'])
+            return self._with_conversation(response, conversation_id, state)
+        finally:
+            self._release(conversation_id, lock)
+
+    async def aprocess(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        error = self._check_request(payload)
+        if error:
+            return error
+
+        try:
+            conversation_id, state, lock = await run_blocking(self._open, payload)
+        except ConversationBusy as e:
+            return {"error": str(e)}
+        try:
+            response = await super().aprocess(self._turn_payload(payload, state))
+            if response.get('error'):
+                return response
+            await run_blocking(self._close, conversation_id, state, payload, response['output'])
+            return self._with_conversation(response, conversation_id, state)
+        finally:
+            await run_blocking(self._release, conversation_id, lock)
+
+    def stream(self, payload: Dict[str, Any]) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        error = self._check_request(payload)
+        if error:
+            yield 'error', error
+            return
+
+        try:
+            conversation_id, state, lock = self._open(payload)
+        except ConversationBusy as e:
+            yield 'error', {"error": str(e)}
+            return
+        try:
+            reply = []
+            for event, data in super().stream(self._turn_payload(payload, state)):
+                if event == 'token':
+                    reply.append(data['text'])
+                elif event == 'done':
+                    self._close(conversation_id, state, payload, ''.join(reply))
+                    data = self._with_conversation(data, conversation_id, state)
+                yield event, data
+        finally:
+            self._release(conversation_id, lock)
@@ -1,8 +1,16 @@
-from ..base_agent import BaseAgent
-from typing import Dict, Any
+import asyncio
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from ..base_agent import BaseAgent, run_blocking
+from ..image_store import get_image_store
+from ..limiter import get_limiter
+from typing import Dict, Any, Iterator, List, Tuple
 from django.conf import settings
 
 class BytezImageAgent(BaseAgent):
+    supports_streaming = True
+    # Generations are slow and billed per image: one retry, never hedged
+    resilience = {'RETRIES': 1, 'HEDGE': False}
+    
     def __init__(self):
         super().__init__(
             api_key=getattr(settings, 'BYTEZ_API_KEY', ''),
@@ -11,38 +19,149 @@ class BytezImageAgent(BaseAgent):
     
     def process(self, payload: Dict[str, Any]) -> Dict[str, Any]:
         """Process image generation request"""
-        error = self.validate_payload(payload, ['prompt'])
+        error = self._check_request(payload)
         if error:
             return {"error": error}
         
-        prompt = payload.get('prompt', '')
-        model = payload.get('model', 'dall-e-3')
-        size = payload.get('size', '1024x1024')
-        quality = payload.get('quality', 'standard')
-        style = payload.get('style', 'vivid')
+        data = self._generation_data(payload)
+        return self._mirror(self._combine(list(self._each_image(data)), data))
+    
+    async def aprocess(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """Process image generation request without blocking the event loop"""
+        error = self._check_request(payload)
+        if error:
+            return {"error": error}
         
-        data = {
-            'model': model,
-            'prompt': prompt,
-            'n': payload.get('n', 1),
-            'size': size,
-            'quality': quality,
-            'style': style
-        }
+        data = self._generation_data(payload)
+        results = [item async for item in self._aeach_image(data)]
+        return await run_blocking(self._mirror, self._combine(results, data))
+    
+    def stream(self, payload: Dict[str, Any]) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """Yield (event, data) pairs: 'image' or 'image_failed' per image as it finishes, then 'done' or 'error'"""
+        error = self._check_request(payload)
+        if error:
+            yield 'error', {"error": error}
+            return
         
-        result = self._make_request('images/generations', data)
+        data = self._generation_data(payload)
+        results = []
+        for index, result in self._each_image(data):
+            results.append((index, result))
+            image = self._generation_response(result, data)
+            if image.get('success'):
+                yield 'image', {'index': index, **self._mirror({'success': True, 'images': image['images']})}
+            else:
+                yield 'image_failed', {'index': index, 'error': self._error_of(result) or 'No image returned'}
+        
+        combined = self._mirror(self._combine(results, data))
+        yield ('error' if combined.get('error') else 'done'), combined
+    
+    def _check_request(self, payload: Dict[str, Any]):
+        error = self.validate_payload(payload, ['prompt'])
+        if error:
+            return error
+        n = payload.get('n', 1)
+        if not isinstance(n, int) or isinstance(n, bool) or n < 1:
+            return "Invalid request: 'n' must be a positive integer"
+        # Each image is its own provider call, but the request counts once against the quota
+        max_n = getattr(settings, 'AGENT_IMAGE_MAX_N', 4)
+        if n > max_n:
+            return f"Invalid request: 'n' can be at most {max_n}"
+        return None
+    
+    def _split(self, data: Dict[str, Any]) -> Tuple[List[Dict[str, Any]], int]:
+        """One single-image request per image and how many may run at once.
         
+        Parallelism stays within the provider concurrency limit for the model,
+        so one large request cannot take every slot.
+        """
+        requests = [{**data, 'n': 1} for _ in range(data['n'])]
+        budget = int(get_limiter(self.api_key, data['model']).limit)
+        parallelism = max(1, min(len(requests), budget, getattr(settings, 'AGENT_IMAGE_PARALLELISM', 4)))
+        return requests, parallelism
+    
+    def _each_image(self, data: Dict[str, Any]) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        """(index, provider result) for every requested image, in completion order"""
+        requests, parallelism = self._split(data)
+        if len(requests) == 1:
+            yield 0, self._make_request('images/generations', requests[0])
+            return
+        
+        pool = ThreadPoolExecutor(max_workers=parallelism, thread_name_prefix='image-split')
+        futures = {pool.submit(self._make_request, 'images/generations', request): index
+                   for index, request in enumerate(requests)}
+        try:
+            for future in as_completed(futures):
+                yield futures[future], future.result()
+        finally:
+            # Stops queued sub-requests if the caller stops early
+            pool.shutdown(wait=False, cancel_futures=True)
+    
+    async def _aeach_image(self, data: Dict[str, Any]):
+        """Async counterpart of _each_image"""
+        requests, parallelism = self._split(data)
+        semaphore = asyncio.Semaphore(parallelism)
+        
+        async def generate(index, request):
+            async with semaphore:
+                return index, await self._amake_request('images/generations', request)
+        
+        tasks = [asyncio.ensure_future(generate(index, request)) for index, request in enumerate(requests)]
+        try:
+            for finished in asyncio.as_completed(tasks):
+                yield await finished
+        finally:
+            for task in tasks:
+                task.cancel()
+    
+    def _combine(self, results: List[Tuple[int, Dict[str, Any]]], data: Dict[str, Any]) -> Dict[str, Any]:
+        """Merge single-image results in request order; failed images are listed, not fatal"""
+        images, errors = [], []
+        for index, result in sorted(results, key=lambda item: item[0]):
+            response = self._generation_response(result, data)
+            if response.get('success'):
+                images.extend(response['images'])
+            else:
+                errors.append({'index': index, 'error': self._error_of(result) or 'No image returned'})
+        if not images:
+            return {"error": errors[0]['error'] if errors else 'No image returned'}
+        
+        combined = self._generation_response({'data': [{'url': url} for url in images]}, data)
+        if errors:
+            combined.update(partial=True, errors=errors)
+        return combined
+    
+    def _generation_data(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """Build the provider request body for an image generation"""
+        return {
+            'model': payload.get('model', 'dall-e-3'),
+            'prompt': payload.get('prompt', ''),
+            'n': payload.get('n', 1),
+            'size': payload.get('size', '1024x1024'),
+            'quality': payload.get('quality', 'standard'),
+            'style': payload.get('style', 'vivid')
+        }
+    
+    def _generation_response(self, result: Dict[str, Any], data: Dict[str, Any]) -> Dict[str, Any]:
+        """Shape the provider reply for the API"""
         if 'data' in result and len(result['data']) > 0:
             return {
                 'success': True,
                 'images': [img['url'] for img in result['data']],
-                'prompt': prompt,
-                'model': model,
-                'size': size
+                'prompt': data['prompt'],
+                'model': data['model'],
+                'size': data['size']
             }
         else:
             return result
     
+    def _mirror(self, response: Dict[str, Any]) -> Dict[str, Any]:
+        """Add local copies ('assets') of the generated images; they are filled in the background"""
+        store = get_image_store()
+        if store is None or not response.get('success'):
+            return response
+        return {**response, 'assets': store.mirror(response['images'])}
+    
     def edit_image(self, payload: Dict[str, Any]) -> Dict[str, Any]:
         """Edit an existing image"""
         error = self.validate_payload(payload, ['image', 'prompt'])
@@ -60,10 +179,10 @@ class BytezImageAgent(BaseAgent):
         result = self._make_request('images/edits', data)
         
         if 'data' in result and len(result['data']) > 0:
-            return {
+            return self._mirror({
                 'success': True,
                 'images': [img['url'] for img in result['data']],
                 'prompt': payload['prompt']
-            }
+            })
         else:
             return result
\ No newline at end of file
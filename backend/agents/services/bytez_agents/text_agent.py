@@ -1,5 +1,11 @@
-from ..base_agent import BaseAgent
-from typing import Dict, Any
+from abc import abstractmethod
+from ..base_agent import BaseAgent, run_blocking
+from ..lru import LRUCache
+from ..limiter import get_limiter, is_overload, ConcurrencyLimitExceeded
+from ..resilience import get_policy, CircuitOpenError
+from ..router import get_router
+from ..prompting import get_prompt_assembler, PromptTooLong
+from typing import Dict, Any, Optional, Iterator, Tuple
 from django.conf import settings
 import logging
 import re
@@ -14,13 +20,93 @@ except ImportError:
 
 logger = logging.getLogger(__name__)
 
-class BytezTextAgent(BaseAgent):
+class ThinkTagFilter:
+    """Incremental version of _clean_output for streamed chunks.
+    
+    Drops <think>...</think> spans even when a tag is split across chunks and
+    strips surrounding whitespace, holding back only a possible partial tag or
+    trailing whitespace instead of the full text.
+    """
+    
+    OPEN = '<think>'
+    CLOSE = '</think>'
+    
+    def __init__(self):
+        self._pending = ''
+        self._whitespace = ''
+        self._inside = False
+        self._started = False
+    
+    @staticmethod
+    def _partial_tag(text: str, tag: str) -> int:
+        """Length of the longest suffix of text that is a prefix of tag"""
+        for size in range(min(len(tag) - 1, len(text)), 0, -1):
+            if text.endswith(tag[:size]):
+                return size
+        return 0
+    
+    def feed(self, chunk: str) -> str:
+        text = self._pending + chunk
+        self._pending = ''
+        visible = []
+        
+        while text:
+            if self._inside:
+                end = text.find(self.CLOSE)
+                if end < 0:
+                    keep = self._partial_tag(text, self.CLOSE)
+                    self._pending = text[len(text) - keep:] if keep else ''
+                    break
+                text = text[end + len(self.CLOSE):]
+                self._inside = False
+            else:
+                start = text.find(self.OPEN)
+                if start < 0:
+                    keep = self._partial_tag(text, self.OPEN)
+                    visible.append(text[:len(text) - keep])
+                    self._pending = text[len(text) - keep:] if keep else ''
+                    break
+                visible.append(text[:start])
+                text = text[start + len(self.OPEN):]
+                self._inside = True
+        
+        return self._emit(''.join(visible))
+    
+    def _emit(self, text: str) -> str:
+        if not self._started:
+            text = text.lstrip()
+            if not text:
+                return ''
+            self._started = True
+        text = self._whitespace + text
+        stripped = text.rstrip()
+        self._whitespace = text[len(stripped):]
+        return stripped
+    
+    def finish(self) -> str:
+        """Flush text held back as a possible tag; an unclosed <think> is dropped"""
+        if self._inside or not self._pending:
+            return ''
+        pending, self._pending = self._pending, ''
+        return self._emit(pending)
+
+class BytezSDKAgent(BaseAgent):
+    """Base for agents that run models through the Bytez SDK"""
+    
+    required_fields = []
+    default_model = 'google/gemma-2b'  # Free model
+    supports_streaming = True
+    cacheable = True
+    
     def __init__(self):
         api_key = getattr(settings, 'BYTEZ_API_KEY', '')
         super().__init__(
             api_key=api_key,
             base_url="https://api.bytez.com"
         )
+        # Model handles are reused across requests; the cache lives and dies with
+        # this instance, so a rotated API key (new instance) starts clean
+        self._models = LRUCache(getattr(settings, 'AGENT_MODEL_HANDLE_CACHE_SIZE', 32))
         
         if not BYTEZ_AVAILABLE:
             logger.error("Bytez SDK not installed. Run: pip install bytez")
@@ -41,10 +127,9 @@ class BytezTextAgent(BaseAgent):
         
         return cleaned.strip()
     
-    def process(self, payload: Dict[str, Any]) -> Dict[str, Any]:
-        """Process text generation request using Bytez SDK"""
-        # Validate required fields
-        error = self.validate_payload(payload, ['prompt'])
+    def _check_request(self, payload: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Return an error response if the request cannot be sent"""
+        error = self.validate_payload(payload, self.required_fields)
         if error:
             return {"error": error}
         
@@ -55,155 +140,276 @@ class BytezTextAgent(BaseAgent):
         if not self.api_key:
             return {"error": "Bytez API key not configured. Please check your environment variables."}
         
-        try:
-            # Use a model that works with free tier
-            model_name = payload.get('model', 'google/gemma-2b')  # Free model
+        return None
+    
+    @abstractmethod
+    def _prompt_parts(self, payload: Dict[str, Any]) -> Tuple[str, str]:
+        """(instructions, user input); only the user input is trimmed to fit a model"""
+        pass
+    
+    def _build_prompt(self, payload: Dict[str, Any]) -> str:
+        return ''.join(self._prompt_parts(payload))
+    
+    @abstractmethod
+    def _generation_params(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """Sampling parameters for the model call"""
+        pass
+    
+    @abstractmethod
+    def _format_output(self, output: str, payload: Dict[str, Any], model_name: str) -> Dict[str, Any]:
+        """Response body for a finished generation"""
+        pass
+    
+    def _prepare(self, payload: Dict[str, Any], model_name: str) -> Tuple[str, Dict[str, Any]]:
+        """Prompt and params sized to the model's context window; raises PromptTooLong"""
+        params = self._generation_params(payload)
+        prefix, body = self._prompt_parts(payload)
+        assembled = get_prompt_assembler().assemble(
+            model_name, prefix, body, max_new_tokens=params['max_new_tokens'], overflow=payload.get('overflow')
+        )
+        return assembled.prompt, {**params, 'max_new_tokens': assembled.max_new_tokens}
+    
+    def _get_model(self, model_name: str):
+        model = self._models.get(model_name)
+        if model is None:
             model = self.sdk.model(model_name)
-            
-            # Format messages properly with better system message
-            prompt = payload.get('prompt', '')
-            system_message = payload.get('system_message', 'You are a helpful assistant. Provide direct, concise responses without using thinking tags or internal monologue. Just give the final answer.')
-            
-            # Simplified format for models that don't support complex chat templates
-            full_prompt = f"{system_message}\n\nUser: {prompt}"
-            
-            # Add parameters to optimize for speed
-            # Reduce max_tokens for faster responses
-            max_tokens = min(payload.get('max_tokens', 500), 1000)  # Cap at 1000 tokens
-            
-            # Make the request with optimized parameters (without timeout)
-            result = model.run(full_prompt, {
-                "max_new_tokens": max_tokens,
-                "temperature": payload.get('temperature', 0.7)
-            })
-            
-            # Handle response
-            if result.error:
-                return {"error": result.error}
-            elif result.output and isinstance(result.output, dict) and 'content' in result.output:
-                raw_output = result.output['content']
-                cleaned_output = self._clean_output(raw_output)
-                return {
-                    "success": True,
-                    "output": cleaned_output,
-                    "response": cleaned_output,  # For frontend compatibility
-                    "content": cleaned_output,   # For frontend compatibility
-                    "model": model_name,
-                    "provider": "Bytez"
-                }
-            elif result.output:
-                raw_output = str(result.output)
-                cleaned_output = self._clean_output(raw_output)
-                return {
-                    "success": True,
-                    "output": cleaned_output,
-                    "response": cleaned_output,
-                    "content": cleaned_output,
-                    "model": model_name,
-                    "provider": "Bytez"
-                }
-            else:
-                return {"error": "No output received from model"}
-                
-        except Exception as e:
-            logger.error(f"Bytez API error: {str(e)}")
-            return {"error": f"Bytez API error: {str(e)}"}
+            self._models.set(model_name, model)
+        return model
+    
+    def cache_key_parts(self, payload: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        if self.validate_payload(payload, self.required_fields):
+            return None
+        # Without a pinned model the router may pick any model in the pool,
+        # so the key names the pool and routing preference instead of one model
+        served_by = {'model': payload['model']} if payload.get('model') else get_router().routing_key(self, payload)
+        return {
+            **served_by,
+            'prompt': self._build_prompt(payload),
+            'params': self._generation_params(payload),
+        }
+    
+    def _run_model(self, model_name: str, prompt: str, params: Dict[str, Any]):
+        """Blocking SDK call with retries and circuit breaking, queued behind the provider concurrency limiter.
 
-class BytezCodeAgent(BaseAgent):
-    def __init__(self):
-        api_key = getattr(settings, 'BYTEZ_API_KEY', '')
-        super().__init__(
-            api_key=api_key,
-            base_url="https://api.bytez.com"
-        )
+        Raises ConcurrencyLimitExceeded (never retried or counted by the breaker) when no slot frees up.
+        """
+        def attempt():
+            with get_limiter(self.api_key, model_name).slot() as slot:
+                started = time.monotonic()
+                try:
+                    result = self._get_model(model_name).run(prompt, params)
+                except Exception:
+                    get_router().observe(model_name, time.monotonic() - started, True)
+                    raise
+                get_router().observe(model_name, time.monotonic() - started, bool(result.error))
+                slot['overloaded'] = is_overload(result.error)
+            return result
         
-        if not BYTEZ_AVAILABLE:
-            logger.error("Bytez SDK not installed. Run: pip install bytez")
-        elif not api_key:
-            logger.warning("BYTEZ_API_KEY not found, check your .env file")
-        else:
-            self.sdk = Bytez(api_key)
+        return get_policy(self).call(f"bytez:{model_name}", attempt, lambda result: result.error)
     
-    def _clean_output(self, text: str) -> str:
-        """Remove <think> tags and clean up the output"""
-        if not text:
-            return ""
-        
-        # Remove <think>...</think> blocks completely
-        cleaned = re.sub(r'<think>.*?</think>', '', text, flags=re.DOTALL)
-        # Also remove incomplete <think> tags at the end
-        cleaned = re.sub(r'<think>.*$', '', cleaned, flags=re.DOTALL)
+    def _handle_result(self, result, payload: Dict[str, Any], model_name: str) -> Dict[str, Any]:
+        if result.error:
+            return {"error": result.error}
+        elif result.output and isinstance(result.output, dict) and 'content' in result.output:
+            raw_output = result.output['content']
+        elif result.output:
+            raw_output = str(result.output)
+        else:
+            return {"error": "No output received from model"}
         
-        return cleaned.strip()
+        return self._format_output(self._clean_output(raw_output), payload, model_name)
     
     def process(self, payload: Dict[str, Any]) -> Dict[str, Any]:
-        """Process code generation request using Bytez SDK"""
-        error = self.validate_payload(payload, ['task'])
+        """Process generation request using Bytez SDK"""
+        error = self._check_request(payload)
         if error:
-            return {"error": error}
-        
-        if not BYTEZ_AVAILABLE:
-            return {"error": "Bytez SDK not installed. Please run: pip install bytez"}
+            return error
         
-        if not self.api_key:
-            return {"error": "Bytez API key not configured. Please check your environment variables."}
+        try:
+            # Routed candidates in order; the next one is tried when a model fails
+            response = None
+            for model_name in get_router().route(self, payload):
+                try:
+                    prompt, params = self._prepare(payload, model_name)
+                    result = self._run_model(model_name, prompt, params)
+                except (CircuitOpenError, ConcurrencyLimitExceeded, PromptTooLong) as e:
+                    response = {"error": str(e)}
+                    continue
+                response = self._handle_result(result, payload, model_name)
+                if not response.get('error'):
+                    break
+            return response
+                
+        except Exception as e:
+            logger.error(f"Bytez API error: {str(e)}")
+            return {"error": f"Bytez API error: {str(e)}"}
+    
+    async def aprocess(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """Process generation request, offloading only the blocking SDK call"""
+        error = self._check_request(payload)
+        if error:
+            return error
         
         try:
-            # Use a model that works with free tier
-            model_name = payload.get('model', 'google/gemma-2b')  # Free model
-            model = self.sdk.model(model_name)
-            
-            # Format code generation prompt
-            task = payload.get('task', '')
-            language = payload.get('language', 'python')
-            
-            # Simplified format for models that don't support complex chat templates
-            full_prompt = f"You are a helpful coding assistant. Generate clean {language} code without explanations or thinking process. Just provide the code directly. Keep responses concise and efficient.\n\nTask: {task}"
-            
-            # Add parameters to optimize for speed
-            # Reduce max_tokens for faster responses
-            max_tokens = min(payload.get('max_tokens', 1000), 2000)  # Cap at 2000 tokens
-            
-            # Make the request with optimized parameters (without timeout)
-            result = model.run(full_prompt, {
-                "max_new_tokens": max_tokens,
-                "temperature": payload.get('temperature', 0.1)  # Lower temperature for code
-            })
-            
-            # Handle response
-            if result.error:
-                return {"error": result.error}
-            elif result.output and isinstance(result.output, dict) and 'content' in result.output:
-                cleaned_code = self._clean_output(result.output['content'])
-                return {
-                    "success": True,
-                    "code": cleaned_code,
-                    "output": cleaned_code,  # For frontend compatibility
-                    "response": cleaned_code,
-                    "language": language,
-                    "model": model_name,
-                    "provider": "Bytez"
-                }
-            elif result.output:
-                cleaned_code = self._clean_output(str(result.output))
-                return {
-                    "success": True,
-                    "code": cleaned_code,
-                    "output": cleaned_code,
-                    "response": cleaned_code,
-                    "language": language,
-                    "model": model_name,
-                    "provider": "Bytez"
-                }
-            else:
-                return {"error": "No output received from model"}
+            response = None
+            for model_name in get_router().route(self, payload):
+                try:
+                    prompt, params = self._prepare(payload, model_name)
+                    result = await run_blocking(self._run_model, model_name, prompt, params)
+                except (CircuitOpenError, ConcurrencyLimitExceeded, PromptTooLong) as e:
+                    response = {"error": str(e)}
+                    continue
+                response = self._handle_result(result, payload, model_name)
+                if not response.get('error'):
+                    break
+            return response
                 
         except Exception as e:
             logger.error(f"Bytez API error: {str(e)}")
             return {"error": f"Bytez API error: {str(e)}"}
 
+    def stream(self, payload: Dict[str, Any]) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """Yield (event, data) pairs: 'token' for each visible chunk, then 'done' or 'error'"""
+        error = self._check_request(payload)
+        if error:
+            yield 'error', error
+            return
+        
+        try:
+            candidates = get_router().route(self, payload)
+            for index, model_name in enumerate(candidates):
+                last = index + 1 == len(candidates)
+                try:
+                    prompt, params = self._prepare(payload, model_name)
+                    chunks = self._open_stream(model_name, prompt, params)
+                except (CircuitOpenError, ConcurrencyLimitExceeded, PromptTooLong) as e:
+                    if not last:
+                        continue  # nothing has been sent yet, so the next model can take over
+                    yield 'error', {"error": str(e)}
+                    return
+                # The SDK returns a Response tuple instead of an iterator when the request fails
+                if getattr(chunks, 'error', None):
+                    if not last:
+                        continue
+                    yield 'error', {"error": chunks.error}
+                    return
+                yield from self._stream_chunks(model_name, chunks)
+                yield 'done', {"success": True, "model": model_name, "provider": "Bytez"}
+                return
+                
+        except Exception as e:
+            logger.error(f"Bytez API error: {str(e)}")
+            yield 'error', {"error": f"Bytez API error: {str(e)}"}
+    
+    def _open_stream(self, model_name: str, prompt: str, params: Dict[str, Any]):
+        """Start a streamed generation with retries and circuit breaking, like _run_model.
 
+        On success the provider slot stays held for _stream_chunks to release;
+        a failed start releases it and comes back as a Response with .error.
+        """
+        limit = get_limiter(self.api_key, model_name)
+        
+        def attempt():
+            limit.acquire()
+            started = time.monotonic()
+            try:
+                chunks = self._get_model(model_name).run(prompt, params, stream=True)
+            except BaseException:
+                limit.release('neutral')
+                get_router().observe(model_name, time.monotonic() - started, True)
+                raise
+            error = getattr(chunks, 'error', None)
+            if error:
+                limit.release('overload' if is_overload(error) else 'neutral')
+                get_router().observe(model_name, time.monotonic() - started, True)
+            return chunks
+        
+        # Never hedged: a duplicate stream would hold a second slot nobody reads
+        return get_policy(self).call(f"bytez:{model_name}", attempt, lambda chunks: getattr(chunks, 'error', None), hedge=False)
+    
+    def _stream_chunks(self, model_name: str, chunks) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """Visible text of an opened stream; releases its slot when exhausted or closed"""
+        limit = get_limiter(self.api_key, model_name)
+        started = time.monotonic()
+        outcome = 'neutral'
+        try:
+            if hasattr(chunks, 'output'):
+                chunks = [chunks.output.get('content', '') if isinstance(chunks.output, dict) else str(chunks.output or '')]
+            
+            think_filter = ThinkTagFilter()
+            for chunk in chunks:
+                if isinstance(chunk, bytes):
+                    chunk = chunk.decode('utf-8', 'replace')
+                text = think_filter.feed(chunk)
+                if text:
+                    yield 'token', {"text": text}
+            text = think_filter.finish()
+            if text:
+                yield 'token', {"text": text}
+            outcome = 'ok'
+        except Exception:
+            get_router().observe(model_name, time.monotonic() - started, True)
+            raise
+        finally:
+            # Includes GeneratorExit when the client goes away mid-stream
+            limit.release(outcome)
+        get_router().observe(model_name, time.monotonic() - started, False)
 
+class BytezTextAgent(BytezSDKAgent):
+    required_fields = ['prompt']
+    default_system_message = 'You are a helpful assistant. Provide direct, concise responses without using thinking tags or internal monologue. Just give the final answer.'
+    
+    def _prompt_parts(self, payload: Dict[str, Any]) -> Tuple[str, str]:
+        # Format messages properly with better system message
+        prompt = payload.get('prompt', '')
+        system_message = payload.get('system_message', self.default_system_message)
+        
+        # Simplified format for models that don't support complex chat templates
+        return f"{system_message}\n\nUser: ", str(prompt)
+    
+    def _generation_params(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        # Reduce max_tokens for faster responses
+        max_tokens = min(payload.get('max_tokens', 500), 1000)  # Cap at 1000 tokens
+        return {
+            "max_new_tokens": max_tokens,
+            "temperature": payload.get('temperature', 0.7)
+        }
+    
+    def _format_output(self, output: str, payload: Dict[str, Any], model_name: str) -> Dict[str, Any]:
+        return {
+            "success": True,
+            "output": output,
+            "response": output,  # For frontend compatibility
+            "content": output,   # For frontend compatibility
+            "model": model_name,
+            "provider": "Bytez"
+        }
 
-
-
+class BytezCodeAgent(BytezSDKAgent):
+    required_fields = ['task']
+    
+    def _prompt_parts(self, payload: Dict[str, Any]) -> Tuple[str, str]:
+        task = payload.get('task', '')
+        language = payload.get('language', 'python')
+        
+        # Simplified format for models that don't support complex chat templates
+        return f"You are a helpful coding assistant. Generate clean {language} code without explanations or thinking process. Just provide the code directly. Keep responses concise and efficient.\n\nTask: ", str(task)
+    
+    def _generation_params(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        # Reduce max_tokens for faster responses
+        max_tokens = min(payload.get('max_tokens', 1000), 2000)  # Cap at 2000 tokens
+        return {
+            "max_new_tokens": max_tokens,
+            "temperature": payload.get('temperature', 0.1)  # Lower temperature for code
+        }
+    
+    def _format_output(self, output: str, payload: Dict[str, Any], model_name: str) -> Dict[str, Any]:
+        return {
+            "success": True,
+            "code": output,
+            "output": output,  # For frontend compatibility
+            "response": output,
+            "language": payload.get('language', 'python'),
+            "model": model_name,
+            "provider": "Bytez"
+        }
\ No newline at end of file
@@ -0,0 +1,133 @@
+import hashlib
+import json
+import threading
+from typing import Dict, Any, Optional
+
+from django.conf import settings
+
+from .lru import LRUCache
+
+DEFAULTS = {
+    'ENABLED': False,
+    'TTL': 600,
+    'MAX_ENTRIES': 1000,
+    'MAX_TEMPERATURE': 0.3,
+    'AGENTS': {},   # per-agent overrides, e.g. {'writer': {'ENABLED': False}}
+}
+
+# Request fields that never change what the provider returns
+IGNORED_FIELDS = {'stream', 'cache'}
+
+
+def _normalize(value: Any) -> Any:
+    if isinstance(value, str):
+        return value.strip()
+    if isinstance(value, dict):
+        return {k: _normalize(v) for k, v in value.items() if k not in IGNORED_FIELDS}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(v) for v in value]
+    return value
+
+
+def canonical_key(agent_name: str, parts: Dict[str, Any]) -> str:
+    """Stable hash of everything that determines an agent's response"""
+    blob = json.dumps([agent_name, parts], sort_keys=True, separators=(',', ':'), ensure_ascii=False, default=str)
+    return hashlib.sha256(blob.encode('utf-8')).hexdigest()
+
+
+def deterministic(parts: Dict[str, Any], max_temperature: float) -> bool:
+    """Whether the sampling temperature in cache_key_parts is low enough to reuse the output.
+
+    Payloads are client JSON, so the value may be a string or anything else;
+    whatever does not read as a number is treated as not cacheable.
+    """
+    temperature = parts.get('params', {}).get('temperature', 0)
+    try:
+        temperature = float(temperature)
+    except (TypeError, ValueError):
+        return False
+    return temperature <= max_temperature  # also False for NaN
+
+
+def request_key(agent_name: str, agent, payload: Dict[str, Any]) -> str:
+    """Canonical key for any request, cacheable or not (used to coalesce identical calls)"""
+    payload = _normalize(payload)
+    parts = agent.cache_key_parts(payload) or {'payload': payload}
+    return canonical_key(agent_name, parts)
+
+
+class ResponseCache:
+    """Opt-in TTL + LRU cache for deterministic agent responses"""
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        self.config = {**DEFAULTS, **(config or {})}
+        self.enabled = bool(self.config['ENABLED'])
+        self._entries = LRUCache(self.config['MAX_ENTRIES'], ttl=self.config['TTL'])
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.bypasses = 0
+        self.saved_seconds = 0.0
+
+    def _rules(self, agent_name: str) -> Dict[str, Any]:
+        return {**self.config, **self.config['AGENTS'].get(agent_name, {})}
+
+    def key_for(self, agent_name: str, agent, payload: Dict[str, Any]) -> Optional[str]:
+        """Canonical key for a cacheable request, None if the response must not be cached"""
+        rules = self._rules(agent_name)
+        if not self.enabled or not rules['ENABLED'] or not agent.cacheable:
+            return None
+
+        payload = _normalize(payload)
+        parts = agent.cache_key_parts(payload)
+        if parts is None:
+            return None
+        if not deterministic(parts, rules['MAX_TEMPERATURE']):
+            return None
+        return canonical_key(agent_name, parts)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(key)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.saved_seconds += entry['elapsed']
+        return dict(entry['result'])
+
+    def set(self, key: str, result: Dict[str, Any], elapsed: float):
+        self._entries.set(key, {'result': result, 'elapsed': elapsed})
+
+    def record_bypass(self):
+        with self._lock:
+            self.bypasses += 1
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'enabled': self.enabled,
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'bypasses': self.bypasses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+                'saved_provider_seconds': round(self.saved_seconds, 3),
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> ResponseCache:
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResponseCache(getattr(settings, 'AGENT_RESPONSE_CACHE', {}))
+    return _cache
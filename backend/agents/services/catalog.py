@@ -0,0 +1,205 @@
+import base64
+import hashlib
+import json
+import threading
+from typing import Dict, Any, Optional, Tuple, List
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import BooleanField, FloatField, Q
+from django.db.models.expressions import RawSQL
+from django.utils.dateparse import parse_datetime
+
+from .lru import LRUCache
+
+DEFAULTS = {
+    'PAGE_SIZE': 24,
+    'MAX_PAGE_SIZE': 100,
+    'TTL': 60,              # seconds other processes may serve a page after an edit (signals clear this one)
+}
+
+# Also used by migration 0004 for the GIN index; the expressions must match exactly
+SEARCH_DOCUMENT = (
+    "setweight(to_tsvector('english', coalesce(name, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(description, '')), 'B')"
+)
+
+# sort name -> model field, always paired with -id as the tie-breaker
+SORTS = {
+    'popular': 'downloads',
+    'rating': 'rating',
+    'newest': 'created_at',
+    'relevance': 'rank',
+}
+
+
+class InvalidCursor(ValueError):
+    """The pagination cursor was not issued for this query"""
+
+
+def get_config() -> Dict[str, Any]:
+    return {**DEFAULTS, **getattr(settings, 'AGENT_CATALOG', {})}
+
+
+def _serialize(data: Any) -> Tuple[bytes, str]:
+    """JSON bytes and a strong ETag derived from them"""
+    body = json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    return body, f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+
+
+def _encode_cursor(sort: str, value: Any, pk: int) -> str:
+    raw = json.dumps([sort, value, pk], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def _decode_cursor(cursor: str, sort: str) -> Tuple[Any, int]:
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        cursor_sort, value, pk = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, TypeError):
+        raise InvalidCursor("Invalid cursor")
+    if cursor_sort != sort or not isinstance(pk, int):
+        raise InvalidCursor("Cursor does not match this query")
+    if sort == 'newest':
+        value = parse_datetime(value or '')
+        if value is None:
+            raise InvalidCursor("Invalid cursor")
+    return value, pk
+
+
+def listing(agent) -> Dict[str, Any]:
+    category = agent.category or ''
+    return {
+        'id': agent.slug or str(agent.pk),
+        'name': agent.name,
+        'description': agent.description or '',
+        'category': category,
+        'models': agent.supported_models,
+        'price': float(agent.price),
+        'rating': agent.rating,
+        'downloads': agent.downloads,
+        'icon': category.split()[0] if category.split() else '',
+        'created_at': agent.created_at.isoformat().replace('+00:00', 'Z'),
+    }
+
+
+def details(agent) -> Dict[str, Any]:
+    return {
+        'id': agent.slug or str(agent.pk),
+        'name': agent.name,
+        'description': agent.description or '',
+        'category': agent.category,
+        'models': agent.supported_models,
+        'capabilities': [],
+        'pricing': {'price': float(agent.price)},
+        'example_payload': agent.example_payload,
+    }
+
+
+def _search(queryset, query: str):
+    """Full-text + trigram match on PostgreSQL (GIN indexed), substring match elsewhere"""
+    if connection.vendor != 'postgresql':
+        return queryset.filter(Q(name__icontains=query) | Q(description__icontains=query)), False
+    matches = RawSQL(
+        f"({SEARCH_DOCUMENT}) @@ websearch_to_tsquery('english', %s) OR name %% %s",
+        (query, query),
+        output_field=BooleanField(),
+    )
+    rank = RawSQL(
+        f"ts_rank({SEARCH_DOCUMENT}, websearch_to_tsquery('english', %s)) + similarity(name, %s)",
+        (query, query),
+        output_field=FloatField(),
+    )
+    return queryset.annotate(matches=matches, rank=rank).filter(matches=True), True
+
+
+def search_agents(query: str = '', category: str = '', sort: str = '', cursor: str = '',
+                  limit: Optional[int] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """One page of published marketplace agents and the cursor for the next page.
+
+    Keyset pagination: the cursor carries the last row's sort value and id, so
+    every page is an index range scan however deep the client pages.
+    """
+    from ..models import Agent
+
+    config = get_config()
+    limit = max(1, min(int(limit or config['PAGE_SIZE']), config['MAX_PAGE_SIZE']))
+    queryset = Agent.objects.filter(is_published=True, workspace__isnull=True)
+    if category:
+        queryset = queryset.filter(category=category)
+
+    ranked = False
+    if query:
+        queryset, ranked = _search(queryset, query)
+    if sort not in SORTS or (sort == 'relevance' and not ranked):
+        sort = 'relevance' if ranked else 'popular'
+    field = SORTS[sort]
+
+    if cursor:
+        value, pk = _decode_cursor(cursor, sort)
+        queryset = queryset.filter(Q(**{f'{field}__lt': value}) | Q(**{field: value, 'id__lt': pk}))
+
+    rows = list(queryset.order_by(f'-{field}', '-id')[:limit + 1])
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        value = getattr(last, field)
+        next_cursor = _encode_cursor(sort, value.isoformat() if sort == 'newest' else value, last.pk)
+    return [listing(agent) for agent in rows], next_cursor
+
+
+class AgentCatalog:
+    """Pre-serialized marketplace responses with strong ETags.
+
+    The default first page and agent details are kept as bytes; saving or
+    deleting an Agent clears them (see agents.signals), and a short TTL bounds
+    staleness in other processes.
+    """
+
+    def __init__(self):
+        config = get_config()
+        self._pages = LRUCache(64, ttl=config['TTL'])
+        self._details = LRUCache(1024, ttl=config['TTL'])
+
+    def agent_list(self, query: str = '', category: str = '', sort: str = '', cursor: str = '',
+                   limit: Optional[int] = None) -> Tuple[bytes, str]:
+        key = (query, category, sort, cursor, limit)
+        cacheable = not query and not cursor
+        entry = self._pages.get(key) if cacheable else None
+        if entry is None:
+            results, next_cursor = search_agents(query, category, sort, cursor, limit)
+            entry = _serialize({'results': results, 'next_cursor': next_cursor})
+            if cacheable:
+                self._pages.set(key, entry)
+        return entry
+
+    def agent_details(self, slug: str) -> Optional[Tuple[bytes, str]]:
+        from ..models import Agent
+
+        entry = self._details.get(slug)
+        if entry is None:
+            agent = Agent.objects.filter(slug=slug, is_published=True).first()
+            if agent is None:
+                return None
+            entry = _serialize(details(agent))
+            self._details.set(slug, entry)
+        return entry
+
+    def invalidate(self):
+        """Drop cached responses (called whenever catalog data changes)"""
+        self._pages.clear()
+        self._details.clear()
+
+
+_catalog = None
+_catalog_lock = threading.Lock()
+
+
+def get_catalog() -> AgentCatalog:
+    global _catalog
+    if _catalog is None:
+        with _catalog_lock:
+            if _catalog is None:
+                _catalog = AgentCatalog()
+    return _catalog
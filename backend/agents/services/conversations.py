@@ -0,0 +1,175 @@
+import re
+import secrets
+import threading
+import time
+from typing import Dict, Any, List, Optional
+
+from django.conf import settings
+from django.core.cache import caches
+
+DEFAULTS = {
+    'CACHE_ALIAS': 'default',   # point at a shared cache (Redis/Memcached) when running several processes
+    'KEY_PREFIX': 'chat:',
+    'IDLE_TTL': 3600,           # conversations untouched this long are evicted
+    'WINDOW_TURNS': 6,          # most recent turns sent to the model verbatim
+    'SUMMARY_BATCH': 4,         # older turns are folded into the summary this many at a time
+    'MAX_MESSAGE_CHARS': 2000,  # longer messages are stored shortened
+    'SUMMARY_MAX_CHARS': 1500,
+    'SUMMARY_MAX_TOKENS': 200,
+    'LOCK_TTL': 300,            # a turn's lock lapses after this long if its process died mid-turn
+    'LOCK_WAIT': 10,            # how long a message waits for the previous turn before it is turned away
+}
+
+LOCK_POLL = 0.05
+
+CONVERSATION_ID = re.compile(r'^[A-Za-z0-9_-]{16,64}$')
+
+
+def get_config() -> Dict[str, Any]:
+    return {**DEFAULTS, **getattr(settings, 'AGENT_CONVERSATIONS', {})}
+
+
+def _shorten(text: str, limit: int) -> str:
+    text = ' '.join(str(text).split())
+    return text if len(text) <= limit else f"{text[:limit - 3]}..."
+
+
+class ConversationBusy(Exception):
+    """Another turn of the same conversation is still being answered"""
+
+
+class ConversationStore:
+    """Server-side chat history: a rolling summary plus the last few turns.
+
+    A conversation is {'summary': str, 'turns': [[user, assistant], ...],
+    'count': total turns} under an unguessable server-issued id, so the id
+    doubles as the session credential. Every turn resets the cache timeout;
+    idle conversations simply expire. Once WINDOW_TURNS + SUMMARY_BATCH turns
+    are held, the oldest SUMMARY_BATCH are folded into the summary, so the
+    context sent per turn stays bounded however long the chat runs.
+
+    Turns of one conversation are serialized by a lock taken with cache.add,
+    which is atomic on every shared backend, so two messages sent at once
+    cannot both build on the same history and drop each other's turn.
+    """
+
+    def __init__(self, config: Dict[str, Any]):
+        self.config = config
+        self.cache = caches[config['CACHE_ALIAS']]
+        self._lock = threading.Lock()
+        self.started = 0
+        self.resumed = 0
+        self.expired = 0
+        self.summarized = 0
+        self.summary_fallbacks = 0
+        self.busy = 0
+
+    def _key(self, conversation_id: str) -> str:
+        return f"{self.config['KEY_PREFIX']}{conversation_id}"
+
+    def _count(self, name: str):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def _acquire(self, conversation_id: str) -> str:
+        """Take the conversation's turn lock, waiting up to LOCK_WAIT; returns the token for release()"""
+        key, token = f"{self._key(conversation_id)}:lock", secrets.token_hex(8)
+        deadline = time.monotonic() + self.config['LOCK_WAIT']
+        while not self.cache.add(key, token, self.config['LOCK_TTL']):
+            if time.monotonic() >= deadline:
+                self._count('busy')
+                raise ConversationBusy("Conversation busy: the previous message is still being answered")
+            time.sleep(LOCK_POLL)
+        return token
+
+    def open(self, conversation_id: Optional[str]):
+        """(conversation_id, state, lock) for a new turn; unknown or expired ids start a new conversation.
+
+        The turn holds the conversation until release(conversation_id, lock);
+        raises ConversationBusy if another turn keeps it past LOCK_WAIT.
+        """
+        if conversation_id and CONVERSATION_ID.match(str(conversation_id)):
+            lock = self._acquire(conversation_id)
+            state = self.cache.get(self._key(conversation_id))
+            if state is not None:
+                self._count('resumed')
+                return conversation_id, state, lock
+            self.release(conversation_id, lock)
+        if conversation_id:
+            self._count('expired')
+        self._count('started')
+        conversation_id = secrets.token_urlsafe(18)
+        return conversation_id, {'summary': '', 'turns': [], 'count': 0}, self._acquire(conversation_id)
+
+    def release(self, conversation_id: str, lock: str):
+        # Only the holder releases; a lapsed lock may already belong to the next turn
+        key = f"{self._key(conversation_id)}:lock"
+        if self.cache.get(key) == lock:
+            self.cache.delete(key)
+
+    def save(self, conversation_id: str, state: Dict[str, Any]):
+        self.cache.set(self._key(conversation_id), state, self.config['IDLE_TTL'])
+
+    def delete(self, conversation_id: str):
+        self.cache.delete(self._key(conversation_id))
+
+    def append(self, state: Dict[str, Any], user: str, assistant: str):
+        limit = self.config['MAX_MESSAGE_CHARS']
+        state['turns'].append([_shorten(user, limit), _shorten(assistant, limit)])
+        state['count'] += 1
+
+    def overflow(self, state: Dict[str, Any]) -> List[List[str]]:
+        """Turns due to be folded into the summary (empty most of the time)"""
+        window, batch = self.config['WINDOW_TURNS'], self.config['SUMMARY_BATCH']
+        if len(state['turns']) < window + batch:
+            return []
+        return state['turns'][:len(state['turns']) - window]
+
+    def fold(self, state: Dict[str, Any], turns: List[List[str]], summary: Optional[str]):
+        """Replace `turns` by a new summary; without one, keep a shortened transcript instead"""
+        if summary:
+            self._count('summarized')
+        else:
+            self._count('summary_fallbacks')
+            summary = ' '.join(filter(None, [state['summary'], self.transcript(turns)]))
+        limit = self.config['SUMMARY_MAX_CHARS']
+        # Too long a fallback keeps its most recent part
+        state['summary'] = summary if len(summary) <= limit else f"...{summary[len(summary) - limit + 3:]}"
+        state['turns'] = state['turns'][len(turns):]
+
+    @staticmethod
+    def transcript(turns: List[List[str]]) -> str:
+        return ''.join(f"User: {user}\nAssistant: {assistant}\n" for user, assistant in turns)
+
+    def context(self, state: Dict[str, Any]) -> str:
+        """History as sent ahead of the new message"""
+        parts = []
+        if state['summary']:
+            parts.append(f"Summary of the earlier conversation: {state['summary']}\n\n")
+        if state['turns']:
+            parts.append(f"{self.transcript(state['turns'])}\n")
+        return ''.join(parts)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'started': self.started,
+                'resumed': self.resumed,
+                'expired': self.expired,
+                'summarized': self.summarized,
+                'summary_fallbacks': self.summary_fallbacks,
+                'busy': self.busy,
+            }
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_conversation_store() -> ConversationStore:
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = ConversationStore(get_config())
+    return _store
@@ -0,0 +1,383 @@
+import base64
+import binascii
+import hashlib
+import json
+import logging
+import os
+import re
+import multiprocessing
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Any, List, Optional
+
+from django.conf import settings
+
+from .transport import get_transport
+
+try:
+    from PIL import Image
+    PILLOW_AVAILABLE = True
+except ImportError:
+    PILLOW_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'ENABLED': True,
+    'DIRECTORY': None,              # required when enabled
+    'URL_PREFIX': '/api/agents/images/',
+    'VARIANTS': {'thumb': 256, 'medium': 512},  # WebP variants by longest edge in pixels (needs Pillow)
+    'WEBP_QUALITY': 80,
+    'DOWNLOAD_WORKERS': 4,
+    'RENDER_WORKERS': 2,            # processes producing variants
+    'DOWNLOAD_TIMEOUT': 60,
+    'MAX_IMAGE_BYTES': 20 * 1024 * 1024,
+    'CHUNK_SIZE': 64 * 1024,
+    'CACHE_CONTROL': 'public, max-age=31536000, immutable',
+    'MAX_BYTES': 2 * 1024 * 1024 * 1024,    # least recently served images (with their variants) are deleted above this
+    'TTL': 30 * 24 * 3600,          # seconds an unserved image is kept; None keeps images until MAX_BYTES
+    'SWEEP_INTERVAL': 300,          # seconds between sweeps in each process
+    'RETRY_FAILED_AFTER': 300,      # seconds before a failed copy is attempted again
+    'MAX_ATTEMPTS': 3,              # copies tried per image before it stays failed
+}
+
+EXTENSIONS = {
+    'image/png': 'png',
+    'image/jpeg': 'jpg',
+    'image/webp': 'webp',
+    'image/gif': 'gif',
+}
+
+CONTENT_TYPES = {ext: content_type for content_type, ext in EXTENSIONS.items()}
+
+TICKET = re.compile(r'^[0-9a-f]{32}$')
+ORIGINAL = 'original'
+
+
+def get_config() -> Dict[str, Any]:
+    return {**DEFAULTS, **getattr(settings, 'AGENT_IMAGE_STORE', {})}
+
+
+def render_variants(blob_path: str, variant_dir: str, digest: str, variants: Dict[str, int], quality: int) -> Dict[str, str]:
+    """Write WebP size variants of one image; runs in a worker process, so no Django here"""
+    rendered = {}
+    with Image.open(blob_path) as image:
+        image = image.convert('RGBA' if image.mode in ('RGBA', 'LA', 'P') else 'RGB')
+        for name, edge in variants.items():
+            variant = image.copy()
+            variant.thumbnail((edge, edge))
+            filename = f"{digest}_{name}.webp"
+            target = os.path.join(variant_dir, filename)
+            partial = f"{target}.{os.getpid()}.part"
+            variant.save(partial, 'WEBP', quality=quality, method=4)
+            os.replace(partial, target)
+            rendered[name] = filename
+    return rendered
+
+
+class ImageStore:
+    """Content-addressed local copies of generated images, plus WebP variants.
+
+    mirror() hands out stable URLs at once and copies the images in the
+    background. Each URL is keyed by a ticket (a hash of the provider URL)
+    whose state lives in refs/<ticket>.json, shared by every process on the
+    host. Blobs are stored once per content hash, so duplicates share files
+    and variants. Until a copy is ready, its URLs redirect to the provider.
+
+    Serving a file touches it; sweep() deletes images (blob and variants)
+    unserved for TTL, then the least recently served ones above MAX_BYTES,
+    and the refs that pointed at them.
+    """
+
+    def __init__(self, config: Dict[str, Any]):
+        self.config = config
+        self.directory = Path(config['DIRECTORY'])
+        for sub in ('refs', 'blobs', 'variants'):
+            (self.directory / sub).mkdir(parents=True, exist_ok=True)
+        self.variants = config['VARIANTS'] if PILLOW_AVAILABLE else {}
+        if config['VARIANTS'] and not PILLOW_AVAILABLE:
+            logger.warning("AGENT_IMAGE_STORE['VARIANTS'] needs Pillow; storing originals only. Run: pip install Pillow")
+        self._downloads = ThreadPoolExecutor(max_workers=config['DOWNLOAD_WORKERS'], thread_name_prefix='image-store')
+        self._renderer = None
+        self._last_sweep = 0.0
+        self._in_flight = set()
+        self._rendering: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+        self.stored = 0
+        self.deduplicated = 0
+        self.failed = 0
+        self.rendered = 0
+        self.evicted = 0
+
+    def _ref_path(self, ticket: str) -> Path:
+        return self.directory / 'refs' / f"{ticket}.json"
+
+    def ref(self, ticket: str) -> Optional[Dict[str, Any]]:
+        if not TICKET.match(ticket):
+            return None
+        try:
+            with open(self._ref_path(ticket)) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _write_ref(self, ticket: str, ref: Dict[str, Any]):
+        target = self._ref_path(ticket)
+        partial = target.with_name(f"{target.name}.{os.getpid()}.{threading.get_ident()}.part")
+        with open(partial, 'w') as f:
+            json.dump(ref, f)
+        os.replace(partial, target)
+
+    def urls(self, ticket: str) -> Dict[str, Any]:
+        prefix = f"{self.config['URL_PREFIX']}{ticket}"
+        return {
+            'original': f"{prefix}/{ORIGINAL}",
+            'variants': {name: f"{prefix}/{name}" for name in self.variants},
+        }
+
+    def mirror(self, sources: List[str]) -> List[Dict[str, Any]]:
+        """Start copying provider images; returns their local URLs right away"""
+        assets = []
+        for source in sources:
+            ticket = hashlib.sha256(source.encode('utf-8')).hexdigest()[:32]
+            ref = self.ref(ticket)
+            if ref is None:
+                ref = {'status': 'pending', 'source': source}
+                self._write_ref(ticket, ref)
+            elif self._should_retry(ref):
+                ref = {'status': 'pending', 'source': source, 'attempts': ref.get('attempts', 1)}
+                self._write_ref(ticket, ref)
+            if ref['status'] == 'pending':
+                with self._lock:
+                    start = ticket not in self._in_flight
+                    self._in_flight.add(ticket)
+                if start:
+                    self._downloads.submit(self._ingest, ticket, source, ref.get('attempts', 0))
+            assets.append({'id': ticket, 'status': ref['status'], **self.urls(ticket)})
+        return assets
+
+    def _should_retry(self, ref: Dict[str, Any]) -> bool:
+        if ref['status'] != 'failed' or ref.get('attempts', 1) >= self.config['MAX_ATTEMPTS']:
+            return False
+        return time.time() - ref.get('failed_at', 0) >= self.config['RETRY_FAILED_AFTER']
+
+    def _ingest(self, ticket: str, source: str, attempts: int = 0):
+        try:
+            digest, ext = self._download(source)
+            variants = self._variants(digest, ext)
+            self._write_ref(ticket, {'status': 'ready', 'source': source, 'sha256': digest, 'ext': ext,
+                                     'variants': variants})
+        except Exception as e:
+            logger.warning(f"Could not mirror image {ticket}: {e}")
+            with self._lock:
+                self.failed += 1
+            self._write_ref(ticket, {'status': 'failed', 'source': source, 'attempts': attempts + 1,
+                                     'failed_at': time.time()})
+        finally:
+            with self._lock:
+                self._in_flight.discard(ticket)
+        self._maybe_sweep()
+
+    def _download(self, source: str):
+        """Stream an image into blobs/<sha256>.<ext>; returns (sha256, ext)"""
+        max_bytes = self.config['MAX_IMAGE_BYTES']
+        hasher = hashlib.sha256()
+        size = 0
+        spool = tempfile.NamedTemporaryFile(delete=False, dir=self.directory / 'blobs', suffix='.part')
+        try:
+            with spool:
+                if source.startswith('data:'):
+                    header, _, encoded = source.partition(',')
+                    content_type = header[5:].split(';')[0]
+                    try:
+                        data = base64.b64decode(encoded, validate=True)
+                    except (binascii.Error, ValueError):
+                        raise ValueError("Invalid data URI")
+                    size = len(data)
+                    if size > max_bytes:
+                        raise ValueError(f"Image exceeds {max_bytes} bytes")
+                    hasher.update(data)
+                    spool.write(data)
+                else:
+                    response = get_transport().request('GET', source, stream=True, timeout=self.config['DOWNLOAD_TIMEOUT'])
+                    try:
+                        response.raise_for_status()
+                        content_type = response.headers.get('Content-Type', '').split(';')[0].strip()
+                        for chunk in response.iter_content(self.config['CHUNK_SIZE']):
+                            size += len(chunk)
+                            if size > max_bytes:
+                                raise ValueError(f"Image exceeds {max_bytes} bytes")
+                            hasher.update(chunk)
+                            spool.write(chunk)
+                    finally:
+                        response.close()
+            if not size:
+                raise ValueError("Empty image")
+
+            digest, ext = hasher.hexdigest(), EXTENSIONS.get(content_type, 'png')
+            blob = self.directory / 'blobs' / f"{digest}.{ext}"
+            if blob.exists():
+                os.remove(spool.name)
+                os.utime(blob)  # in use again, keep it out of the next sweep
+                with self._lock:
+                    self.deduplicated += 1
+            else:
+                os.replace(spool.name, blob)
+                with self._lock:
+                    self.stored += 1
+            return digest, ext
+        except BaseException:
+            if os.path.exists(spool.name):
+                os.remove(spool.name)
+            raise
+
+    def _get_renderer(self) -> ProcessPoolExecutor:
+        if self._renderer is None:
+            with self._lock:
+                if self._renderer is None:
+                    # Spawned, not forked: forking a threaded server copies its locks in whatever state they are
+                    self._renderer = ProcessPoolExecutor(
+                        max_workers=self.config['RENDER_WORKERS'], mp_context=multiprocessing.get_context('spawn')
+                    )
+        return self._renderer
+
+    def _variants(self, digest: str, ext: str) -> Dict[str, str]:
+        if not self.variants:
+            return {}
+        variant_dir = self.directory / 'variants'
+        existing = {name: f"{digest}_{name}.webp" for name in self.variants}
+        if all((variant_dir / filename).exists() for filename in existing.values()):
+            return existing
+        blob = self.directory / 'blobs' / f"{digest}.{ext}"
+        renderer = self._get_renderer()
+        with self._lock:
+            # Identical images arriving together are rendered once
+            future = self._rendering.get(digest)
+            if future is None:
+                future = self._rendering[digest] = renderer.submit(
+                    render_variants, str(blob), str(variant_dir), digest, dict(self.variants), self.config['WEBP_QUALITY']
+                )
+                future.add_done_callback(lambda _: self._rendering.pop(digest, None))
+                self.rendered += len(self.variants)
+        return future.result()
+
+    def file(self, ref: Dict[str, Any], name: str):
+        """(path, content_type, etag) of a ready image or variant, or None"""
+        if name == ORIGINAL:
+            path = self.directory / 'blobs' / f"{ref['sha256']}.{ref['ext']}"
+            content_type, etag = CONTENT_TYPES.get(ref['ext'], 'application/octet-stream'), ref['sha256']
+        elif name in ref.get('variants', {}):
+            path = self.directory / 'variants' / ref['variants'][name]
+            content_type, etag = 'image/webp', f"{ref['sha256']}_{name}"
+        else:
+            return None
+        try:
+            os.utime(path)  # recently served, evicted last
+        except FileNotFoundError:
+            return None
+        return path, content_type, f'"{etag}"'
+
+    def _maybe_sweep(self):
+        with self._lock:
+            if time.monotonic() - self._last_sweep < self.config['SWEEP_INTERVAL']:
+                return
+            self._last_sweep = time.monotonic()
+        try:
+            self.sweep()
+        except OSError as e:
+            logger.warning(f"Could not sweep the image store: {e}")
+
+    def sweep(self) -> int:
+        """Delete expired and least recently served images; returns how many were removed"""
+        now = time.time()
+        ttl = self.config['TTL']
+        # digest -> [last used, bytes, files]; an image is its blob plus its variants
+        images: Dict[str, list] = {}
+        for sub in ('blobs', 'variants'):
+            for path in (self.directory / sub).iterdir():
+                try:
+                    stat = path.stat()
+                except FileNotFoundError:
+                    continue
+                if path.name.endswith('.part'):
+                    if now - stat.st_mtime > 3600:  # left behind by a crashed copy
+                        path.unlink(missing_ok=True)
+                    continue
+                digest = path.name.split('.')[0].split('_')[0]
+                entry = images.setdefault(digest, [0.0, 0, []])
+                entry[0] = max(entry[0], stat.st_mtime)
+                entry[1] += stat.st_size
+                entry[2].append(path)
+
+        total = sum(size for _, size, _ in images.values())
+        removed = set()
+        for digest, (last_used, size, paths) in sorted(images.items(), key=lambda item: item[1][0]):
+            expired = ttl is not None and now - last_used > ttl
+            if not expired and total <= self.config['MAX_BYTES']:
+                break
+            for path in paths:
+                path.unlink(missing_ok=True)
+            total -= size
+            removed.add(digest)
+
+        for path in (self.directory / 'refs').glob('*.json'):
+            ref = self.ref(path.stem)
+            try:
+                written = path.stat().st_mtime
+            except FileNotFoundError:
+                continue
+            if ref is None or written >= now:
+                continue  # written since the scan above, so its blob may not have been seen
+            if ref['status'] == 'ready':
+                drop = ref['sha256'] in removed or ref['sha256'] not in images
+            else:
+                drop = ttl is not None and now - written > ttl
+            if drop:
+                path.unlink(missing_ok=True)
+
+        with self._lock:
+            self.evicted += len(removed)
+        return len(removed)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'pillow': PILLOW_AVAILABLE,
+                'in_flight': len(self._in_flight),
+                'stored': self.stored,
+                'deduplicated': self.deduplicated,
+                'failed': self.failed,
+                'variants_rendered': self.rendered,
+                'evicted': self.evicted,
+            }
+
+
+_image_store = None
+_image_store_lock = threading.Lock()
+
+
+def get_image_store() -> Optional[ImageStore]:
+    """The process-wide image store, or None when disabled"""
+    global _image_store
+    if _image_store is None:
+        config = get_config()
+        if not config['ENABLED'] or not config['DIRECTORY']:
+            return None
+        with _image_store_lock:
+            if _image_store is None:
+                _image_store = ImageStore(config)
+    return _image_store
+
+
+def _reset_after_fork():
+    # Thread and process pools do not survive a fork
+    global _image_store, _image_store_lock
+    _image_store = None
+    _image_store_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
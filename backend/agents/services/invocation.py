@@ -0,0 +1,51 @@
+import time
+from typing import Dict, Any
+
+from . import AgentFactory
+from .cache import get_response_cache, request_key
+from .singleflight import get_single_flight
+
+
+class Invocation:
+    """Outcome of one agent call as seen by the API layer"""
+
+    __slots__ = ('result', 'cache_status', 'elapsed', 'coalesced')
+
+    def __init__(self, result: Dict[str, Any], cache_status: str = '', elapsed: float = 0.0, coalesced: bool = False):
+        self.result = result
+        self.cache_status = cache_status   # HIT, MISS, BYPASS or '' when not cacheable
+        self.elapsed = elapsed
+        self.coalesced = coalesced         # True when another identical in-flight call produced the result
+
+
+async def invoke_agent(agent_name: str, payload: Dict[str, Any], bypass_cache: bool = False) -> Invocation:
+    """Run an agent through the shared instance, consulting the response cache first.
+
+    Raises ValueError for unknown agents, like AgentFactory.
+    """
+    agent = AgentFactory.get_agent(agent_name)
+    cache = get_response_cache()
+    key = cache.key_for(agent_name, agent, payload)
+
+    if key is not None:
+        if bypass_cache:
+            cache.record_bypass()
+        else:
+            cached = cache.get(key)
+            if cached is not None:
+                return Invocation(cached, 'HIT')
+
+    started = time.monotonic()
+    if agent.coalescable:
+        # Identical calls already in flight share one provider request
+        flight_key = key or request_key(agent_name, agent, payload)
+        result, coalesced = await get_single_flight().do(flight_key, lambda: agent.aprocess(payload))
+    else:
+        result, coalesced = await agent.aprocess(payload), False
+    elapsed = time.monotonic() - started
+
+    if key is None:
+        return Invocation(result, '', elapsed, coalesced)
+    if not coalesced and isinstance(result, dict) and result.get('success') and not result.get('error'):
+        cache.set(key, result, elapsed)
+    return Invocation(result, 'BYPASS' if bypass_cache else 'MISS', elapsed, coalesced)
@@ -0,0 +1,248 @@
+import logging
+import os
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from typing import Dict, Any, List, Optional
+
+from django.conf import settings
+from django.db import DatabaseError, transaction, close_old_connections
+from django.db.models import Q
+from django.utils import timezone
+
+from . import AgentFactory
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'WORKERS': 4,           # jobs one worker process runs at a time
+    'POLL_INTERVAL': 1.0,   # seconds between queue checks when idle
+    'MAX_ATTEMPTS': 3,      # crashes/timeouts before a job is marked failed
+    'HEARTBEAT_INTERVAL': 30,   # seconds between a worker's "still running" updates
+    'STALE_AFTER': 600,     # seconds without a heartbeat after which a running job is assumed lost and requeued
+}
+
+
+def get_config() -> Dict[str, Any]:
+    return {**DEFAULTS, **getattr(settings, 'AGENT_JOBS', {})}
+
+
+def submit_job(agent_name: str, payload: Dict[str, Any], user_id: Optional[int] = None,
+               workspace_id: Optional[int] = None, quota_subject: str = ''):
+    from ..models import AgentJob
+
+    return AgentJob.objects.create(
+        agent_name=agent_name, payload=payload, user_id=user_id, workspace_id=workspace_id,
+        quota_subject=quota_subject,
+    )
+
+
+def serialize_job(job) -> Dict[str, Any]:
+    data = {
+        'job_id': str(job.id),
+        'agent': job.agent_name,
+        'status': job.status,
+        'created_at': job.created_at.isoformat(),
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+    }
+    if job.status == job.STATUS_SUCCEEDED:
+        data['result'] = job.result
+    elif job.status == job.STATUS_FAILED:
+        data['error'] = job.error
+        data['result'] = job.result
+    return data
+
+
+def claim_jobs(worker: str, limit: int) -> List[Any]:
+    """Move up to `limit` queued jobs to running for this worker.
+
+    SELECT ... FOR UPDATE SKIP LOCKED lets any number of workers poll the same
+    table without blocking each other or claiming a job twice.
+    """
+    from ..models import AgentJob
+
+    if limit <= 0:
+        return []
+    with transaction.atomic():
+        jobs = list(
+            AgentJob.objects.select_for_update(skip_locked=True)
+            .filter(status=AgentJob.STATUS_QUEUED)
+            .order_by('created_at')[:limit]
+        )
+        if not jobs:
+            return []
+        now = timezone.now()
+        AgentJob.objects.filter(pk__in=[job.pk for job in jobs]).update(
+            status=AgentJob.STATUS_RUNNING, worker=worker, started_at=now, heartbeat_at=now
+        )
+        for job in jobs:
+            job.status, job.worker, job.started_at, job.heartbeat_at = AgentJob.STATUS_RUNNING, worker, now, now
+    return jobs
+
+
+def heartbeat(worker: str, job_ids) -> int:
+    """Mark jobs this worker is still running as alive"""
+    from ..models import AgentJob
+
+    if not job_ids:
+        return 0
+    return AgentJob.objects.filter(pk__in=list(job_ids), status=AgentJob.STATUS_RUNNING, worker=worker).update(
+        heartbeat_at=timezone.now()
+    )
+
+
+def refund_job_quota(job):
+    """Give the anonymous allowance call back for a job that failed for good"""
+    from tenants.quotas import QuotaDecision, refund_quota
+
+    if job.quota_subject:
+        refund_quota(QuotaDecision(True, subject=job.quota_subject, agent_name=job.agent_name, allowance_consumed=True))
+
+
+def requeue_stale_jobs(stale_after: float, max_attempts: int) -> int:
+    """Return jobs whose worker stopped sending heartbeats to the queue (or fail them after max_attempts).
+
+    A job that is merely slow keeps its heartbeat fresh and is left alone, so
+    it is never run (and billed) twice.
+    """
+    from ..models import AgentJob
+
+    cutoff = timezone.now() - timedelta(seconds=stale_after)
+    stale = AgentJob.objects.filter(status=AgentJob.STATUS_RUNNING).filter(
+        Q(heartbeat_at__lt=cutoff) | Q(heartbeat_at__isnull=True, started_at__lt=cutoff)
+    )
+    for job in stale.filter(attempts__gte=max_attempts):
+        # Re-checked per row so a job another sweeper already failed is not refunded twice
+        if stale.filter(pk=job.pk).update(status=AgentJob.STATUS_FAILED, error='Job did not finish', finished_at=timezone.now()):
+            refund_job_quota(job)
+    return stale.filter(attempts__lt=max_attempts).update(status=AgentJob.STATUS_QUEUED, worker='')
+
+
+def run_job(job, max_attempts: int):
+    """Run one claimed job on the current thread and store its outcome"""
+    from payments.usage import get_usage_recorder, estimate_tokens
+    from ..models import AgentJob
+
+    job.attempts += 1
+    AgentJob.objects.filter(pk=job.pk).update(attempts=job.attempts)
+
+    started = time.monotonic()
+    try:
+        agent = AgentFactory.get_agent(job.agent_name)
+        result = agent.process(job.payload)
+    except Exception as e:
+        logger.exception(f"Agent job {job.id} crashed")
+        retry = job.attempts < max_attempts
+        AgentJob.objects.filter(pk=job.pk).update(
+            status=AgentJob.STATUS_QUEUED if retry else AgentJob.STATUS_FAILED,
+            error=str(e),
+            worker='',
+            finished_at=None if retry else timezone.now(),
+        )
+        if not retry:
+            refund_job_quota(job)
+        return
+
+    failed = not isinstance(result, dict) or bool(result.get('error'))
+    AgentJob.objects.filter(pk=job.pk).update(
+        status=AgentJob.STATUS_FAILED if failed else AgentJob.STATUS_SUCCEEDED,
+        result=result if isinstance(result, dict) else {'error': 'Agent returned no result'},
+        error=str(result.get('error', '')) if isinstance(result, dict) else '',
+        finished_at=timezone.now(),
+    )
+    if failed:
+        # Same as a failed synchronous call: the caller keeps their free allowance
+        refund_job_quota(job)
+
+    result = result if isinstance(result, dict) else {}
+    get_usage_recorder().record(
+        user_id=job.user_id,
+        workspace_id=job.workspace_id,
+        agent_name=job.agent_name,
+        model=str(result.get('model') or job.payload.get('model') or ''),
+        prompt_tokens=estimate_tokens(job.payload.get('prompt') or job.payload.get('text')),
+        completion_tokens=0,
+        latency_ms=int((time.monotonic() - started) * 1000),
+        status='error' if failed else 'success',
+    )
+
+
+class JobWorker:
+    """Polls the job table and runs claimed jobs on a local thread pool.
+
+    The polling thread also keeps the heartbeat of every job still running
+    here fresh, so other workers can tell a slow job from a dead worker.
+    """
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        self.config = {**get_config(), **(config or {})}
+        self.name = f"{socket.gethostname()}:{os.getpid()}"
+        self._executor = ThreadPoolExecutor(max_workers=self.config['WORKERS'], thread_name_prefix='agent-job')
+        self._running = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._last_heartbeat = 0.0
+
+    def _free_slots(self) -> int:
+        with self._lock:
+            return self.config['WORKERS'] - len(self._running)
+
+    def _execute(self, job):
+        close_old_connections()
+        try:
+            run_job(job, self.config['MAX_ATTEMPTS'])
+        finally:
+            close_old_connections()
+            with self._lock:
+                self._running.discard(job.pk)
+
+    def _heartbeat(self):
+        if time.monotonic() - self._last_heartbeat < self.config['HEARTBEAT_INTERVAL']:
+            return
+        with self._lock:
+            running = list(self._running)
+        try:
+            heartbeat(self.name, running)
+        except DatabaseError as e:
+            logger.warning(f"Could not update agent job heartbeats: {e}")
+            return
+        self._last_heartbeat = time.monotonic()
+
+    def run_once(self) -> int:
+        """Claim as many jobs as there are free threads; returns how many were started"""
+        jobs = claim_jobs(self.name, self._free_slots())
+        for job in jobs:
+            with self._lock:
+                self._running.add(job.pk)
+            self._executor.submit(self._execute, job)
+        return len(jobs)
+
+    def run(self, once: bool = False):
+        last_sweep = 0.0
+        try:
+            while not self._stop.is_set():
+                if time.monotonic() - last_sweep > self.config['STALE_AFTER'] / 2:
+                    requeued = requeue_stale_jobs(self.config['STALE_AFTER'], self.config['MAX_ATTEMPTS'])
+                    if requeued:
+                        logger.warning(f"Requeued {requeued} stale agent jobs")
+                    last_sweep = time.monotonic()
+
+                self._heartbeat()
+                started = self.run_once()
+                if once:
+                    break
+                if not started:
+                    self._stop.wait(self.config['POLL_INTERVAL'])
+        finally:
+            # Keep beating until the jobs in hand finish, so a shutdown is not mistaken for a crash
+            while self._free_slots() < self.config['WORKERS']:
+                self._heartbeat()
+                time.sleep(min(self.config['POLL_INTERVAL'], 1.0))
+            self._executor.shutdown(wait=True)
+            close_old_connections()
+
+    def stop(self):
+        self._stop.set()
@@ -0,0 +1,164 @@
+import hashlib
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Any
+
+from django.conf import settings
+
+DEFAULTS = {
+    'INITIAL': 2,           # starting concurrency per (API key, model)
+    'MIN': 1,
+    'MAX': 8,
+    'MAX_QUEUE': 100,       # callers allowed to wait for a slot; beyond this they are rejected
+    'QUEUE_TIMEOUT': 30,    # seconds a caller waits for a slot
+    'INCREASE': 1.0,        # additive increase per `limit` successful calls
+    'DECREASE': 0.5,        # multiplicative decrease when the provider signals overload
+    'MODELS': {},           # per-model overrides, e.g. {'google/gemma-2b': {'MAX': 1}}
+}
+
+OVERLOAD_MARKERS = ('concurrency', 'rate limit', 'too many requests')
+
+
+def is_overload(error: Any) -> bool:
+    """Whether a provider error means we are sending too much at once"""
+    if not error:
+        return False
+    message = str(error).lower()
+    return any(marker in message for marker in OVERLOAD_MARKERS)
+
+
+class ConcurrencyLimitExceeded(Exception):
+    """Raised when no provider slot frees up in time or the wait queue is full"""
+
+
+class AdaptiveLimit:
+    """Concurrency slots for one provider key/model, sized by AIMD.
+
+    Each success grows the limit by INCREASE / limit (about +INCREASE per
+    window of `limit` calls); an overload signal multiplies it by DECREASE.
+    Callers over the limit wait in a bounded queue instead of failing.
+    """
+
+    def __init__(self, name: str, config: Dict[str, Any]):
+        self.name = name
+        self.min_limit = config['MIN']
+        self.max_limit = config['MAX']
+        self.max_queue = config['MAX_QUEUE']
+        self.queue_timeout = config['QUEUE_TIMEOUT']
+        self.increase = config['INCREASE']
+        self.decrease = config['DECREASE']
+        self.limit = float(min(max(config['INITIAL'], self.min_limit), self.max_limit))
+        self.in_flight = 0
+        self.waiting = 0
+        self._cond = threading.Condition()
+        self.acquired = 0
+        self.queued = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.overloads = 0
+        self.queue_seconds = 0.0
+        self.max_queue_seconds = 0.0
+
+    def _has_slot(self) -> bool:
+        return self.in_flight < max(int(self.limit), 1)
+
+    def acquire(self) -> float:
+        """Block until a slot is free; returns seconds spent queued"""
+        with self._cond:
+            if self._has_slot():
+                self.in_flight += 1
+                self.acquired += 1
+                return 0.0
+
+            if self.waiting >= self.max_queue:
+                self.rejected += 1
+                raise ConcurrencyLimitExceeded(
+                    f"Provider concurrency limit reached for {self.name}, {self.waiting} requests already queued"
+                )
+
+            self.waiting += 1
+            self.queued += 1
+            started = time.monotonic()
+            deadline = started + self.queue_timeout
+            try:
+                while not self._has_slot():
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.timeouts += 1
+                        raise ConcurrencyLimitExceeded(
+                            f"Timed out after {self.queue_timeout}s waiting for a provider concurrency slot for {self.name}"
+                        )
+                    self._cond.wait(remaining)
+            finally:
+                self.waiting -= 1
+
+            waited = time.monotonic() - started
+            self.in_flight += 1
+            self.acquired += 1
+            self.queue_seconds += waited
+            self.max_queue_seconds = max(self.max_queue_seconds, waited)
+            return waited
+
+    def release(self, outcome: str = 'ok'):
+        """outcome is 'ok', 'overload' or 'neutral' (failures unrelated to load)"""
+        with self._cond:
+            self.in_flight -= 1
+            if outcome == 'overload':
+                self.overloads += 1
+                self.limit = max(self.min_limit, self.limit * self.decrease)
+            elif outcome == 'ok':
+                self.limit = min(self.max_limit, self.limit + self.increase / self.limit)
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self):
+        """Hold a slot for the duration of a provider call; set outcome['overloaded'] from the reply"""
+        self.acquire()
+        outcome = {'overloaded': False}
+        try:
+            yield outcome
+        except BaseException:
+            # Includes GeneratorExit when a stream holding the slot is closed early
+            self.release('overload' if outcome['overloaded'] else 'neutral')
+            raise
+        else:
+            self.release('overload' if outcome['overloaded'] else 'ok')
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                'limit': round(self.limit, 2),
+                'in_flight': self.in_flight,
+                'waiting': self.waiting,
+                'acquired': self.acquired,
+                'queued': self.queued,
+                'rejected': self.rejected,
+                'timeouts': self.timeouts,
+                'overloads': self.overloads,
+                'avg_queue_ms': round(self.queue_seconds * 1000 / self.queued, 1) if self.queued else 0.0,
+                'max_queue_ms': round(self.max_queue_seconds * 1000, 1),
+            }
+
+
+_limits: Dict[str, AdaptiveLimit] = {}
+_limits_lock = threading.Lock()
+
+
+def get_limiter(api_key: str, model: str) -> AdaptiveLimit:
+    """Shared limiter for an API key and model (keys are hashed, never stored)"""
+    key_id = hashlib.sha256((api_key or '').encode('utf-8')).hexdigest()[:12]
+    name = f"{key_id}:{model}"
+    limit = _limits.get(name)
+    if limit is None:
+        with _limits_lock:
+            limit = _limits.get(name)
+            if limit is None:
+                config = {**DEFAULTS, **getattr(settings, 'AGENT_CONCURRENCY', {})}
+                config.update(config['MODELS'].get(model, {}))
+                limit = _limits[name] = AdaptiveLimit(model, config)
+    return limit
+
+
+def limiter_stats() -> Dict[str, Any]:
+    return {name: limit.stats() for name, limit in list(_limits.items())}
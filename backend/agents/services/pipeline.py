@@ -0,0 +1,296 @@
+import asyncio
+import re
+import threading
+import time
+from typing import Dict, Any, List, Optional, Callable, AsyncIterator, Tuple
+
+from django.conf import settings
+
+from . import AgentFactory
+from .cache import canonical_key, deterministic, _normalize
+from .invocation import Invocation, invoke_agent
+from .lru import LRUCache
+
+DEFAULTS = {
+    'MAX_STEPS': 20,
+    'PARALLELISM': 4,           # steps of one pipeline running at the same time
+    'CACHE_TTL': 3600,          # step outputs reused when a step's resolved payload is unchanged
+    'CACHE_MAX_ENTRIES': 500,
+    'CACHE_MAX_TEMPERATURE': 0.3,   # sampled steps above this are never reused
+}
+
+INPUT_NAMESPACE = 'input'
+STEP_ID = re.compile(r'^[A-Za-z0-9_\-]+$')
+# {{ step_id.field.0.subfield }}
+PLACEHOLDER = re.compile(r'\{\{\s*([A-Za-z0-9_\-]+)((?:\.[A-Za-z0-9_\-]+)*)\s*\}\}')
+
+
+class PipelineError(ValueError):
+    """The pipeline definition is invalid or a step's template cannot be resolved"""
+
+
+def get_config() -> Dict[str, Any]:
+    return {**DEFAULTS, **getattr(settings, 'AGENT_PIPELINES', {})}
+
+
+def _references(value: Any) -> set:
+    """Namespaces referenced by templates anywhere inside a payload"""
+    if isinstance(value, str):
+        return {match.group(1) for match in PLACEHOLDER.finditer(value)}
+    if isinstance(value, dict):
+        return set().union(*(_references(v) for v in value.values())) if value else set()
+    if isinstance(value, list):
+        return set().union(*(_references(v) for v in value)) if value else set()
+    return set()
+
+
+def _lookup(context: Dict[str, Any], name: str, path: str) -> Any:
+    value = context[name]
+    for part in filter(None, path.split('.')):
+        if isinstance(value, dict) and part in value:
+            value = value[part]
+        elif isinstance(value, list) and part.isdigit() and int(part) < len(value):
+            value = value[int(part)]
+        else:
+            raise PipelineError(f"Template '{{{{{name}{path}}}}}' does not match the output of '{name}'")
+    return value
+
+
+def render(value: Any, context: Dict[str, Any]) -> Any:
+    """Fill {{ step.field }} placeholders from earlier step results.
+
+    A string that is exactly one placeholder takes the referenced value as is
+    (so lists and numbers survive); otherwise values are interpolated as text.
+    """
+    if isinstance(value, str):
+        whole = PLACEHOLDER.fullmatch(value.strip())
+        if whole:
+            return _lookup(context, whole.group(1), whole.group(2))
+        return PLACEHOLDER.sub(lambda match: str(_lookup(context, match.group(1), match.group(2))), value)
+    if isinstance(value, dict):
+        return {k: render(v, context) for k, v in value.items()}
+    if isinstance(value, list):
+        return [render(v, context) for v in value]
+    return value
+
+
+class Step:
+    __slots__ = ('id', 'agent', 'payload', 'depends_on')
+
+    def __init__(self, step_id: str, agent: str, payload: Dict[str, Any], depends_on: List[str]):
+        self.id = step_id
+        self.agent = agent
+        self.payload = payload
+        self.depends_on = depends_on
+
+
+class Pipeline:
+    """A DAG of agent steps; dependencies come from templates and optional depends_on"""
+
+    def __init__(self, definition: Dict[str, Any], config: Optional[Dict[str, Any]] = None):
+        self.config = {**get_config(), **(config or {})}
+        self.steps = self._parse(definition)
+        self.order = self._topological_order()
+
+    def _parse(self, definition: Dict[str, Any]) -> Dict[str, Step]:
+        raw_steps = definition.get('steps') if isinstance(definition, dict) else None
+        if not isinstance(raw_steps, list) or not raw_steps:
+            raise PipelineError("Pipeline needs a non-empty 'steps' list")
+        if len(raw_steps) > self.config['MAX_STEPS']:
+            raise PipelineError(f"A pipeline can have at most {self.config['MAX_STEPS']} steps")
+
+        steps = {}
+        for raw in raw_steps:
+            if not isinstance(raw, dict):
+                raise PipelineError("Each step must be an object with 'id', 'agent' and 'payload'")
+            step_id, agent, payload = raw.get('id'), raw.get('agent'), raw.get('payload') or {}
+            if not isinstance(step_id, str) or not STEP_ID.match(step_id) or step_id == INPUT_NAMESPACE:
+                raise PipelineError(f"Invalid step id: {step_id!r}")
+            if step_id in steps:
+                raise PipelineError(f"Duplicate step id: {step_id}")
+            if agent not in AgentFactory.get_available_agents():
+                raise PipelineError(f"Unknown agent for step '{step_id}': {agent}")
+            if not isinstance(payload, dict):
+                raise PipelineError(f"Payload of step '{step_id}' must be an object")
+            depends_on = raw.get('depends_on') or []
+            if not isinstance(depends_on, list):
+                raise PipelineError(f"'depends_on' of step '{step_id}' must be a list")
+            steps[step_id] = Step(step_id, agent, payload, list(depends_on))
+
+        for step in steps.values():
+            references = (_references(step.payload) - {INPUT_NAMESPACE}) | set(step.depends_on)
+            unknown = references - set(steps)
+            if unknown:
+                raise PipelineError(f"Step '{step.id}' refers to unknown steps: {', '.join(sorted(unknown))}")
+            step.depends_on = sorted(references)
+        return steps
+
+    def _topological_order(self) -> List[str]:
+        remaining = {step_id: set(step.depends_on) for step_id, step in self.steps.items()}
+        order = []
+        while remaining:
+            ready = [step_id for step_id, deps in remaining.items() if not deps]
+            if not ready:
+                raise PipelineError(f"Pipeline has a cycle between: {', '.join(sorted(remaining))}")
+            for step_id in ready:
+                order.append(step_id)
+                del remaining[step_id]
+            for deps in remaining.values():
+                deps.difference_update(ready)
+        return order
+
+    async def run(self, inputs: Dict[str, Any], emit: Callable[[str, Dict[str, Any]], None],
+                  bypass_cache: bool = False,
+                  on_step: Optional[Callable[[Step, Dict[str, Any], Invocation], None]] = None) -> Dict[str, Any]:
+        """Execute every step as soon as its dependencies finish; returns the final summary.
+
+        emit(event, data) is called for step_started, step_completed, step_failed and
+        step_skipped; on_step(step, payload, invocation) after each step that ran.
+        """
+        context = {INPUT_NAMESPACE: inputs or {}}
+        done = {step_id: asyncio.Event() for step_id in self.steps}
+        outcome: Dict[str, str] = {}
+        semaphore = asyncio.Semaphore(self.config['PARALLELISM'])
+        cache = get_step_cache()
+
+        async def run_step(step: Step):
+            try:
+                for dependency in step.depends_on:
+                    await done[dependency].wait()
+                failed_dependencies = [d for d in step.depends_on if outcome[d] != 'completed']
+                if failed_dependencies:
+                    outcome[step.id] = 'skipped'
+                    emit('step_skipped', {'id': step.id, 'reason': f"Upstream step failed: {', '.join(failed_dependencies)}"})
+                    return
+
+                try:
+                    payload = render(step.payload, context)
+                except PipelineError as e:
+                    outcome[step.id] = 'failed'
+                    emit('step_failed', {'id': step.id, 'agent': step.agent, 'error': str(e)})
+                    return
+
+                async with semaphore:
+                    emit('step_started', {'id': step.id, 'agent': step.agent})
+                    invocation = await cache.invoke(step.agent, payload, bypass_cache)
+
+                result = invocation.result
+                if on_step:
+                    on_step(step, payload, invocation)
+                if not isinstance(result, dict) or result.get('error'):
+                    outcome[step.id] = 'failed'
+                    error = result.get('error') if isinstance(result, dict) else 'Agent returned no result'
+                    emit('step_failed', {'id': step.id, 'agent': step.agent, 'error': error})
+                    return
+
+                context[step.id] = result
+                outcome[step.id] = 'completed'
+                emit('step_completed', {
+                    'id': step.id,
+                    'agent': step.agent,
+                    'result': result,
+                    'cached': invocation.cache_status == 'HIT',
+                    'elapsed_ms': int(invocation.elapsed * 1000),
+                })
+            finally:
+                outcome.setdefault(step.id, 'failed')
+                done[step.id].set()
+
+        started = time.monotonic()
+        tasks = [asyncio.ensure_future(run_step(self.steps[step_id])) for step_id in self.order]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            # After an unexpected error the other steps stop too, so the caller's refunds stay accurate
+            for task in tasks:
+                task.cancel()
+        return {
+            'status': 'completed' if all(state == 'completed' for state in outcome.values()) else 'failed',
+            'steps': {step_id: outcome[step_id] for step_id in self.order},
+            'outputs': {step_id: context[step_id] for step_id in self.order if step_id in context},
+            'elapsed_ms': int((time.monotonic() - started) * 1000),
+        }
+
+    async def events(self, inputs: Dict[str, Any], bypass_cache: bool = False,
+                     on_step=None) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """Run the pipeline, yielding (event, data) as steps progress and ('done', summary) last"""
+        queue: asyncio.Queue = asyncio.Queue()
+        runner = asyncio.ensure_future(
+            self.run(inputs, lambda event, data: queue.put_nowait((event, data)), bypass_cache, on_step)
+        )
+        runner.add_done_callback(lambda _: queue.put_nowait(None))
+        try:
+            while True:
+                item = await queue.get()
+                if item is None:
+                    break
+                yield item
+            yield 'done', runner.result()
+        finally:
+            # Client went away: stop the remaining steps
+            runner.cancel()
+
+
+class StepCache:
+    """Successful step outputs keyed by agent and fully resolved payload.
+
+    Because upstream outputs are part of a step's resolved payload, changing
+    one step only invalidates the steps downstream of it. Like the response
+    cache, only deterministic calls to cacheable agents are reused: entries
+    are shared by every caller, so sampled text, images, speech and chat
+    turns always run.
+    """
+
+    def __init__(self, config: Dict[str, Any]):
+        self.max_temperature = config['CACHE_MAX_TEMPERATURE']
+        self._entries = LRUCache(config['CACHE_MAX_ENTRIES'], ttl=config['CACHE_TTL'])
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def key_for(self, agent_name: str, payload: Dict[str, Any]) -> Optional[str]:
+        """Key for a reusable step, None if its output must not be shared"""
+        agent = AgentFactory.get_agent(agent_name)
+        if not agent.cacheable:
+            return None
+        parts = agent.cache_key_parts(_normalize(payload))
+        if parts is None:
+            return None
+        if not deterministic(parts, self.max_temperature):
+            return None
+        return canonical_key(f"pipeline:{agent_name}", parts)
+
+    async def invoke(self, agent_name: str, payload: Dict[str, Any], bypass_cache: bool = False) -> Invocation:
+        key = self.key_for(agent_name, payload)
+        if key is None:
+            return await invoke_agent(agent_name, payload, bypass_cache=bypass_cache)
+        if not bypass_cache:
+            entry = self._entries.get(key)
+            with self._lock:
+                if entry is not None:
+                    self.hits += 1
+                    return Invocation(dict(entry), 'HIT')
+                self.misses += 1
+
+        invocation = await invoke_agent(agent_name, payload, bypass_cache=bypass_cache)
+        result = invocation.result
+        if isinstance(result, dict) and result.get('success') and not result.get('error'):
+            self._entries.set(key, result)
+        return invocation
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+
+_step_cache = None
+_step_cache_lock = threading.Lock()
+
+
+def get_step_cache() -> StepCache:
+    global _step_cache
+    if _step_cache is None:
+        with _step_cache_lock:
+            if _step_cache is None:
+                _step_cache = StepCache(get_config())
+    return _step_cache
@@ -0,0 +1,149 @@
+import re
+import threading
+from typing import Dict, Any, Optional
+
+from django.conf import settings
+
+DEFAULTS = {
+    'CONTEXT_WINDOWS': {        # tokens per model (prompt + generated)
+        'google/gemma-2b': 8192,
+        'Qwen/Qwen2-0.5B-Instruct': 32768,
+    },
+    'DEFAULT_CONTEXT_WINDOW': 4096,
+    'SAFETY_MARGIN': 0.05,      # share of the window kept free for estimator error and chat templates
+    'MIN_OUTPUT_TOKENS': 64,    # trimming/rejecting starts when less than this would be left for the reply
+    'OVERFLOW': 'trim',         # 'trim' the middle of oversized input or 'reject' it; payload 'overflow' overrides
+}
+
+OVERFLOW_MODES = ('trim', 'reject')
+TRIM_MARKER = '\n[...]\n'
+
+# Roughly how BPE tokenizers pre-split text: words, numbers, single symbols
+PIECE = re.compile(r"[A-Za-z]+|\d{1,3}|[^\sA-Za-z\d]")
+LONG_WORD = re.compile(r"[A-Za-z]{7,}")
+
+
+def get_config() -> Dict[str, Any]:
+    configured = getattr(settings, 'AGENT_PROMPTS', {})
+    config = {**DEFAULTS, **configured}
+    config['CONTEXT_WINDOWS'] = {**DEFAULTS['CONTEXT_WINDOWS'], **configured.get('CONTEXT_WINDOWS', {})}
+    return config
+
+
+def estimate_tokens(text: str) -> int:
+    """Fast upper-leaning token count; no tokenizer download, errs towards too many.
+
+    Never exceeds len(text), which lets short prompts skip counting altogether.
+    """
+    if not text:
+        return 0
+    # Long words usually split into several tokens
+    return len(PIECE.findall(text)) + sum(len(word) // 6 for word in LONG_WORD.findall(text))
+
+
+class PromptTooLong(ValueError):
+    """The input does not fit the model's context window"""
+
+
+class AssembledPrompt:
+    __slots__ = ('prompt', 'max_new_tokens', 'input_tokens', 'trimmed')
+
+    def __init__(self, prompt: str, max_new_tokens: int, input_tokens: Optional[int], trimmed: bool):
+        self.prompt = prompt
+        self.max_new_tokens = max_new_tokens
+        self.input_tokens = input_tokens
+        self.trimmed = trimmed
+
+
+class PromptAssembler:
+    """Fits a prompt into a model's context window before it is sent.
+
+    A prompt is a fixed prefix and suffix (instructions, role labels) around a
+    body (the user's text). When the whole would leave less than
+    MIN_OUTPUT_TOKENS for the reply, the middle of the body is cut out (or the
+    request is rejected), and max_new_tokens is lowered to what is left.
+    """
+
+    def __init__(self, config: Dict[str, Any]):
+        self.config = config
+        self._lock = threading.Lock()
+        self.assembled = 0
+        self.trimmed = 0
+        self.rejected = 0
+        self.output_clamped = 0
+
+    def context_window(self, model: str) -> int:
+        return int(self.config['CONTEXT_WINDOWS'].get(model, self.config['DEFAULT_CONTEXT_WINDOW']))
+
+    def _count(self, **counters):
+        with self._lock:
+            for name, value in counters.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def assemble(self, model: str, prefix: str, body: str, suffix: str = '', max_new_tokens: int = 512,
+                 overflow: Optional[str] = None) -> AssembledPrompt:
+        overflow = overflow if overflow in OVERFLOW_MODES else self.config['OVERFLOW']
+        window = self.context_window(model)
+        usable = int(window * (1 - self.config['SAFETY_MARGIN']))
+        min_output = max(1, min(max_new_tokens, self.config['MIN_OUTPUT_TOKENS']))
+        input_budget = usable - min_output
+
+        if len(prefix) + len(body) + len(suffix) <= usable - max_new_tokens:
+            # Never more tokens than characters, so short prompts need no counting
+            self._count(assembled=1)
+            return AssembledPrompt(f"{prefix}{body}{suffix}", max_new_tokens, None, False)
+
+        fixed = estimate_tokens(prefix) + estimate_tokens(suffix)
+        body_tokens = estimate_tokens(body)
+        trimmed = False
+        if fixed + body_tokens > input_budget:
+            # Trimmed input leaves room for the requested reply, up to half the window
+            reply = max(min_output, min(max_new_tokens, usable // 2))
+            body_budget = usable - reply - fixed - estimate_tokens(TRIM_MARKER)
+            if overflow == 'reject' or body_budget <= 0:
+                self._count(rejected=1)
+                raise PromptTooLong(
+                    f"Input is about {fixed + body_tokens} tokens but {model} has a context window of "
+                    f"{window} tokens; shorten the input or request fewer output tokens"
+                )
+            body, body_tokens = self._trim_middle(body, body_tokens, body_budget)
+            trimmed = True
+
+        input_tokens = fixed + body_tokens
+        output_tokens = max(min_output, min(max_new_tokens, usable - input_tokens))
+        self._count(assembled=1, trimmed=int(trimmed), output_clamped=int(output_tokens < max_new_tokens))
+        return AssembledPrompt(f"{prefix}{body}{suffix}", output_tokens, input_tokens, trimmed)
+
+    @staticmethod
+    def _trim_middle(body: str, tokens: int, budget: int):
+        """Keep the start and the end of the body (instructions and the actual question)"""
+        keep = int(len(body) * budget / tokens)
+        while True:
+            head, tail = body[:keep // 2], body[len(body) - (keep - keep // 2):] if keep else ''
+            trimmed = f"{head}{TRIM_MARKER}{tail}"
+            trimmed_tokens = estimate_tokens(head) + estimate_tokens(tail)
+            if trimmed_tokens <= budget or keep == 0:
+                return trimmed, trimmed_tokens + estimate_tokens(TRIM_MARKER)
+            keep = int(keep * budget / trimmed_tokens * 0.95)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'assembled': self.assembled,
+                'trimmed': self.trimmed,
+                'rejected': self.rejected,
+                'output_clamped': self.output_clamped,
+            }
+
+
+_assembler = None
+_assembler_lock = threading.Lock()
+
+
+def get_prompt_assembler() -> PromptAssembler:
+    global _assembler
+    if _assembler is None:
+        with _assembler_lock:
+            if _assembler is None:
+                _assembler = PromptAssembler(get_config())
+    return _assembler
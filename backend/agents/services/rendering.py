@@ -0,0 +1,81 @@
+import json
+from typing import Dict, Any
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+DEFAULTS = {
+    'DEFAULT_FORMAT': 'full',   # shape for clients that do not ask; 'full' keeps the legacy duplicate fields
+}
+
+FORMATS = ('full', 'compact')
+FORMAT_HEADER = 'X-Response-Format'
+COMPACT_VERSION = '2'           # Accept: application/json; version=2 also selects the compact shape
+
+# Older clients read the text from these; in the compact shape it is only in 'output'
+ALIASES = ('response', 'content', 'code')
+
+
+def get_config() -> Dict[str, Any]:
+    return {**DEFAULTS, **getattr(settings, 'AGENT_RESPONSES', {})}
+
+
+def _default(value):
+    return DjangoJSONEncoder().default(value)
+
+
+def dumps(data: Any) -> bytes:
+    """Compact UTF-8 JSON; orjson when installed, the stdlib encoder otherwise"""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(data, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(data, cls=DjangoJSONEncoder, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+
+def response_format(request) -> str:
+    """'compact' or 'full', from X-Response-Format or a version parameter on Accept"""
+    requested = request.headers.get(FORMAT_HEADER, '').strip().lower()
+    if requested in FORMATS:
+        return requested
+    for media_range in request.headers.get('Accept', '').split(','):
+        params = [param.strip().replace(' ', '') for param in media_range.split(';')[1:]]
+        if f'version={COMPACT_VERSION}' in params:
+            return 'compact'
+    return get_config()['DEFAULT_FORMAT']
+
+
+def compact(data: Any) -> Any:
+    """Drop fields that repeat 'output', at any depth (batch entries, job and pipeline results)"""
+    if isinstance(data, dict):
+        output = data.get('output')
+        return {
+            key: compact(value) for key, value in data.items()
+            if not (output is not None and key in ALIASES and value == output)
+        }
+    if isinstance(data, list):
+        return [compact(item) for item in data]
+    return data
+
+
+class FastJsonResponse(HttpResponse):
+    """JsonResponse without the stdlib encoder's overhead or ASCII escaping"""
+
+    def __init__(self, data: Any, **kwargs):
+        kwargs.setdefault('content_type', 'application/json')
+        super().__init__(content=dumps(data), **kwargs)
+
+
+def agent_response(request, data: Any, **kwargs) -> FastJsonResponse:
+    """An agent result in the shape the client negotiated"""
+    shape = response_format(request)
+    response = FastJsonResponse(compact(data) if shape == 'compact' else data, **kwargs)
+    response[FORMAT_HEADER] = shape
+    patch_vary_headers(response, (FORMAT_HEADER, 'Accept'))
+    return response
@@ -0,0 +1,325 @@
+import asyncio
+import logging
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout, as_completed
+from typing import Dict, Any, Optional, Callable
+
+from django.conf import settings
+
+from .limiter import is_overload
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'RETRIES': 2,               # extra attempts after a transient failure
+    'BACKOFF_BASE': 0.5,        # seconds; attempt n sleeps uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2**n))
+    'BACKOFF_MAX': 8.0,
+    'BREAKER_THRESHOLD': 5,     # consecutive transient failures that open the circuit
+    'BREAKER_COOLDOWN': 30,     # seconds the circuit stays open before one trial call
+    'HEDGE': False,             # send a duplicate request when the first is slower than usual
+    'HEDGE_PERCENTILE': 95,
+    'HEDGE_MIN_DELAY': 1.0,     # never hedge sooner than this
+    'HEDGE_MIN_SAMPLES': 20,    # latencies needed before hedging starts
+    'AGENTS': {},               # per-agent overrides by class name, e.g. {'BytezImageAgent': {'RETRIES': 0}}
+}
+
+TRANSIENT_MARKERS = (
+    'timeout', 'timed out', 'fetch failed', 'connection', 'temporarily unavailable',
+    '500 server error', '502', '503', '504',
+)
+
+
+def is_transient_error(error: Any) -> bool:
+    """Whether a failed call is worth retrying (provider trouble, not a bad request)"""
+    if not error:
+        return False
+    message = str(error).lower()
+    return is_overload(message) or any(marker in message for marker in TRANSIENT_MARKERS)
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a provider endpoint that keeps failing"""
+
+
+class CircuitBreaker:
+    """Closed -> open after BREAKER_THRESHOLD transient failures in a row;
+    after BREAKER_COOLDOWN one trial call is let through (half-open) and
+    its outcome closes or re-opens the circuit.
+    """
+
+    def __init__(self, threshold: int, cooldown: float):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+        self.opened = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at < self.cooldown:
+            return 'open'
+        return 'half_open'
+
+    def allow(self) -> bool:
+        with self._lock:
+            state = self.state
+            if state == 'closed':
+                return True
+            if state == 'half_open' and not self.trial_in_flight:
+                self.trial_in_flight = True
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.trial_in_flight or (self.opened_at is None and self.failures >= self.threshold):
+                self.opened_at = time.monotonic()
+                self.opened += 1
+            self.trial_in_flight = False
+
+    def record_neutral(self):
+        """A call that says nothing about provider health (e.g. a bad request)"""
+        with self._lock:
+            self.trial_in_flight = False
+
+    def stats(self) -> Dict[str, Any]:
+        return {'state': self.state, 'failures': self.failures, 'opened': self.opened, 'rejected': self.rejected}
+
+
+class LatencyWindow:
+    """Recent successful call latencies for one endpoint"""
+
+    def __init__(self, size: int = 200):
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, percent: float, min_samples: int) -> Optional[float]:
+        with self._lock:
+            if len(self._samples) < min_samples:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))]
+
+
+class ResiliencePolicy:
+    """Retries, circuit breaking and hedging around one agent's provider calls.
+
+    attempt() performs a single call and returns the provider result;
+    error_of(result) extracts its error (None on success). Calls raising
+    CircuitOpenError never reached the provider; anything attempt() raises
+    (e.g. ConcurrencyLimitExceeded from our own limiter) propagates without
+    a retry and leaves the breaker as it was.
+    """
+
+    def __init__(self, name: str, config: Dict[str, Any]):
+        self.name = name
+        self.config = config
+        self.retries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def _backoff(self, attempt_number: int) -> float:
+        ceiling = min(self.config['BACKOFF_MAX'], self.config['BACKOFF_BASE'] * (2 ** attempt_number))
+        return random.uniform(0, ceiling)
+
+    def _hedge_delay(self, key: str) -> Optional[float]:
+        if not self.config['HEDGE']:
+            return None
+        p = _latencies(key).percentile(self.config['HEDGE_PERCENTILE'], self.config['HEDGE_MIN_SAMPLES'])
+        return None if p is None else max(p, self.config['HEDGE_MIN_DELAY'])
+
+    def _settle(self, key: str, breaker: CircuitBreaker, error: Any, elapsed: Optional[float]) -> bool:
+        """Update breaker/latency state; returns True when the call should be retried"""
+        if not error:
+            breaker.record_success()
+            if elapsed is not None:
+                _latencies(key).add(elapsed)
+            return False
+        if is_transient_error(error):
+            breaker.record_failure()
+            return True
+        breaker.record_neutral()
+        return False
+
+    def _unavailable(self, key: str) -> CircuitOpenError:
+        return CircuitOpenError(
+            f"Provider temporarily unavailable ({key}), retry in a few seconds"
+        )
+
+    def call(self, key: str, attempt: Callable[[], Any], error_of: Callable[[Any], Any], hedge: bool = True):
+        """hedge=False for attempts that only start a call (streams): no duplicates, no latency samples"""
+        breaker = _breaker(key, self.config)
+        for attempt_number in range(self.config['RETRIES'] + 1):
+            if not breaker.allow():
+                raise self._unavailable(key)
+            started = time.monotonic()
+            try:
+                result = self._hedged(key, attempt, error_of) if hedge else attempt()
+            except BaseException:
+                breaker.record_neutral()
+                raise
+            error = error_of(result)
+            if not self._settle(key, breaker, error, time.monotonic() - started if hedge else None):
+                return result
+            if attempt_number < self.config['RETRIES']:
+                self.retries += 1
+                delay = self._backoff(attempt_number)
+                logger.warning(f"Retrying {key} in {delay:.2f}s after transient error: {error}")
+                time.sleep(delay)
+        return result
+
+    async def acall(self, key: str, attempt: Callable[[], Any], error_of: Callable[[Any], Any]):
+        """Async counterpart of call(); attempt() returns an awaitable"""
+        breaker = _breaker(key, self.config)
+        for attempt_number in range(self.config['RETRIES'] + 1):
+            if not breaker.allow():
+                raise self._unavailable(key)
+            started = time.monotonic()
+            try:
+                result = await self._ahedged(key, attempt, error_of)
+            except BaseException:
+                breaker.record_neutral()
+                raise
+            error = error_of(result)
+            if not self._settle(key, breaker, error, time.monotonic() - started):
+                return result
+            if attempt_number < self.config['RETRIES']:
+                self.retries += 1
+                delay = self._backoff(attempt_number)
+                logger.warning(f"Retrying {key} in {delay:.2f}s after transient error: {error}")
+                await asyncio.sleep(delay)
+        return result
+
+    def _hedged(self, key: str, attempt: Callable[[], Any], error_of: Callable[[Any], Any]):
+        delay = self._hedge_delay(key)
+        if delay is None:
+            return attempt()
+
+        first = _get_hedge_executor().submit(attempt)
+        try:
+            return first.result(timeout=delay)
+        except FutureTimeout:
+            pass
+        self.hedges += 1
+        second = _get_hedge_executor().submit(attempt)
+        # First successful reply wins; the slower request finishes in the background
+        result = None
+        for future in as_completed([first, second]):
+            result = future.result()
+            if not error_of(result):
+                if future is second:
+                    self.hedge_wins += 1
+                return result
+        return result
+
+    async def _ahedged(self, key: str, attempt: Callable[[], Any], error_of: Callable[[Any], Any]):
+        delay = self._hedge_delay(key)
+        if delay is None:
+            return await attempt()
+
+        first = asyncio.ensure_future(attempt())
+        done, _ = await asyncio.wait({first}, timeout=delay)
+        if done:
+            return first.result()
+        self.hedges += 1
+        second = asyncio.ensure_future(attempt())
+        pending = {first, second}
+        result = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    result = task.result()
+                    if not error_of(result):
+                        if task is second:
+                            self.hedge_wins += 1
+                        return result
+            return result
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        return {'retries': self.retries, 'hedges': self.hedges, 'hedge_wins': self.hedge_wins}
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_windows: Dict[str, LatencyWindow] = {}
+_policies: Dict[str, ResiliencePolicy] = {}
+_state_lock = threading.Lock()
+_hedge_executor = None
+
+
+def _breaker(key: str, config: Dict[str, Any]) -> CircuitBreaker:
+    breaker = _breakers.get(key)
+    if breaker is None:
+        with _state_lock:
+            breaker = _breakers.setdefault(key, CircuitBreaker(config['BREAKER_THRESHOLD'], config['BREAKER_COOLDOWN']))
+    return breaker
+
+
+def circuit_state(key: str) -> str:
+    """'closed', 'open' or 'half_open' for an endpoint key ('closed' if never called)"""
+    breaker = _breakers.get(key)
+    return breaker.state if breaker else 'closed'
+
+
+def _latencies(key: str) -> LatencyWindow:
+    window = _windows.get(key)
+    if window is None:
+        with _state_lock:
+            window = _windows.setdefault(key, LatencyWindow())
+    return window
+
+
+def _get_hedge_executor() -> ThreadPoolExecutor:
+    global _hedge_executor
+    if _hedge_executor is None:
+        with _state_lock:
+            if _hedge_executor is None:
+                _hedge_executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'AGENT_BLOCKING_WORKERS', 256), thread_name_prefix='agent-hedge'
+                )
+    return _hedge_executor
+
+
+def get_policy(agent) -> ResiliencePolicy:
+    """Policy for an agent class: defaults < AGENT_RESILIENCE < class `resilience` < AGENT_RESILIENCE['AGENTS']"""
+    name = type(agent).__name__
+    policy = _policies.get(name)
+    if policy is None:
+        with _state_lock:
+            policy = _policies.get(name)
+            if policy is None:
+                configured = getattr(settings, 'AGENT_RESILIENCE', {})
+                config = {**DEFAULTS, **configured, **getattr(agent, 'resilience', {})}
+                config.update(config['AGENTS'].get(name, {}))
+                policy = _policies[name] = ResiliencePolicy(name, config)
+    return policy
+
+
+def resilience_stats() -> Dict[str, Any]:
+    return {
+        'policies': {name: policy.stats() for name, policy in list(_policies.items())},
+        'breakers': {key: breaker.stats() for key, breaker in list(_breakers.items())},
+    }
@@ -0,0 +1,137 @@
+import random
+import threading
+from typing import Dict, Any, List, Optional
+
+from django.conf import settings
+
+from .limiter import get_limiter
+from .resilience import circuit_state
+
+DEFAULTS = {
+    'ENABLED': True,
+    'ALPHA': 0.2,               # EWMA weight of the newest observation
+    'EXPLORE': 0.05,            # share of requests sent to a random healthy candidate to keep estimates fresh
+    'MAX_ERROR_RATE': 0.5,      # above this a model is only used as a last resort
+    'QUALITY_WEIGHT': 0.25,     # extra cost per rank below the best model when balancing
+    'MAX_FALLBACKS': 2,         # other models tried after a failed call
+    'POOLS': {},                # candidate models per agent class, best quality first
+}
+
+PREFERENCES = ('fast', 'balanced', 'quality')
+
+
+class ModelHealth:
+    """Exponentially weighted latency and error rate for one model"""
+
+    def __init__(self, alpha: float):
+        self.alpha = alpha
+        self.latency = None
+        self.error_rate = 0.0
+        self.samples = 0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float, failed: bool):
+        with self._lock:
+            self.samples += 1
+            self.error_rate += self.alpha * ((1.0 if failed else 0.0) - self.error_rate)
+            if not failed:
+                self.latency = seconds if self.latency is None else self.latency + self.alpha * (seconds - self.latency)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'latency_ms': round(self.latency * 1000, 1) if self.latency is not None else None,
+            'error_rate': round(self.error_rate, 3),
+            'samples': self.samples,
+        }
+
+
+class ModelRouter:
+    """Orders an agent's candidate models by expected latency, errors and load"""
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        self.config = {**DEFAULTS, **(config or {})}
+        self._health: Dict[str, ModelHealth] = {}
+        self._lock = threading.Lock()
+
+    def _model_health(self, model: str) -> ModelHealth:
+        health = self._health.get(model)
+        if health is None:
+            with self._lock:
+                health = self._health.setdefault(model, ModelHealth(self.config['ALPHA']))
+        return health
+
+    def pool(self, agent) -> List[str]:
+        return list(self.config['POOLS'].get(type(agent).__name__) or [agent.default_model])
+
+    def observe(self, model: str, seconds: float, failed: bool):
+        self._model_health(model).observe(seconds, failed)
+
+    def expected_latency(self, agent, model: str) -> float:
+        """EWMA latency stretched by the calls already queued for the model.
+
+        Models without samples count as instant, so each gets tried early.
+        """
+        health = self._model_health(model)
+        latency = health.latency if health.latency is not None else 0.0
+        limit = get_limiter(agent.api_key, model)
+        queued = limit.in_flight + limit.waiting
+        return latency * (1 + queued / max(int(limit.limit), 1))
+
+    @staticmethod
+    def _preference(payload: Dict[str, Any]) -> str:
+        prefer = payload.get('prefer', 'balanced')
+        return prefer if prefer in PREFERENCES else 'balanced'
+
+    def routing_key(self, agent, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """What decides the models an unpinned request may be served by (part of cache and single-flight keys)"""
+        pool = self.pool(agent)
+        if len(pool) == 1:
+            return {'model': pool[0]}
+        return {'pool': pool, 'prefer': self._preference(payload)}
+
+    def route(self, agent, payload: Dict[str, Any]) -> List[str]:
+        """Models to try for a request, in order; an explicit 'model' is always honoured"""
+        if payload.get('model'):
+            return [payload['model']]
+        pool = self.pool(agent)
+        if not self.config['ENABLED'] or len(pool) == 1:
+            return pool
+
+        prefer = self._preference(payload)
+
+        def cost(rank, model):
+            health = self._model_health(model)
+            unhealthy = circuit_state(f"bytez:{model}") == 'open' or health.error_rate > self.config['MAX_ERROR_RATE']
+            if prefer == 'quality':
+                return (unhealthy, rank)
+            latency = self.expected_latency(agent, model) / (1 - min(health.error_rate, 0.9))
+            if prefer == 'balanced':
+                latency *= 1 + self.config['QUALITY_WEIGHT'] * rank
+            return (unhealthy, latency)
+
+        costs = {model: cost(rank, model) for rank, model in enumerate(pool)}
+        ordered = sorted(pool, key=costs.get)
+        if prefer != 'quality' and random.random() < self.config['EXPLORE']:
+            # Includes models with a high error rate so they can recover, but never an open circuit
+            reachable = [model for model in ordered[1:] if circuit_state(f"bytez:{model}") != 'open']
+            if reachable:
+                explored = random.choice(reachable)
+                ordered.remove(explored)
+                ordered.insert(0, explored)
+        return ordered[:self.config['MAX_FALLBACKS'] + 1]
+
+    def stats(self) -> Dict[str, Any]:
+        return {model: health.stats() for model, health in list(self._health.items())}
+
+
+_router = None
+_router_lock = threading.Lock()
+
+
+def get_router() -> ModelRouter:
+    global _router
+    if _router is None:
+        with _router_lock:
+            if _router is None:
+                _router = ModelRouter(getattr(settings, 'AGENT_ROUTER', {}))
+    return _router
@@ -0,0 +1,239 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Dict, Any, Optional, Callable, Awaitable
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'ENABLED': True,
+    'SHARED_DIR': None,     # directory shared by worker processes on this host; None = in-process only
+    'WAIT_TIMEOUT': 120,    # seconds a follower waits for another process before running itself
+    'POLL_INTERVAL': 0.1,
+    'RESULT_TTL': 5,        # seconds a finished result stays readable for late followers
+}
+
+
+class _LeaderGone(Exception):
+    """The leader was cancelled before producing a result"""
+
+
+class _SharedStore:
+    """Leader election and result hand-off between processes through a local directory.
+
+    The lock file is created with O_EXCL, so exactly one process becomes leader
+    for a key; the result is written atomically next to it, stamped with the
+    generation the leader wrote into its lock, so followers only accept the
+    result of the call they waited for.
+    """
+
+    def __init__(self, directory: str, wait_timeout: float, poll_interval: float, result_ttl: float):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.wait_timeout = wait_timeout
+        self.poll_interval = poll_interval
+        self.result_ttl = result_ttl
+        self._published = 0
+
+    def _paths(self, key: str):
+        return self.directory / f"{key}.lock", self.directory / f"{key}.json"
+
+    def try_lead(self, key: str) -> Optional[str]:
+        """The generation of the call this process now leads, or None if another process leads"""
+        lock_path, _ = self._paths(key)
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            # A crashed leader leaves its lock behind; take over once it is stale
+            try:
+                if time.time() - lock_path.stat().st_mtime > self.wait_timeout:
+                    lock_path.unlink()
+                    return self.try_lead(key)
+            except FileNotFoundError:
+                return self.try_lead(key)
+            return None
+        generation = f"{os.getpid()}-{uuid.uuid4().hex}"
+        with os.fdopen(fd, 'w') as lock_file:
+            lock_file.write(generation)
+        return generation
+
+    def generation(self, key: str) -> Optional[str]:
+        """Generation of the call currently leading `key` (None if none, or not written yet)"""
+        lock_path, _ = self._paths(key)
+        try:
+            return lock_path.read_text() or None
+        except FileNotFoundError:
+            return None
+
+    def publish(self, key: str, generation: str, result: Dict[str, Any]):
+        lock_path, result_path = self._paths(key)
+        tmp_path = result_path.with_suffix(f".{os.getpid()}.tmp")
+        try:
+            # Stamped so followers of a later call never take this result for theirs
+            tmp_path.write_text(json.dumps({'generation': generation, 'result': result}))
+            os.replace(tmp_path, result_path)
+        except (TypeError, ValueError, OSError) as e:
+            logger.warning(f"Could not share single-flight result: {str(e)}")
+        self.release(key)
+
+        self._published += 1
+        if self._published % 100 == 0:
+            self.sweep()
+
+    def sweep(self):
+        """Remove results nobody came back for"""
+        cutoff = time.time() - self.result_ttl
+        for path in self.directory.glob('*.json'):
+            try:
+                if path.stat().st_mtime < cutoff:
+                    path.unlink()
+            except FileNotFoundError:
+                pass
+
+    def release(self, key: str):
+        lock_path, _ = self._paths(key)
+        try:
+            lock_path.unlink()
+        except FileNotFoundError:
+            pass
+
+    def read(self, key: str, generation: str) -> Optional[Dict[str, Any]]:
+        """The result published by the call `generation`, if it is there yet"""
+        _, result_path = self._paths(key)
+        try:
+            if time.time() - result_path.stat().st_mtime > self.result_ttl:
+                result_path.unlink()
+                return None
+            published = json.loads(result_path.read_text())
+        except (FileNotFoundError, ValueError):
+            return None
+        return published['result'] if published.get('generation') == generation else None
+
+    def is_locked(self, key: str) -> bool:
+        lock_path, _ = self._paths(key)
+        return lock_path.exists()
+
+
+class SingleFlight:
+    """Coalesce identical concurrent agent calls so only one reaches the provider"""
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        self.config = {**DEFAULTS, **(config or {})}
+        self.enabled = bool(self.config['ENABLED'])
+        self.shared = None
+        if self.config['SHARED_DIR']:
+            self.shared = _SharedStore(
+                self.config['SHARED_DIR'],
+                self.config['WAIT_TIMEOUT'],
+                self.config['POLL_INTERVAL'],
+                self.config['RESULT_TTL'],
+            )
+        # concurrent.futures so followers on any thread or event loop can await the leader
+        self._calls: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.followers = 0
+        self.shared_followers = 0
+        self.shared_timeouts = 0
+
+    async def do(self, key: str, func: Callable[[], Awaitable[Dict[str, Any]]]):
+        """Run func once per key at a time; returns (result, coalesced)"""
+        if not self.enabled:
+            return await func(), False
+
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._calls[key] = future
+                self.leaders += 1
+            else:
+                self.followers += 1
+
+        if not leader:
+            try:
+                return dict(await asyncio.wrap_future(future)), True
+            except _LeaderGone:
+                return await self.do(key, func)
+
+        try:
+            result, coalesced = await self._lead(key, func)
+            future.set_result(result)
+            return result, coalesced
+        except asyncio.CancelledError:
+            future.set_exception(_LeaderGone())
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+
+    async def _lead(self, key: str, func):
+        if self.shared is None:
+            return await func(), False
+
+        deadline = time.monotonic() + self.config['WAIT_TIMEOUT']
+        generation = self.shared.try_lead(key)
+        while generation is None:
+            # Another process leads; the result is written before its lock is removed
+            leader = None
+            while True:
+                locked = self.shared.is_locked(key)
+                leader = leader or self.shared.generation(key)
+                result = self.shared.read(key, leader) if leader else None
+                if result is not None:
+                    with self._lock:
+                        self.shared_followers += 1
+                    return result, True
+                if not locked:
+                    break  # the leader failed without a result, compete again
+                if time.monotonic() > deadline:
+                    with self._lock:
+                        self.shared_timeouts += 1
+                    return await func(), False
+                await asyncio.sleep(self.config['POLL_INTERVAL'])
+            generation = self.shared.try_lead(key)
+
+        try:
+            result = await func()
+        except BaseException:
+            self.shared.release(key)
+            raise
+        self.shared.publish(key, generation, result)
+        return result, False
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'shared': self.shared is not None,
+                'in_flight': len(self._calls),
+                'leaders': self.leaders,
+                'followers': self.followers,
+                'shared_followers': self.shared_followers,
+                'shared_timeouts': self.shared_timeouts,
+            }
+
+
+_single_flight = None
+_single_flight_lock = threading.Lock()
+
+
+def get_single_flight() -> SingleFlight:
+    global _single_flight
+    if _single_flight is None:
+        with _single_flight_lock:
+            if _single_flight is None:
+                _single_flight = SingleFlight(getattr(settings, 'AGENT_SINGLE_FLIGHT', {}))
+    return _single_flight
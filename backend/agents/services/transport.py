@@ -0,0 +1,259 @@
+import asyncio
+import logging
+import os
+import threading
+import weakref
+from typing import Dict, Any, Optional, Tuple
+from urllib.parse import urlsplit
+
+import requests
+from asgiref.sync import AsyncToSync
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+
+try:
+    import httpx
+    HTTPX_AVAILABLE = True
+except ImportError:
+    HTTPX_AVAILABLE = False
+
+try:
+    import h2  # noqa: F401
+    H2_AVAILABLE = True
+except ImportError:
+    H2_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'POOL_CONNECTIONS': 10,     # number of hosts kept in the pool manager
+    'POOL_MAXSIZE': 50,         # connections kept per host
+    'POOL_BLOCK': True,         # wait for a free connection instead of opening extras
+    'POOL_TIMEOUT': 10,         # seconds to wait for a free connection
+    'KEEPALIVE_EXPIRY': 60,     # idle seconds before an async connection is dropped
+    'CONNECT_TIMEOUT': 5,
+    'READ_TIMEOUT': 30,
+    'HTTP2': False,
+}
+
+
+class _HostStats:
+    def __init__(self, maxsize: int):
+        self.slots = threading.BoundedSemaphore(maxsize)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.hits = 0
+        self.waits = 0
+        self.in_flight = 0
+        self.errors = 0
+
+
+class HTTPTransport:
+    """Process-wide pooled HTTP transport shared by every agent.
+
+    Sync calls go through one requests.Session with per-host keep-alive pools,
+    async calls through one httpx.AsyncClient per long-lived event loop (the
+    ASGI server's), closed when that loop shuts down.
+    """
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        self.config = {**DEFAULTS, **(config or {})}
+        self.http2 = bool(self.config['HTTP2'])
+        if self.http2 and not H2_AVAILABLE:
+            logger.warning("AGENT_TRANSPORT['HTTP2'] is set but h2 is not installed. Run: pip install httpx[http2]")
+            self.http2 = False
+
+        self._adapter = HTTPAdapter(
+            pool_connections=self.config['POOL_CONNECTIONS'],
+            pool_maxsize=self.config['POOL_MAXSIZE'],
+            pool_block=self.config['POOL_BLOCK'],
+        )
+        self._session = requests.Session()
+        self._session.mount('https://', self._adapter)
+        self._session.mount('http://', self._adapter)
+
+        self._async_clients = weakref.WeakKeyDictionary()
+        self._hosts: Dict[str, _HostStats] = {}
+        self._lock = threading.Lock()
+
+    def timeout(self, read: Optional[float] = None) -> Tuple[float, float]:
+        """(connect, read) timeout pair; read falls back to the configured default"""
+        return (self.config['CONNECT_TIMEOUT'], read if read is not None else self.config['READ_TIMEOUT'])
+
+    def _host_stats(self, url: str) -> _HostStats:
+        host = urlsplit(url).netloc
+        stats = self._hosts.get(host)
+        if stats is None:
+            with self._lock:
+                stats = self._hosts.setdefault(host, _HostStats(self.config['POOL_MAXSIZE']))
+        return stats
+
+    def _acquire(self, stats: _HostStats):
+        if not stats.slots.acquire(blocking=False):
+            with stats.lock:
+                stats.waits += 1
+            if not stats.slots.acquire(timeout=self.config['POOL_TIMEOUT']):
+                raise requests.exceptions.ConnectionError("Timed out waiting for a pooled connection")
+        with stats.lock:
+            stats.requests += 1
+            stats.in_flight += 1
+
+    def _release(self, stats: _HostStats, failed: bool):
+        with stats.lock:
+            stats.in_flight -= 1
+            if failed:
+                stats.errors += 1
+        stats.slots.release()
+
+    def request(self, method: str, url: str, timeout: Optional[float] = None, **kwargs) -> requests.Response:
+        """Blocking request over the shared keep-alive pool"""
+        stats = self._host_stats(url)
+        self._acquire(stats)
+        failed = True
+        try:
+            response = self._session.request(method, url, timeout=self.timeout(timeout), **kwargs)
+            failed = False
+            return response
+        finally:
+            self._release(stats, failed)
+
+    def async_pooling(self) -> bool:
+        """Whether async requests on the running loop can reuse connections between calls.
+
+        async_to_sync (async views under WSGI/runserver) runs every call on a
+        new loop and closes it afterwards, so a client there would never reuse
+        a connection; callers should use request() through run_blocking instead.
+        """
+        if not HTTPX_AVAILABLE:
+            return False
+        return asyncio.get_running_loop() not in getattr(AsyncToSync, 'loop_thread_executors', {})
+
+    async def _get_async_client(self):
+        loop = asyncio.get_running_loop()
+        entry = self._async_clients.get(loop)
+        if entry is None:
+            client = httpx.AsyncClient(
+                http2=self.http2,
+                limits=httpx.Limits(
+                    max_connections=self.config['POOL_MAXSIZE'],
+                    max_keepalive_connections=self.config['POOL_MAXSIZE'],
+                    keepalive_expiry=self.config['KEEPALIVE_EXPIRY'],
+                ),
+            )
+            # Started async generators are closed by loop.shutdown_asyncgens(), which
+            # asyncio.run() and the ASGI servers call before closing the loop
+            closer = self._close_with_loop(weakref.ref(loop), client)
+            await closer.__anext__()
+            entry = self._async_clients[loop] = (client, closer)
+        return entry[0]
+
+    async def _close_with_loop(self, loop_ref, client):
+        try:
+            yield
+        finally:
+            loop = loop_ref()
+            if loop is not None:
+                self._async_clients.pop(loop, None)
+            await client.aclose()
+
+    def _has_idle_connection(self, client, url: str) -> bool:
+        # httpx does not expose pool state publicly; this is best effort
+        pool = getattr(getattr(client, '_transport', None), '_pool', None)
+        host = urlsplit(url).hostname or ''
+        for connection in getattr(pool, 'connections', []):
+            origin = getattr(getattr(connection, '_origin', None), 'host', b'')
+            if origin.decode('ascii', 'ignore') == host and connection.is_idle():
+                return True
+        return False
+
+    async def arequest(self, method: str, url: str, timeout: Optional[float] = None, **kwargs):
+        """Non-blocking request over the per-loop httpx pool"""
+        client = await self._get_async_client()
+        stats = self._host_stats(url)
+        connect, read = self.timeout(timeout)
+        with stats.lock:
+            stats.requests += 1
+            if stats.in_flight >= self.config['POOL_MAXSIZE']:
+                stats.waits += 1
+            elif self._has_idle_connection(client, url):
+                stats.hits += 1
+            stats.in_flight += 1
+        failed = True
+        try:
+            response = await client.request(
+                method, url,
+                timeout=httpx.Timeout(read, connect=connect, pool=self.config['POOL_TIMEOUT']),
+                **kwargs
+            )
+            failed = False
+            return response
+        finally:
+            with stats.lock:
+                stats.in_flight -= 1
+                if failed:
+                    stats.errors += 1
+
+    def _sync_pool_stats(self) -> Dict[str, Dict[str, int]]:
+        pools = {}
+        container = getattr(self._adapter.poolmanager.pools, '_container', {})
+        for pool in list(container.values()):
+            idle = sum(1 for conn in list(pool.pool.queue) if conn is not None and conn.sock is not None) if pool.pool else 0
+            pools[pool.host if pool.port in (80, 443, None) else f"{pool.host}:{pool.port}"] = {
+                'connections_opened': pool.num_connections,
+                'requests': pool.num_requests,
+                'idle_connections': idle,
+            }
+        return pools
+
+    def stats(self) -> Dict[str, Any]:
+        """Per-host pool statistics for monitoring"""
+        sync_pools = self._sync_pool_stats()
+        hosts = {}
+        for host, stats in list(self._hosts.items()):
+            pool = sync_pools.get(host, {})
+            # urllib3 counts every request and every new connection, the difference are reuses
+            sync_hits = max(pool.get('requests', 0) - pool.get('connections_opened', 0), 0)
+            with stats.lock:
+                hosts[host] = {
+                    'requests': stats.requests,
+                    'hits': stats.hits + sync_hits,
+                    'waits': stats.waits,
+                    'in_flight': stats.in_flight,
+                    'errors': stats.errors,
+                    'open_connections': stats.in_flight + pool.get('idle_connections', 0),
+                }
+        return {
+            'pool_maxsize': self.config['POOL_MAXSIZE'],
+            'http2': self.http2,
+            'async_clients': len(self._async_clients),
+            'hosts': hosts,
+        }
+
+    def close(self):
+        """Close the sync pool; async clients close with their event loop"""
+        self._session.close()
+
+
+_transport = None
+_transport_lock = threading.Lock()
+
+
+def get_transport() -> HTTPTransport:
+    """Return the process-wide transport, creating it on first use"""
+    global _transport
+    if _transport is None:
+        with _transport_lock:
+            if _transport is None:
+                _transport = HTTPTransport(getattr(settings, 'AGENT_TRANSPORT', {}))
+    return _transport
+
+
+def _reset_after_fork():
+    # Pooled sockets must not be shared between a pre-forking parent and its workers
+    global _transport, _transport_lock
+    _transport = None
+    _transport_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
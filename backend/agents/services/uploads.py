@@ -0,0 +1,260 @@
+import asyncio
+import logging
+import os
+import tempfile
+import threading
+import uuid
+from contextlib import contextmanager
+from typing import Dict, Any, Iterator, AsyncIterator, Optional
+
+from django.conf import settings
+from django.core.files.uploadhandler import StopUpload, TemporaryFileUploadHandler
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'MAX_BYTES': 25 * 1024 * 1024,  # largest accepted upload
+    'CHUNK_SIZE': 256 * 1024,       # bytes held in memory per read/write while spooling and sending
+    'FILE_FIELD': 'audio',          # multipart field carrying the file
+    'TIMEOUT': 120,                 # provider read timeout for uploads
+}
+
+
+def get_config() -> Dict[str, Any]:
+    return {**DEFAULTS, **getattr(settings, 'AGENT_UPLOADS', {})}
+
+
+class UploadTooLarge(Exception):
+    """The request body is larger than AGENT_UPLOADS['MAX_BYTES']"""
+
+
+class UploadStats:
+    """Process-wide upload counters, including bytes currently buffered in memory"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.uploads = 0
+        self.rejected = 0
+        self.bytes_received = 0
+        self.bytes_sent = 0
+        self.buffered = 0
+        self.peak_buffered = 0
+        self.peak_request_buffered = 0
+
+    def hold(self, size: int):
+        with self._lock:
+            self.buffered += size
+            self.peak_buffered = max(self.peak_buffered, self.buffered)
+
+    def release(self, size: int):
+        with self._lock:
+            self.buffered -= size
+
+    def finish(self, meter: 'UploadMeter'):
+        with self._lock:
+            self.uploads += 1
+            self.bytes_received += meter.received
+            self.bytes_sent += meter.sent
+            self.peak_request_buffered = max(self.peak_request_buffered, meter.peak)
+
+    def reject(self):
+        with self._lock:
+            self.rejected += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'uploads': self.uploads,
+                'rejected': self.rejected,
+                'bytes_received': self.bytes_received,
+                'bytes_sent': self.bytes_sent,
+                'buffered_bytes': self.buffered,
+                'peak_buffered_bytes': self.peak_buffered,
+                'peak_request_buffered_bytes': self.peak_request_buffered,
+            }
+
+
+_upload_stats = UploadStats()
+
+
+def get_upload_stats() -> UploadStats:
+    return _upload_stats
+
+
+class UploadMeter:
+    """Memory accounting for one upload: bytes buffered now and at most, bytes moved"""
+
+    def __init__(self):
+        self.buffered = 0
+        self.peak = 0
+        self.received = 0
+        self.sent = 0
+
+    @contextmanager
+    def hold(self, size: int):
+        self.buffered += size
+        self.peak = max(self.peak, self.buffered)
+        _upload_stats.hold(size)
+        try:
+            yield
+        finally:
+            self.buffered -= size
+            _upload_stats.release(size)
+
+
+class SpooledUpload:
+    """An uploaded file on local disk plus the form fields sent with it"""
+
+    def __init__(self, path: str, filename: str, content_type: str, size: int,
+                 fields: Dict[str, Any], meter: UploadMeter, uploaded_file=None):
+        self.path = path
+        self.filename = filename
+        self.content_type = content_type
+        self.size = size
+        self.fields = fields
+        self.meter = meter
+        self._uploaded_file = uploaded_file
+
+    def close(self):
+        """Delete the spooled file and account for the finished upload"""
+        if self._uploaded_file is not None:
+            self._uploaded_file.close()  # TemporaryUploadedFile removes itself
+        elif os.path.exists(self.path):
+            os.remove(self.path)
+        _upload_stats.finish(self.meter)
+        logger.info(
+            f"Upload {self.filename}: {self.meter.received} bytes spooled, {self.meter.sent} sent, "
+            f"peak {self.meter.peak} bytes in memory"
+        )
+
+
+class LimitedUploadHandler(TemporaryFileUploadHandler):
+    """Writes multipart file parts straight to a temp file, stopping at max_bytes"""
+
+    def __init__(self, request, meter: UploadMeter, max_bytes: int, chunk_size: int):
+        super().__init__(request)
+        self.meter = meter
+        self.max_bytes = max_bytes
+        self.chunk_size = chunk_size
+        self.too_large = False
+
+    def receive_data_chunk(self, raw_data, start):
+        if start + len(raw_data) > self.max_bytes:
+            self.too_large = True
+            raise StopUpload(connection_reset=True)
+        self.meter.received += len(raw_data)
+        with self.meter.hold(len(raw_data)):
+            return super().receive_data_chunk(raw_data, start)
+
+
+def receive_upload(request, config: Optional[Dict[str, Any]] = None) -> SpooledUpload:
+    """Spool a request's file to disk without reading it into memory (blocking).
+
+    multipart/form-data takes the file from FILE_FIELD and options from the
+    other form fields; any other content type is the raw file, with options in
+    the query string and an optional X-Filename header.
+    """
+    config = config or get_config()
+    max_bytes = config['MAX_BYTES']
+    content_length = request.headers.get('Content-Length')
+    if content_length and content_length.isdigit() and int(content_length) > max_bytes:
+        _upload_stats.reject()
+        raise UploadTooLarge(f"Upload exceeds {max_bytes} bytes")
+
+    meter = UploadMeter()
+    if request.content_type == 'multipart/form-data':
+        handler = LimitedUploadHandler(request, meter, max_bytes, config['CHUNK_SIZE'])
+        request.upload_handlers = [handler]
+        uploaded = request.FILES.get(config['FILE_FIELD'])
+        if handler.too_large:
+            _upload_stats.reject()
+            raise UploadTooLarge(f"Upload exceeds {max_bytes} bytes")
+        if uploaded is None:
+            raise ValueError(f"Missing file field: {config['FILE_FIELD']}")
+        return SpooledUpload(
+            uploaded.temporary_file_path(), uploaded.name, uploaded.content_type or 'application/octet-stream',
+            uploaded.size, request.POST.dict(), meter, uploaded_file=uploaded,
+        )
+
+    spool = tempfile.NamedTemporaryFile(delete=False, suffix='.upload', dir=settings.FILE_UPLOAD_TEMP_DIR)
+    try:
+        with spool:
+            while True:
+                with meter.hold(config['CHUNK_SIZE']):
+                    chunk = request.read(config['CHUNK_SIZE'])
+                    if not chunk:
+                        break
+                    meter.received += len(chunk)
+                    if meter.received > max_bytes:
+                        _upload_stats.reject()
+                        raise UploadTooLarge(f"Upload exceeds {max_bytes} bytes")
+                    spool.write(chunk)
+    except BaseException:
+        os.remove(spool.name)
+        raise
+    if not meter.received:
+        os.remove(spool.name)
+        raise ValueError("Empty upload")
+    return SpooledUpload(
+        spool.name, os.path.basename(request.headers.get('X-Filename', '')) or 'upload',
+        request.content_type or 'application/octet-stream', meter.received, request.GET.dict(), meter,
+    )
+
+
+def _quote(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\r', '').replace('\n', '')
+
+
+class MultipartBody:
+    """multipart/form-data request body that streams the file from disk.
+
+    Its length is known up front, so it goes out with a Content-Length rather
+    than chunked encoding; iterate it for requests, use aiter() for httpx.
+    """
+
+    def __init__(self, fields: Dict[str, Any], file_field: str, upload: SpooledUpload, chunk_size: int):
+        boundary = uuid.uuid4().hex
+        parts = []
+        for name, value in fields.items():
+            parts.append(
+                f'--{boundary}\r\nContent-Disposition: form-data; name="{_quote(str(name))}"\r\n\r\n{value}\r\n'
+            )
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{_quote(file_field)}"; '
+            f'filename="{_quote(upload.filename)}"\r\nContent-Type: {upload.content_type}\r\n\r\n'
+        )
+        self._head = ''.join(parts).encode('utf-8')
+        self._tail = f'\r\n--{boundary}--\r\n'.encode('ascii')
+        self.upload = upload
+        self.chunk_size = chunk_size
+        self.content_type = f'multipart/form-data; boundary={boundary}'
+
+    def __len__(self) -> int:
+        return len(self._head) + os.path.getsize(self.upload.path) + len(self._tail)
+
+    def __iter__(self) -> Iterator[bytes]:
+        yield self._head
+        meter = self.upload.meter
+        with open(self.upload.path, 'rb') as f:
+            while True:
+                with meter.hold(self.chunk_size):
+                    chunk = f.read(self.chunk_size)
+                    if not chunk:
+                        break
+                    meter.sent += len(chunk)
+                    yield chunk
+        yield self._tail
+
+    async def aiter(self) -> AsyncIterator[bytes]:
+        loop = asyncio.get_running_loop()
+        yield self._head
+        meter = self.upload.meter
+        with open(self.upload.path, 'rb') as f:
+            while True:
+                with meter.hold(self.chunk_size):
+                    chunk = await loop.run_in_executor(None, f.read, self.chunk_size)
+                    if not chunk:
+                        break
+                    meter.sent += len(chunk)
+                    yield chunk
+        yield self._tail
@@ -0,0 +1,11 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Agent
+from .services.catalog import get_catalog
+
+
+@receiver(post_save, sender=Agent)
+@receiver(post_delete, sender=Agent)
+def invalidate_catalog(sender, **kwargs):
+    get_catalog().invalidate()
@@ -1,3 +1,434 @@
-from django.test import TestCase
+import asyncio
+import json
+import tempfile
+import threading
+import uuid
+from datetime import timedelta
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from aihub.compression import compression_middleware, get_config as compression_config
+from tenants.models import QuotaAllowance
+from .models import Agent, AgentJob
+from .services import AgentFactory
+from .services.base_agent import BaseAgent
+from .services.bytez_agents.text_agent import BytezSDKAgent, BytezTextAgent
+from .services.cache import ResponseCache
+from .services.catalog import search_agents
+from .services.conversations import ConversationStore, get_config as conversation_config
+from .services.jobs import claim_jobs, heartbeat, requeue_stale_jobs, run_job
+from .services.pipeline import get_step_cache
+from .services.limiter import get_limiter, ConcurrencyLimitExceeded
+from .services.resilience import circuit_state, get_policy, resilience_stats
+from .services.router import get_router
+from .services.singleflight import SingleFlight
+from .services.transport import HTTPTransport
+
+
+class _EchoAgent(BaseAgent):
+    def process(self, payload):
+        return self._make_request('echo', payload)
+
+
+def _saturated_limiter(api_key, model):
+    """A limiter for `model` with its only slot taken and no room to queue"""
+    config = {'INITIAL': 1, 'MIN': 1, 'MAX': 1, 'MAX_QUEUE': 0, 'QUEUE_TIMEOUT': 0.01, 'MODELS': {}}
+    with override_settings(AGENT_CONCURRENCY=config):
+        limit = get_limiter(api_key, model)
+    limit.acquire()
+    return limit
+
+
+class LocalSaturationTests(SimpleTestCase):
+    """Our own limiter turning calls away must not look like a failing provider"""
+
+    def setUp(self):
+        self.model = f"test/{uuid.uuid4().hex}"
+        self.agent = _EchoAgent('key', f"https://{uuid.uuid4().hex}.test")
+        self.url = f"{self.agent.base_url}/echo"
+        self.limit = _saturated_limiter('key', self.model)
+        self.addCleanup(self.limit.release, 'neutral')
+
+    @mock.patch('agents.services.base_agent.get_transport')
+    def test_rejections_never_open_the_breaker(self, transport):
+        retries = get_policy(self.agent).retries
+        for _ in range(10):
+            result = self.agent._make_request('echo', {'model': self.model})
+            self.assertIn('concurrency', result['error'])
+        transport.return_value.request.assert_not_called()
+        self.assertEqual(circuit_state(self.url), 'closed')
+        self.assertEqual(get_policy(self.agent).retries, retries)
+
+    @mock.patch('agents.services.base_agent.get_transport')
+    def test_async_rejections_never_open_the_breaker(self, transport):
+        async def calls():
+            return [await self.agent._amake_request('echo', {'model': self.model}) for _ in range(10)]
+
+        transport.return_value.async_pooling.return_value = True
+        for result in asyncio.run(calls()):
+            self.assertIn('concurrency', result['error'])
+        transport.return_value.arequest.assert_not_called()
+        self.assertEqual(circuit_state(self.url), 'closed')
+
+    @override_settings(BYTEZ_API_KEY='key')
+    def test_sdk_rejections_never_open_the_breaker(self):
+        agent = BytezTextAgent()
+        with mock.patch.object(agent, '_get_model') as get_model:
+            for _ in range(10):
+                with self.assertRaises(ConcurrencyLimitExceeded):
+                    agent._run_model(self.model, 'hi', {'max_new_tokens': 8})
+        get_model.assert_not_called()
+        self.assertEqual(circuit_state(f"bytez:{self.model}"), 'closed')
+
+
+class StaleJobTests(TestCase):
+    def _running_job(self, started_ago, heartbeat_ago, attempts=1, **fields):
+        now = timezone.now()
+        return AgentJob.objects.create(
+            agent_name='image-generator', status=AgentJob.STATUS_RUNNING, worker='host:1', attempts=attempts,
+            started_at=now - timedelta(seconds=started_ago),
+            heartbeat_at=None if heartbeat_ago is None else now - timedelta(seconds=heartbeat_ago),
+            **fields
+        )
+
+    def test_slow_job_with_fresh_heartbeat_is_left_running(self):
+        job = self._running_job(started_ago=3600, heartbeat_ago=10)
+        self.assertEqual(requeue_stale_jobs(600, 3), 0)
+        job.refresh_from_db()
+        self.assertEqual(job.status, AgentJob.STATUS_RUNNING)
+
+    def test_job_without_heartbeat_is_requeued(self):
+        job = self._running_job(started_ago=3600, heartbeat_ago=900)
+        legacy = self._running_job(started_ago=3600, heartbeat_ago=None)
+        self.assertEqual(requeue_stale_jobs(600, 3), 2)
+        for stale in (job, legacy):
+            stale.refresh_from_db()
+            self.assertEqual((stale.status, stale.worker), (AgentJob.STATUS_QUEUED, ''))
+
+    def test_heartbeat_keeps_a_claimed_job_alive(self):
+        AgentJob.objects.create(agent_name='image-generator')
+        job, = claim_jobs('host:1', 1)
+        AgentJob.objects.filter(pk=job.pk).update(heartbeat_at=timezone.now() - timedelta(seconds=900))
+        self.assertEqual(heartbeat('host:2', [job.pk]), 0)  # only the claiming worker beats
+        self.assertEqual(heartbeat('host:1', [job.pk]), 1)
+        self.assertEqual(requeue_stale_jobs(600, 3), 0)
+
+    def test_lost_job_out_of_attempts_fails_and_refunds(self):
+        QuotaAllowance.objects.create(subject='anon:lost', agent_name='image-generator', used=1, limit=3)
+        job = self._running_job(started_ago=3600, heartbeat_ago=900, attempts=3, quota_subject='anon:lost')
+        requeue_stale_jobs(600, 3)
+        job.refresh_from_db()
+        self.assertEqual(job.status, AgentJob.STATUS_FAILED)
+        self.assertEqual(QuotaAllowance.objects.get(subject='anon:lost').used, 0)
+
+
+@mock.patch('payments.usage.get_usage_recorder')
+class JobRefundTests(TestCase):
+    def setUp(self):
+        QuotaAllowance.objects.create(subject='anon:job', agent_name='image-generator', used=1, limit=3)
+        AgentJob.objects.create(agent_name='image-generator', quota_subject='anon:job')
+        self.job, = claim_jobs('host:1', 1)
+
+    def _run(self, **process):
+        agent = mock.Mock(**{f'process.{key}': value for key, value in process.items()})
+        with mock.patch('agents.services.jobs.AgentFactory.get_agent', return_value=agent):
+            run_job(self.job, max_attempts=1)
+        self.job.refresh_from_db()
+        return QuotaAllowance.objects.get(subject='anon:job').used
+
+    def test_provider_error_refunds_allowance(self, recorder):
+        self.assertEqual(self._run(return_value={'error': 'fetch failed'}), 0)
+        self.assertEqual(self.job.status, AgentJob.STATUS_FAILED)
+
+    def test_final_crash_refunds_allowance(self, recorder):
+        with self.assertLogs('agents.services.jobs', 'ERROR'):
+            self.assertEqual(self._run(side_effect=RuntimeError('boom')), 0)
+        self.assertEqual(self.job.status, AgentJob.STATUS_FAILED)
+
+    def test_success_keeps_the_charge(self, recorder):
+        self.assertEqual(self._run(return_value={'success': True, 'output': 'ok'}), 1)
+        self.assertEqual(self.job.status, AgentJob.STATUS_SUCCEEDED)
+
+
+class AsyncTransportTests(SimpleTestCase):
+    def test_client_is_closed_when_its_loop_shuts_down(self):
+        transport = HTTPTransport()
+
+        async def use_client():
+            self.assertTrue(transport.async_pooling())
+            client = await transport._get_async_client()
+            self.assertIs(await transport._get_async_client(), client)
+            return client
+
+        client = asyncio.run(use_client())
+        self.assertTrue(client.is_closed)
+        self.assertEqual(transport.stats()['async_clients'], 0)
+
+    def test_throwaway_loops_use_the_sync_pool(self):
+        async def pooling():
+            return HTTPTransport().async_pooling()
+
+        # How Django runs async views under WSGI/runserver
+        self.assertFalse(async_to_sync(pooling)())
+
+
+class _StreamAgent(BytezTextAgent):
+    resilience = {'RETRIES': 0}
+
+
+@override_settings(BYTEZ_API_KEY='key')
+class RoutedStreamTests(SimpleTestCase):
+    def setUp(self):
+        self.agent = _StreamAgent()
+        self.failing, self.healthy = f"test/{uuid.uuid4().hex}", f"test/{uuid.uuid4().hex}"
+        replies = {self.failing: SimpleNamespace(error='fetch failed', output=None), self.healthy: iter(['hel', 'lo'])}
+        self.agent._get_model = lambda name: mock.Mock(**{'run.return_value': replies[name]})
+
+    def test_stream_fails_over_and_counts_the_failure(self):
+        with mock.patch.object(get_router(), 'route', return_value=[self.failing, self.healthy]):
+            events = list(self.agent.stream({'prompt': 'hi'}))
+
+        self.assertEqual(''.join(data['text'] for event, data in events if event == 'token'), 'hello')
+        self.assertEqual(events[-1], ('done', {"success": True, "model": self.healthy, "provider": "Bytez"}))
+        breakers = resilience_stats()['breakers']
+        self.assertEqual(breakers[f"bytez:{self.failing}"]['failures'], 1)
+        self.assertEqual(breakers[f"bytez:{self.healthy}"]['failures'], 0)
+        for model in (self.failing, self.healthy):
+            self.assertEqual(get_limiter('key', model).in_flight, 0)
+
+    def test_open_circuit_is_skipped(self):
+        with mock.patch.object(get_router(), 'route', return_value=[self.failing]):
+            for _ in range(get_policy(self.agent).config['BREAKER_THRESHOLD']):
+                list(self.agent.stream({'prompt': 'hi'}))
+            event, data = list(self.agent.stream({'prompt': 'hi'}))[-1]
+        self.assertEqual(event, 'error')
+        self.assertIn('temporarily unavailable', data['error'])
+
+
+@override_settings(BYTEZ_API_KEY='key')
+class RoutedCacheKeyTests(SimpleTestCase):
+    def test_unpinned_requests_are_keyed_by_pool(self):
+        agent = BytezTextAgent()
+        with mock.patch.object(get_router(), 'pool', return_value=['a/one', 'b/two']):
+            unpinned = agent.cache_key_parts({'prompt': 'hi', 'temperature': 0})
+            fast = agent.cache_key_parts({'prompt': 'hi', 'temperature': 0, 'prefer': 'fast'})
+        pinned = agent.cache_key_parts({'prompt': 'hi', 'temperature': 0, 'model': 'a/one'})
+
+        self.assertEqual((unpinned['pool'], unpinned['prefer']), (['a/one', 'b/two'], 'balanced'))
+        self.assertNotIn('model', unpinned)
+        self.assertEqual(fast['prefer'], 'fast')
+        self.assertEqual(pinned['model'], 'a/one')
+
+
+class CatalogPublishingTests(TestCase):
+    def test_new_agents_are_unlisted_until_published(self):
+        Agent.objects.create(name='Draft agent')
+        listed = [entry['id'] for entry in search_agents(limit=50)[0]]
+        self.assertCountEqual(listed, AgentFactory.get_available_agents())
+
+
+@mock.patch('agents.views._record_usage')
+class PipelineCrashTests(TestCase):
+    definition = {'steps': [
+        {'id': 'draft', 'agent': 'writer', 'payload': {'prompt': '{{input.topic}}'}},
+        {'id': 'polish', 'agent': 'writer', 'payload': {'prompt': '{{draft.output}}'}},
+    ], 'input': {'topic': 'tea'}}
+
+    def setUp(self):
+        cache.clear()
+
+    def _post(self, **definition):
+        """POST the pipeline with every agent call crashing; returns (status, body)"""
+        crash = mock.AsyncMock(side_effect=RuntimeError('boom'))
+        with mock.patch.object(get_step_cache(), 'invoke', crash), self.assertLogs('agents.views', 'ERROR'):
+            response = self.client.post('/api/agents/pipelines/', {**self.definition, **definition},
+                                        content_type='application/json')
+            if response.streaming:
+                return response.status_code, b''.join(async_to_sync(self._drain)(response)).decode()
+            return response.status_code, response.content.decode()
+
+    @staticmethod
+    async def _drain(response):
+        return [chunk async for chunk in response.streaming_content]
+
+    def test_crash_returns_json_and_refunds_every_step(self, record_usage):
+        status, body = self._post()
+        self.assertEqual(status, 500)
+        self.assertEqual(json.loads(body)['error'], 'Pipeline failed')
+        self.assertEqual(QuotaAllowance.objects.get(agent_name='writer').used, 0)
+
+    def test_streamed_crash_ends_with_an_error_event(self, record_usage):
+        status, body = self._post(stream=True)
+        self.assertIn('event: error', body)
+        self.assertEqual(QuotaAllowance.objects.get(agent_name='writer').used, 0)
+
+
+@override_settings(BYTEZ_API_KEY='key')
+class CacheTemperatureTests(SimpleTestCase):
+    def test_non_numeric_temperature_is_not_cached(self):
+        response_cache = ResponseCache({'ENABLED': True})
+        agent = AgentFactory.get_agent('writer')
+        for temperature in ('hot', [0], {'t': 0}, 'nan'):
+            payload = {'prompt': 'hi', 'model': 'a/one', 'temperature': temperature}
+            self.assertIsNone(response_cache.key_for('writer', agent, payload))
+            self.assertIsNone(get_step_cache().key_for('writer', payload))
+
+    def test_numeric_strings_are_compared_as_numbers(self):
+        response_cache = ResponseCache({'ENABLED': True})
+        agent = AgentFactory.get_agent('writer')
+        self.assertIsNotNone(response_cache.key_for('writer', agent, {'prompt': 'hi', 'model': 'a/one', 'temperature': '0'}))
+        self.assertIsNone(response_cache.key_for('writer', agent, {'prompt': 'hi', 'model': 'a/one', 'temperature': '0.9'}))
+
+
+@override_settings(BYTEZ_API_KEY='key')
+class ConversationTurnTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.store = ConversationStore({**conversation_config(), 'LOCK_WAIT': 0.2})
+        patcher = mock.patch('agents.services.bytez_agents.chat_agent.get_conversation_store', return_value=self.store)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.agent = AgentFactory.get_agent('chat-bot')
+        self.conversation_id, state, lock = self.store.open(None)
+        self.store.save(self.conversation_id, state)
+        self.store.release(self.conversation_id, lock)
+
+    def _turn(self, prompt, reply):
+        with mock.patch.object(BytezTextAgent, 'process', return_value=reply):
+            return self.agent.process({'prompt': prompt, 'conversation_id': self.conversation_id})
+
+    def test_concurrent_turns_are_serialized(self):
+        entered, resume = threading.Event(), threading.Event()
+
+        def slow_reply(payload):
+            entered.set()
+            resume.wait(5)
+            return {'success': True, 'output': 'first reply'}
+
+        with mock.patch.object(BytezTextAgent, 'process', side_effect=slow_reply):
+            first = threading.Thread(target=self.agent.process, args=({'prompt': 'one', 'conversation_id': self.conversation_id},))
+            first.start()
+            entered.wait(5)
+            busy = self._turn('two', {'success': True, 'output': 'second reply'})
+            self.assertIn('busy', busy['error'])
+            resume.set()
+            first.join(5)
+        second = self._turn('two', {'success': True, 'output': 'second reply'})
+
+        self.assertEqual(second['turn'], 2)
+        state = cache.get(self.store._key(self.conversation_id))
+        self.assertEqual([user for user, _ in state['turns']], ['one', 'two'])
+
+    def test_summary_fold_survives_a_failed_turn(self):
+        state = {'summary': '', 'turns': [[f'q{n}', f'a{n}'] for n in range(10)], 'count': 10}
+        self.store.save(self.conversation_id, state)
+        with mock.patch.object(self.agent, '_summarize', return_value='They talked about tea'):
+            result = self._turn('more', {'error': 'fetch failed'})
+
+        self.assertEqual(result['error'], 'fetch failed')
+        state = cache.get(self.store._key(self.conversation_id))
+        self.assertEqual(state['summary'], 'They talked about tea')
+        self.assertEqual(len(state['turns']), conversation_config()['WINDOW_TURNS'])
+        self.assertIsNotNone(self.store.open(self.conversation_id)[2])  # the failed turn let go of the lock
+
+
+class AsyncCompressionTests(SimpleTestCase):
+    def _compress(self, size):
+        async def view(request):
+            return HttpResponse(b'[' + b'1,' * (size // 2) + b'1]', content_type='application/json')
+
+        threads = []
+        gzip_encode = mock.Mock(side_effect=lambda data: threads.append(threading.get_ident()) or data[:10])
+        with mock.patch('aihub.compression._encoders', return_value={'gzip': gzip_encode}):
+            middleware = compression_middleware(view)
+        request = RequestFactory().get('/api/agents/', HTTP_ACCEPT_ENCODING='gzip')
+
+        async def call():
+            return await middleware(request), threading.get_ident()
+
+        response, loop_thread = asyncio.run(call())
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        return threads[0] != loop_thread
+
+    def test_large_bodies_are_compressed_off_the_event_loop(self):
+        self.assertTrue(self._compress(compression_config()['OFFLOAD_BYTES']))
+
+    def test_small_bodies_are_compressed_inline(self):
+        self.assertFalse(self._compress(compression_config()['MIN_BYTES'] * 2))
+
+
+class SDKAgentHookTests(SimpleTestCase):
+    def test_agents_without_generation_hooks_cannot_be_built(self):
+        class Partial(BytezSDKAgent):
+            def _prompt_parts(self, payload):
+                return '', payload['prompt']
+
+        with self.assertRaisesRegex(TypeError, '_format_output.*_generation_params|_generation_params.*_format_output'):
+            Partial()
+        for name in AgentFactory.get_available_agents():
+            AgentFactory.get_agent(name)  # every shipped agent implements its hooks
+
+
+class SingleFlightTests(SimpleTestCase):
+    def _call(self, calls, started=None, release=None):
+        async def generate():
+            calls.append(1)
+            if started:
+                started.set()
+            await (release.wait() if release else asyncio.sleep(0.01))
+            return {'success': True, 'output': 'shared'}
+        return generate
+
+    def test_identical_concurrent_calls_run_once(self):
+        flight, calls = SingleFlight(), []
+
+        async def burst():
+            return await asyncio.gather(*(flight.do('key', self._call(calls)) for _ in range(5)))
+
+        results = asyncio.run(burst())
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(sorted(coalesced for _, coalesced in results), [False, True, True, True, True])
+        self.assertTrue(all(result == {'success': True, 'output': 'shared'} for result, _ in results))
+        self.assertEqual(flight.stats()['in_flight'], 0)
+
+    def test_follower_runs_itself_when_the_leader_is_cancelled(self):
+        flight, calls = SingleFlight(), []
+
+        async def scenario():
+            started, release = asyncio.Event(), asyncio.Event()
+            leader = asyncio.ensure_future(flight.do('key', self._call(calls, started, release)))
+            await started.wait()
+            follower = asyncio.ensure_future(flight.do('key', self._call(calls)))
+            await asyncio.sleep(0)
+            leader.cancel()
+            return await follower
+
+        result, coalesced = asyncio.run(scenario())
+        self.assertEqual((len(calls), coalesced), (2, False))
+        self.assertEqual(result['output'], 'shared')
+
+    def test_processes_share_results_through_the_directory(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        config = {'SHARED_DIR': directory.name, 'POLL_INTERVAL': 0.01}
+        first, second, calls = SingleFlight(config), SingleFlight(config), []
+
+        async def scenario():
+            started, release = asyncio.Event(), asyncio.Event()
+            leader = asyncio.ensure_future(first.do('key', self._call(calls, started, release)))
+            await started.wait()
+            follower = asyncio.ensure_future(second.do('key', self._call(calls)))
+            await asyncio.sleep(0.05)
+            release.set()
+            return await leader, await follower
+
+        (_, led_coalesced), (result, coalesced) = asyncio.run(scenario())
+        self.assertEqual(len(calls), 1)
+        self.assertEqual((led_coalesced, coalesced), (False, True))
+        self.assertEqual(second.stats()['shared_followers'], 1)
@@ -3,6 +3,15 @@ from . import views
 
 urlpatterns = [
     path('', views.AgentListView.as_view(), name='agent-list'),
+    path('stats/', views.agent_stats, name='agent-stats'),
+    path('batch/', views.call_agents_batch, name='agent-batch'),
+    path('pipelines/', views.run_pipeline, name='agent-pipelines'),
+    path('audio/<str:filename>', views.serve_audio, name='agent-audio'),
+    path('images/<str:image_id>/<str:variant>', views.serve_image, name='agent-image'),
     path('<str:agent_name>/call/', views.call_agent, name='call-agent'),
+    path('<str:agent_name>/stream/', views.stream_agent, name='stream-agent'),
+    path('<str:agent_name>/transcriptions/', views.transcribe_audio, name='agent-transcriptions'),
     path('<str:agent_name>/details/', views.get_agent_details, name='agent-details'),
+    path('<str:agent_name>/jobs/', views.create_agent_job, name='agent-jobs'),
+    path('<str:agent_name>/jobs/<uuid:job_id>/', views.get_agent_job, name='agent-job'),
 ]
@@ -1,68 +1,167 @@
-from django.http import JsonResponse
+from django.http import FileResponse, HttpResponse, HttpResponseRedirect, JsonResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
 from django.views.decorators.csrf import csrf_exempt
-from django.views.decorators.http import require_POST
+from django.views.decorators.http import require_POST, require_GET, require_safe
+from django.conf import settings
 from django.views import View
+from asgiref.sync import sync_to_async
+import asyncio
 import json
+import logging
+import time
 import requests
+from payments.usage import get_usage_recorder, estimate_tokens
+from tenants.quotas import check_quota, refund_quota
+from aihub.compression import compression_stats
+from users.authentication import authenticate_request, auth_cache_stats
+from .models import AgentJob
 from .services import AgentFactory
+from .services.image_store import get_image_store
+from .services.audio_cache import get_audio_cache, byte_range, FileSlice, RangeNotSatisfiable, CONTENT_TYPES
+from .services.base_agent import run_blocking
+from .services.cache import get_response_cache
+from .services.catalog import get_catalog, InvalidCursor
+from .services.conversations import get_conversation_store
+from .services.invocation import invoke_agent
+from .services.jobs import submit_job, serialize_job
+from .services.pipeline import Pipeline, PipelineError, get_step_cache
+from .services.rendering import agent_response, compact, dumps, response_format
+from .services.prompting import get_prompt_assembler
+from .services.singleflight import get_single_flight
+from .services.limiter import limiter_stats
+from .services.transport import get_transport
+from .services.resilience import resilience_stats
+from .services.router import get_router
+from .services.uploads import receive_upload, UploadTooLarge, get_upload_stats
+
+logger = logging.getLogger(__name__)
+
+def _catalog_response(request, entry):
+    """Pre-serialized catalog bytes with a strong ETag; 304 when the client's copy is current"""
+    body, etag = entry
+    response = HttpResponse(body, content_type='application/json')
+    response['ETag'] = etag
+    response['Cache-Control'] = getattr(settings, 'AGENT_CATALOG_CACHE_CONTROL', 'public, max-age=60')
+    return get_conditional_response(request, etag=etag, response=response)
 
 # List all agents (for GET /api/agents/)
 class AgentListView(View):
     def get(self, request):
-        # Get available agents from factory
-        available_agents = AgentFactory.get_available_agents()
-        
-        agents = []
-        for agent_name in available_agents:
-            agent_info = AgentFactory.get_agent_info(agent_name)
-            if agent_info:
-                agents.append({
-                    'id': agent_name,
-                    'name': agent_info['name'],
-                    'description': agent_info['description'],
-                    'category': agent_info['category'],
-                    'models': agent_info.get('models', []),
-                    'price': 9.99,  # You can make this dynamic
-                    'rating': 4.8,
-                    'downloads': 1250,
-                    'icon': agent_info['category'].split()[0],
-                    'created_at': '2024-01-01T00:00:00Z'
-                })
-        
-        print(f"Backend returning {len(agents)} agents")
-        return JsonResponse(agents, safe=False)
+        # ?q=&category=&sort=popular|rating|newest|relevance&cursor=&limit=
+        params = request.GET
+        try:
+            limit = int(params['limit']) if params.get('limit') else None
+            entry = get_catalog().agent_list(
+                query=params.get('q', '').strip(),
+                category=params.get('category', ''),
+                sort=params.get('sort', ''),
+                cursor=params.get('cursor', ''),
+                limit=limit,
+            )
+        except ValueError as e:
+            return JsonResponse({"error": str(e) if isinstance(e, InvalidCursor) else "Invalid 'limit'"}, status=400)
+        return _catalog_response(request, entry)
+
+def _enforce_quota(request, agent_name):
+    """Count the call against the caller's server-side quota (runs in a worker thread)"""
+    return check_quota(request, agent_name, authenticate_request(request))
+
+def _quota_exceeded(quota):
+    response = JsonResponse({
+        "error": "Quota exceeded",
+        "message": quota.reason
+    }, status=429)
+    if quota.retry_after:
+        response['Retry-After'] = str(quota.retry_after)
+    return response
+
+def _record_usage(quota, agent_name, payload, result, elapsed, cached=False, completion_chars=None):
+    """Queue a billing event; the write happens later in a batch"""
+    failed = not isinstance(result, dict) or bool(result.get('error'))
+    if not isinstance(result, dict):
+        result = {}
+    if completion_chars is None:
+        completion_tokens = estimate_tokens(result.get('output') or result.get('text'))
+    else:
+        completion_tokens = max(1, completion_chars // 4) if completion_chars else 0
+    get_usage_recorder().record(
+        user_id=quota.user_id,
+        workspace_id=quota.workspace_id,
+        agent_name=agent_name,
+        model=str(result.get('model') or payload.get('model') or ''),
+        prompt_tokens=estimate_tokens(payload.get('prompt') or payload.get('task') or payload.get('text')),
+        completion_tokens=completion_tokens,
+        latency_ms=int(elapsed * 1000),
+        status='error' if failed else ('cached' if cached else 'success'),
+    )
+
+def _provider_error(error_msg):
+    """Map a provider error to a friendlier (body, status), or None to pass the result through"""
+    message, error_msg = str(error_msg), str(error_msg).lower()
+    if error_msg.startswith('invalid request: '):
+        return {"error": "Invalid request", "message": message[len('invalid request: '):]}, 400
+    elif 'context window' in error_msg:
+        return {"error": "Input too long", "message": message}, 413
+    elif 'concurrency' in error_msg:
+        return {
+            "error": "Rate limit exceeded",
+            "message": "Too many requests. Please wait a moment and try again, or consider upgrading your Bytez account for higher rate limits."
+        }, 429
+    elif 'upgrade' in error_msg:
+        return {
+            "error": "Model access restricted",
+            "message": "This model requires a paid Bytez account. Please upgrade your account or try a different model."
+        }, 402
+    elif 'fetch failed' in error_msg:
+        return {
+            "error": "API connection error",
+            "message": "Unable to connect to the AI service. Please try again later."
+        }, 502
+    elif error_msg.startswith('conversation busy'):
+        return {"error": "Conversation busy", "message": message}, 409
+    elif 'temporarily unavailable' in error_msg:
+        return {
+            "error": "Service unavailable",
+            "message": "The AI service is failing right now. Please try again in a few seconds."
+        }, 503
+    return None
+
+def _bypass_cache(request):
+    cache_control = request.headers.get('Cache-Control', '').lower()
+    return 'no-cache' in cache_control or 'no-store' in cache_control
 
 # Call a single agent (POST /api/agents/<id>/call/)
 @csrf_exempt
 @require_POST
-def call_agent(request, agent_name):
+async def call_agent(request, agent_name):
     try:
         request_data = json.loads(request.body) if request.body else {}
         
-        # Use the agent factory
-        agent = AgentFactory.create_agent(agent_name)
-        result = agent.process(request_data)
+        # Unknown agents 404 before any quota is spent
+        AgentFactory.get_agent(agent_name)
+        quota = await sync_to_async(_enforce_quota)(request, agent_name)
+        if not quota.allowed:
+            return _quota_exceeded(quota)
+        
+        # Shared agent instance behind the response cache; the provider call runs without holding a worker
+        invocation = await invoke_agent(agent_name, request_data, bypass_cache=_bypass_cache(request))
+        result = invocation.result
+        _record_usage(quota, agent_name, request_data, result, invocation.elapsed, cached=invocation.cache_status == 'HIT')
         
         # Check if there's an error in the result and provide better feedback
         if isinstance(result, dict) and result.get('error'):
-            error_msg = result['error']
-            if 'concurrency' in error_msg.lower():
-                return JsonResponse({
-                    "error": "Rate limit exceeded",
-                    "message": "Too many requests. Please wait a moment and try again, or consider upgrading your Bytez account for higher rate limits."
-                }, status=429)
-            elif 'upgrade' in error_msg.lower():
-                return JsonResponse({
-                    "error": "Model access restricted",
-                    "message": "This model requires a paid Bytez account. Please upgrade your account or try a different model."
-                }, status=402)
-            elif 'fetch failed' in error_msg.lower():
-                return JsonResponse({
-                    "error": "API connection error",
-                    "message": "Unable to connect to the AI service. Please try again later."
-                }, status=502)
+            await sync_to_async(refund_quota)(quota)
+            provider_error = _provider_error(result['error'])
+            if provider_error:
+                body, status = provider_error
+                return JsonResponse(body, status=status)
         
-        return JsonResponse(result)
+        response = agent_response(request, result)
+        if invocation.cache_status:
+            response['X-Agent-Cache'] = invocation.cache_status
+        if invocation.coalesced:
+            response['X-Agent-Coalesced'] = '1'
+        return response
         
     except ValueError as e:
         return JsonResponse({"error": str(e)}, status=404)
@@ -78,26 +177,435 @@ def call_agent(request, agent_name):
             "message": str(e)
         }, status=500)
 
+async def _sse_events(events, on_finish=None):
+    """Turn an agent's blocking (event, data) iterator into Server-Sent Events.
+    
+    on_finish(final_data, streamed_chars) is called once the stream ends.
+    """
+    final, streamed_chars = {"error": "Stream closed before completion"}, 0
+    pending = None
+    try:
+        while True:
+            # Shielded, so a disconnect mid-chunk leaves the worker's next() to finish on its own
+            pending = asyncio.ensure_future(run_blocking(next, events, None))
+            item = await asyncio.shield(pending)
+            if item is None:
+                break
+            event, data = item
+            if event == 'token':
+                streamed_chars += len(data.get('text', ''))
+            else:
+                final = data
+            yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+    finally:
+        try:
+            # close() raises while a worker thread is still inside next()
+            if pending is not None and not pending.done():
+                await asyncio.wait([pending])
+            # Stops the provider stream if the client disconnects early
+            await run_blocking(events.close)
+        except Exception:
+            logger.exception("Could not close agent stream")
+        finally:
+            if on_finish:
+                on_finish(final, streamed_chars)
+
+# Stream tokens as they are generated (POST /api/agents/<id>/stream/)
+@csrf_exempt
+@require_POST
+async def stream_agent(request, agent_name):
+    try:
+        request_data = json.loads(request.body) if request.body else {}
+    except ValueError:
+        return JsonResponse({"error": "Invalid JSON body"}, status=400)
+    
+    try:
+        agent = AgentFactory.get_agent(agent_name)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=404)
+    
+    if not agent.supports_streaming:
+        return JsonResponse({"error": f"Agent {agent_name} does not support streaming"}, status=400)
+    
+    quota = await sync_to_async(_enforce_quota)(request, agent_name)
+    if not quota.allowed:
+        return _quota_exceeded(quota)
+    
+    started = time.monotonic()
+    def on_finish(final, streamed_chars):
+        _record_usage(quota, agent_name, request_data, final, time.monotonic() - started, completion_chars=streamed_chars)
+    
+    response = StreamingHttpResponse(_sse_events(agent.stream(request_data), on_finish), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Keep reverse proxies from buffering the stream
+    return response
+
+# Speech to text from an uploaded file (POST /api/agents/<id>/transcriptions/)
+# multipart/form-data with an 'audio' file part, or the raw audio as the body
+@csrf_exempt
+@require_POST
+async def transcribe_audio(request, agent_name):
+    try:
+        agent = AgentFactory.get_agent(agent_name)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=404)
+    
+    if not hasattr(agent, 'atranscribe_file'):
+        return JsonResponse({"error": f"Agent {agent_name} does not accept audio uploads"}, status=400)
+    
+    quota = await sync_to_async(_enforce_quota)(request, agent_name)
+    if not quota.allowed:
+        return _quota_exceeded(quota)
+    
+    try:
+        upload = await sync_to_async(receive_upload)(request)
+    except UploadTooLarge as e:
+        await sync_to_async(refund_quota)(quota)
+        return JsonResponse({"error": "Upload too large", "message": str(e)}, status=413)
+    except ValueError as e:
+        await sync_to_async(refund_quota)(quota)
+        return JsonResponse({"error": str(e)}, status=400)
+    
+    started = time.monotonic()
+    try:
+        result = await agent.atranscribe_file(upload)
+    finally:
+        await run_blocking(upload.close)
+    _record_usage(quota, agent_name, upload.fields, result, time.monotonic() - started)
+    
+    if isinstance(result, dict) and result.get('error'):
+        await sync_to_async(refund_quota)(quota)
+        provider_error = _provider_error(result['error'])
+        if provider_error:
+            body, status = provider_error
+            return JsonResponse(body, status=status)
+    return agent_response(request, result)
+
+BATCH_DEFAULTS = {
+    'MAX_ITEMS': 50,
+    'PARALLELISM': 8,   # default and upper bound for concurrent items in one batch
+}
+
+def _enforce_batch_quota(request, agent_names):
+    """Authenticate once and count every item against the caller's quota"""
+    user = authenticate_request(request)
+    return [check_quota(request, name, user) for name in agent_names]
+
+def _parse_batch_item(index, item):
+    """(agent_name, payload, rejection) where rejection is a finished error entry or None"""
+    if not isinstance(item, dict) or not isinstance(item.get('agent'), str) or not isinstance(item.get('payload', {}), dict):
+        return None, None, {'index': index, 'status': 400, 'error': "Each item needs an 'agent' name and a 'payload' object"}
+    if item['agent'] not in AgentFactory.get_available_agents():
+        return item['agent'], None, {'index': index, 'agent': item['agent'], 'status': 404, 'error': f"Unknown agent: {item['agent']}"}
+    return item['agent'], item.get('payload') or {}, None
+
+async def _run_batch_item(index, agent_name, payload, quota, semaphore, bypass_cache):
+    """One batch entry in the same shape as a /call/ response, never raising"""
+    entry = {'index': index, 'agent': agent_name}
+    if not quota.allowed:
+        return {**entry, 'status': 429, 'error': "Quota exceeded", 'message': quota.reason}
+    
+    async with semaphore:
+        try:
+            invocation = await invoke_agent(agent_name, payload, bypass_cache=bypass_cache)
+        except Exception as e:
+            await sync_to_async(refund_quota)(quota)
+            return {**entry, 'status': 500, 'error': "Internal server error", 'message': str(e)}
+    
+    result = invocation.result
+    _record_usage(quota, agent_name, payload, result, invocation.elapsed, cached=invocation.cache_status == 'HIT')
+    if isinstance(result, dict) and result.get('error'):
+        await sync_to_async(refund_quota)(quota)
+        provider_error = _provider_error(result['error'])
+        if provider_error:
+            body, status = provider_error
+            return {**entry, 'status': status, **body}
+    entry.update(status=200, result=result)
+    if invocation.cache_status:
+        entry['cache'] = invocation.cache_status
+    return entry
+
+async def _ndjson_results(coroutines, shape):
+    """Yield batch entries as they finish; cancels what is left if the client goes away"""
+    # Started here so they belong to the loop that serves the stream (not the view's, which
+    # is gone by then under WSGI) and only once the client starts reading
+    tasks = [asyncio.ensure_future(coroutine) for coroutine in coroutines]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            entry = await next_done
+            yield dumps(compact(entry) if shape == 'compact' else entry) + b"\n"
+    finally:
+        for task in tasks:
+            task.cancel()
+
+# Run several agent calls in one request (POST /api/agents/batch/)
+@csrf_exempt
+@require_POST
+async def call_agents_batch(request):
+    config = {**BATCH_DEFAULTS, **getattr(settings, 'AGENT_BATCH', {})}
+    try:
+        request_data = json.loads(request.body) if request.body else {}
+    except ValueError:
+        return JsonResponse({"error": "Invalid JSON body"}, status=400)
+    
+    items = request_data.get('items') if isinstance(request_data, dict) else None
+    if not isinstance(items, list) or not items:
+        return JsonResponse({"error": "Request body needs a non-empty 'items' list"}, status=400)
+    if len(items) > config['MAX_ITEMS']:
+        return JsonResponse({"error": f"A batch can hold at most {config['MAX_ITEMS']} items"}, status=400)
+    
+    try:
+        parallelism = int(request_data.get('parallelism') or config['PARALLELISM'])
+    except (TypeError, ValueError):
+        return JsonResponse({"error": "'parallelism' must be an integer"}, status=400)
+    parallelism = max(1, min(parallelism, config['PARALLELISM']))
+    
+    parsed = [_parse_batch_item(index, item) for index, item in enumerate(items)]
+    runnable = [index for index, (_, _, rejection) in enumerate(parsed) if rejection is None]
+    quotas = await sync_to_async(_enforce_batch_quota)(request, [parsed[index][0] for index in runnable])
+    quota_by_index = dict(zip(runnable, quotas))
+    
+    semaphore = asyncio.Semaphore(parallelism)
+    bypass_cache = _bypass_cache(request)
+    
+    async def rejected(entry):
+        return entry
+    
+    coroutines = []
+    for index, (agent_name, payload, rejection) in enumerate(parsed):
+        if rejection:
+            coroutines.append(rejected(rejection))
+        else:
+            coroutines.append(_run_batch_item(index, agent_name, payload, quota_by_index[index], semaphore, bypass_cache))
+    
+    stream = bool(request_data.get('stream')) or 'application/x-ndjson' in request.headers.get('Accept', '')
+    if stream:
+        response = StreamingHttpResponse(_ndjson_results(coroutines, response_format(request)), content_type='application/x-ndjson')
+        response['X-Accel-Buffering'] = 'no'
+        return response
+    
+    results = await asyncio.gather(*coroutines)
+    return agent_response(request, {'results': results})
+
+def _refund_quotas(quotas):
+    for quota in quotas:
+        refund_quota(quota)
+
+_PIPELINE_FAILED = {"error": "Pipeline failed", "message": "An unexpected error stopped the pipeline. Unfinished steps were not charged."}
+
+async def _pipeline_sse(pipeline, inputs, bypass_cache, on_step, quota_by_step):
+    """Server-Sent Events for each step as it starts/finishes, then the summary"""
+    summary = None
+    try:
+        async for event, data in pipeline.events(inputs, bypass_cache, on_step):
+            if event == 'done':
+                summary = data
+            yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+    except Exception:
+        logger.exception("Pipeline failed")
+        yield f"event: error\ndata: {json.dumps(_PIPELINE_FAILED)}\n\n"
+    finally:
+        steps = summary['steps'] if summary else {}
+        unfinished = [quota for step_id, quota in quota_by_step.items() if steps.get(step_id) != 'completed']
+        await sync_to_async(_refund_quotas)(unfinished)
+
+# Run a DAG of agent steps in one request (POST /api/agents/pipelines/)
+@csrf_exempt
+@require_POST
+async def run_pipeline(request):
+    try:
+        request_data = json.loads(request.body) if request.body else {}
+    except ValueError:
+        return JsonResponse({"error": "Invalid JSON body"}, status=400)
+    
+    try:
+        pipeline = Pipeline(request_data)
+    except PipelineError as e:
+        return JsonResponse({"error": "Invalid pipeline", "message": str(e)}, status=400)
+    inputs = request_data.get('input') or {}
+    if not isinstance(inputs, dict):
+        return JsonResponse({"error": "'input' must be an object"}, status=400)
+    
+    # Every step counts as one call; nothing runs unless all of them fit in the quota
+    quotas = await sync_to_async(_enforce_batch_quota)(request, [pipeline.steps[step_id].agent for step_id in pipeline.order])
+    denied = next((quota for quota in quotas if not quota.allowed), None)
+    if denied:
+        await sync_to_async(_refund_quotas)([quota for quota in quotas if quota.allowed])
+        return _quota_exceeded(denied)
+    quota_by_step = dict(zip(pipeline.order, quotas))
+    
+    def on_step(step, payload, invocation):
+        _record_usage(quota_by_step[step.id], step.agent, payload, invocation.result, invocation.elapsed,
+                      cached=invocation.cache_status == 'HIT')
+    
+    bypass_cache = _bypass_cache(request)
+    stream = bool(request_data.get('stream')) or 'text/event-stream' in request.headers.get('Accept', '')
+    if stream:
+        response = StreamingHttpResponse(
+            _pipeline_sse(pipeline, inputs, bypass_cache, on_step, quota_by_step), content_type='text/event-stream'
+        )
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+    
+    events = []
+    summary = None
+    try:
+        summary = await pipeline.run(inputs, lambda event, data: events.append({'event': event, **data}), bypass_cache, on_step)
+    except Exception:
+        logger.exception("Pipeline failed")
+        return JsonResponse(_PIPELINE_FAILED, status=500)
+    finally:
+        steps = summary['steps'] if summary else {}
+        unfinished = [quota for step_id, quota in quota_by_step.items() if steps.get(step_id) != 'completed']
+        await sync_to_async(_refund_quotas)(unfinished)
+    return agent_response(request, {**summary, 'events': events})
+
+# Queue a long-running call for `manage.py run_agent_jobs` (POST /api/agents/<id>/jobs/)
+@csrf_exempt
+@require_POST
+def create_agent_job(request, agent_name):
+    try:
+        request_data = json.loads(request.body) if request.body else {}
+    except ValueError:
+        return JsonResponse({"error": "Invalid JSON body"}, status=400)
+    if not isinstance(request_data, dict):
+        return JsonResponse({"error": "Request body must be a JSON object"}, status=400)
+    
+    if agent_name not in AgentFactory.get_available_agents():
+        return JsonResponse({"error": f"Unknown agent: {agent_name}"}, status=404)
+    
+    quota = _enforce_quota(request, agent_name)
+    if not quota.allowed:
+        return _quota_exceeded(quota)
+    
+    job = submit_job(agent_name, request_data, user_id=quota.user_id, workspace_id=quota.workspace_id,
+                     quota_subject=quota.subject if quota.allowance_consumed else '')
+    response = JsonResponse(serialize_job(job), status=202)
+    response['Location'] = request.build_absolute_uri(f"{job.id}/")
+    return response
+
+# Poll a queued call (GET /api/agents/<id>/jobs/<job_id>/)
+@require_GET
+def get_agent_job(request, agent_name, job_id):
+    try:
+        job = AgentJob.objects.get(pk=job_id, agent_name=agent_name)
+    except AgentJob.DoesNotExist:
+        return JsonResponse({"error": "Job not found"}, status=404)
+    
+    # Jobs submitted while signed in are only visible to their owner
+    if job.user_id is not None:
+        user = authenticate_request(request)
+        if user is None or user.pk != job.user_id:
+            return JsonResponse({"error": "Job not found"}, status=404)
+    
+    response = agent_response(request, serialize_job(job))
+    if job.status in (AgentJob.STATUS_QUEUED, AgentJob.STATUS_RUNNING):
+        response['Retry-After'] = '2'
+    return response
+
 # Get agent details
 @csrf_exempt
+@require_GET
 def get_agent_details(request, agent_name):
-    try:
-        agent_info = AgentFactory.get_agent_info(agent_name)
-        if not agent_info:
-            return JsonResponse({"error": "Agent not found"}, status=404)
-        
-        return JsonResponse({
-            'id': agent_name,
-            'name': agent_info['name'],
-            'description': agent_info['description'],
-            'category': agent_info['category'],
-            'models': agent_info.get('models', []),
-            'capabilities': agent_info.get('capabilities', []),
-            'pricing': agent_info.get('pricing', {}),
-        })
-        
-    except Exception as e:
-        return JsonResponse({
-            "error": "Internal server error", 
-            "message": str(e)
-        }, status=500)
+    entry = get_catalog().agent_details(agent_name)
+    if entry is None:
+        return JsonResponse({"error": "Agent not found"}, status=404)
+    return _catalog_response(request, entry)
+
+# Cached text-to-speech audio (GET /api/agents/audio/<sha256>.<format>), with Range support for seeking
+@require_safe
+def serve_audio(request, filename):
+    cache = get_audio_cache()
+    path = cache.path(filename) if cache else None
+    if path is None:
+        return JsonResponse({"error": "Audio not found"}, status=404)
+    
+    config = cache.config
+    etag = f'"{filename}"'
+    content_type = CONTENT_TYPES.get(filename.rsplit('.', 1)[-1], 'application/octet-stream')
+    # Checked before the file is opened
+    not_modified = get_conditional_response(request, etag=etag)
+    if not_modified is not None:
+        not_modified['ETag'] = etag
+        not_modified['Cache-Control'] = config['CACHE_CONTROL']
+        return not_modified
+    
+    if config['SENDFILE_HEADER']:
+        # The front-end server streams the file and handles Range itself
+        response = HttpResponse(content_type=content_type)
+        response[config['SENDFILE_HEADER']] = f"{config['SENDFILE_PREFIX']}{filename}"
+    else:
+        size = path.stat().st_size
+        if_range = request.headers.get('If-Range')
+        try:
+            span = byte_range(request.headers.get('Range', ''), size) if if_range in (None, etag) else None
+        except RangeNotSatisfiable:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f"bytes */{size}"
+            return response
+        audio_file = open(path, 'rb')
+        if span is None:
+            # Whole file: WSGI servers can send it with sendfile()
+            response = FileResponse(audio_file, content_type=content_type)
+        else:
+            start, end = span
+            audio_file.seek(start)
+            response = FileResponse(FileSlice(audio_file, end - start + 1), status=206, content_type=content_type)
+            response['Content-Length'] = str(end - start + 1)
+            response['Content-Range'] = f"bytes {start}-{end}/{size}"
+        response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Cache-Control'] = config['CACHE_CONTROL']
+    return response
+
+# Local copies of generated images (GET /api/agents/images/<id>/<original|thumb|medium>)
+@require_safe
+def serve_image(request, image_id, variant):
+    store = get_image_store()
+    ref = store.ref(image_id) if store else None
+    if ref is None:
+        return JsonResponse({"error": "Image not found"}, status=404)
+    
+    if ref['status'] != 'ready':
+        if not ref['source'].startswith(('http://', 'https://')):
+            return JsonResponse({"status": ref['status']}, status=202 if ref['status'] == 'pending' else 404)
+        # Still copying (or the copy failed): the provider URL works in the meantime
+        response = HttpResponseRedirect(ref['source'])
+        response['Cache-Control'] = 'no-store'
+        return response
+    
+    found = store.file(ref, variant)
+    if found is None:
+        return JsonResponse({"error": "Image not found"}, status=404)
+    path, content_type, etag = found
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = FileResponse(open(path, 'rb'), content_type=content_type)
+    response['ETag'] = etag
+    response['Cache-Control'] = store.config['CACHE_CONTROL']
+    return response
+
+# Runtime statistics for monitoring (GET /api/agents/stats/)
+@require_GET
+def agent_stats(request):
+    if not settings.DEBUG and not request.user.is_staff:
+        return JsonResponse({"error": "Forbidden"}, status=403)
+    
+    return JsonResponse({
+        'transport': get_transport().stats(),
+        'response_cache': get_response_cache().stats(),
+        'single_flight': get_single_flight().stats(),
+        'provider_concurrency': limiter_stats(),
+        'usage_recorder': get_usage_recorder().stats(),
+        'pipeline_step_cache': get_step_cache().stats(),
+        'resilience': resilience_stats(),
+        'model_router': get_router().stats(),
+        'auth_cache': auth_cache_stats(),
+        'uploads': get_upload_stats().stats(),
+        'audio_cache': get_audio_cache().stats() if get_audio_cache() else None,
+        'image_store': get_image_store().stats() if get_image_store() else None,
+        'prompt_budget': get_prompt_assembler().stats(),
+        'conversations': get_conversation_store().stats(),
+        'compression': compression_stats(),
+    })
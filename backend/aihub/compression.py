@@ -0,0 +1,158 @@
+import gzip
+import threading
+from typing import Dict, Any, Optional
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.decorators import sync_and_async_middleware
+
+try:
+    import brotli
+    BROTLI_AVAILABLE = True
+except ImportError:
+    BROTLI_AVAILABLE = False
+
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
+DEFAULTS = {
+    'ENABLED': True,
+    'MIN_BYTES': 1024,              # smaller bodies are sent as they are
+    'OFFLOAD_BYTES': 64 * 1024,     # async views compress bodies at least this big in a worker thread
+    'PATH_PREFIXES': ['/api/agents/'],
+    'CONTENT_TYPES': ['application/json', 'application/x-ndjson', 'text/plain'],
+    'ENCODINGS': ['zstd', 'br', 'gzip'],  # preferred first when the client rates them equally
+    'GZIP_LEVEL': 6,
+    'BROTLI_QUALITY': 5,
+    'ZSTD_LEVEL': 3,
+}
+
+
+def get_config() -> Dict[str, Any]:
+    return {**DEFAULTS, **getattr(settings, 'RESPONSE_COMPRESSION', {})}
+
+
+def _encoders(config: Dict[str, Any]):
+    encoders = {'gzip': lambda data: gzip.compress(data, compresslevel=config['GZIP_LEVEL'], mtime=0)}
+    if BROTLI_AVAILABLE:
+        encoders['br'] = lambda data: brotli.compress(data, quality=config['BROTLI_QUALITY'])
+    if ZSTD_AVAILABLE:
+        compressor = threading.local()
+
+        def zstd(data):
+            # ZstdCompressor instances are not thread-safe
+            if not hasattr(compressor, 'instance'):
+                compressor.instance = zstandard.ZstdCompressor(level=config['ZSTD_LEVEL'])
+            return compressor.instance.compress(data)
+        encoders['zstd'] = zstd
+    return {name: encoders[name] for name in config['ENCODINGS'] if name in encoders}
+
+
+def choose_encoding(accept_encoding: str, available) -> Optional[str]:
+    """Best coding in `available` (server preference order) by the client's q-values"""
+    weights = {}
+    for item in accept_encoding.lower().split(','):
+        name, _, params = item.strip().partition(';')
+        q = 1.0
+        params = params.strip().replace(' ', '')
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[name.strip()] = q
+    best, best_q = None, 0.0
+    for name in available:
+        q = weights.get(name, weights.get('*', 0.0))
+        if q > best_q:
+            best, best_q = name, q
+    return best
+
+
+class CompressionStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.by_encoding: Dict[str, Dict[str, float]] = {}
+
+    def record(self, encoding: str, raw: int, sent: int):
+        with self._lock:
+            entry = self.by_encoding.setdefault(encoding, {'responses': 0, 'bytes_in': 0, 'bytes_out': 0})
+            entry['responses'] += 1
+            entry['bytes_in'] += raw
+            entry['bytes_out'] += sent
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'available': ['gzip'] + (['br'] if BROTLI_AVAILABLE else []) + (['zstd'] if ZSTD_AVAILABLE else []),
+                'encodings': {name: dict(entry) for name, entry in self.by_encoding.items()},
+            }
+
+
+_stats = CompressionStats()
+
+
+def compression_stats() -> Dict[str, Any]:
+    return _stats.stats()
+
+
+@sync_and_async_middleware
+def compression_middleware(get_response):
+    """zstd/brotli/gzip for large API responses, whichever the client rates highest.
+
+    Like django.middleware.gzip.GZipMiddleware, but limited to PATH_PREFIXES
+    and CONTENT_TYPES; streamed responses (SSE, NDJSON, files) go out as they are.
+    Under ASGI, bodies of OFFLOAD_BYTES or more are compressed off the event loop.
+    """
+    config = get_config()
+    encoders = _encoders(config)
+
+    def encoding_for(request, response) -> Optional[str]:
+        """The coding to apply, or None to send the response as it is"""
+        if not config['ENABLED'] or response.streaming or response.has_header('Content-Encoding'):
+            return None
+        if not request.path.startswith(tuple(config['PATH_PREFIXES'])) or response.status_code in (206, 304):
+            return None
+        content_type = response.get('Content-Type', '').split(';')[0].strip()
+        if content_type not in config['CONTENT_TYPES'] or len(response.content) < config['MIN_BYTES']:
+            return None
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        return choose_encoding(request.headers.get('Accept-Encoding', ''), encoders)
+
+    def encode(response, encoding: str):
+        raw = response.content
+        encoded = encoders[encoding](raw)
+        if len(encoded) >= len(raw):
+            return response
+
+        response.content = encoded
+        response['Content-Length'] = str(len(encoded))
+        response['Content-Encoding'] = encoding
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            # The bytes differ from the identity encoding, so a strong validator no longer holds
+            response['ETag'] = f'W/{etag}'
+        _stats.record(encoding, len(raw), len(encoded))
+        return response
+
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            response = await get_response(request)
+            encoding = encoding_for(request, response)
+            if encoding is None:
+                return response
+            if len(response.content) < config['OFFLOAD_BYTES']:
+                return encode(response, encoding)
+            # Compressing a large body takes long enough to stall every other request on the loop
+            return await sync_to_async(encode, thread_sensitive=False)(response, encoding)
+    else:
+        def middleware(request):
+            response = get_response(request)
+            encoding = encoding_for(request, response)
+            return encode(response, encoding) if encoding else response
+    return middleware
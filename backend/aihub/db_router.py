@@ -0,0 +1,108 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Any, List, Optional
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils.decorators import sync_and_async_middleware
+
+DEFAULTS = {
+    'STICKY_SECONDS': 5,        # reads stay on the primary this long after a client writes (replica lag)
+    'COOKIE_NAME': 'db_primary',
+}
+
+
+def get_config() -> Dict[str, Any]:
+    return {**DEFAULTS, **getattr(settings, 'DATABASE_REPLICATION', {})}
+
+
+def replica_aliases() -> List[str]:
+    return [alias for alias in settings.DATABASES if alias != DEFAULT_DB_ALIAS]
+
+
+class RoutingState:
+    """Where the current request's reads go"""
+    __slots__ = ('replica', 'pinned', 'wrote')
+
+    def __init__(self, replica: Optional[str], pinned: bool = False):
+        self.replica = replica
+        self.pinned = pinned
+        self.wrote = False
+
+
+_state: ContextVar[Optional[RoutingState]] = ContextVar('db_routing_state', default=None)
+
+
+@contextmanager
+def use_primary():
+    """Send the reads inside the block to the primary (e.g. right after another process wrote)"""
+    token = _state.set(RoutingState(None, pinned=True))
+    try:
+        yield
+    finally:
+        _state.reset(token)
+
+
+class ReplicaRouter:
+    """Reads during a request go to one replica; everything else goes to the primary.
+
+    A request stays on the primary once it writes, while it is inside a
+    transaction, and for STICKY_SECONDS after the same client wrote (cookie
+    set by replica_routing_middleware), so clients always read their own
+    writes. Code outside a request (job workers, management commands) only
+    ever uses the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is None or state.pinned or state.replica is None:
+            return DEFAULT_DB_ALIAS
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.pinned = state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas mirror the primary, so objects from any alias can be related
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+@sync_and_async_middleware
+def replica_routing_middleware(get_response):
+    config = get_config()
+    aliases = replica_aliases()
+
+    def start(request):
+        state = RoutingState(
+            random.choice(aliases) if aliases else None,
+            pinned=config['COOKIE_NAME'] in request.COOKIES,
+        )
+        return state, _state.set(state)
+
+    def finish(response, state, token):
+        _state.reset(token)
+        if state.wrote and aliases:
+            response.set_cookie(
+                config['COOKIE_NAME'], '1', max_age=config['STICKY_SECONDS'], httponly=True, samesite='Lax'
+            )
+        return response
+
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            state, token = start(request)
+            return finish(await get_response(request), state, token)
+    else:
+        def middleware(request):
+            state, token = start(request)
+            return finish(get_response(request), state, token)
+    return middleware
@@ -51,6 +51,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
+    'aihub.db_router.replica_routing_middleware',
+    'aihub.compression.compression_middleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -66,7 +68,7 @@ AUTH_USER_MODEL = 'users.User'
 # REST Framework Configuration
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'users.authentication.CachedJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
@@ -79,7 +81,193 @@ SIMPLE_JWT = {
     'REFRESH_TOKEN_LIFETIME': timedelta(days=7),
     'ROTATE_REFRESH_TOKENS': True,
     'BLACKLIST_AFTER_ROTATION': True,
-    'UPDATE_LAST_LOGIN': True,
+    # Only used by simplejwt's token views; would write the user row on every token issue
+    'UPDATE_LAST_LOGIN': False,
+}
+
+# Per-process cache of authenticated users and revoked-token filter (users/authentication.py)
+AUTH_CACHE = {
+    'USER_TTL': 60,
+    'USER_MAX_ENTRIES': 10000,
+    'REVOCATION_REFRESH': 30,
+}
+
+# Agent provider HTTP transport (shared keep-alive pools, see agents/services/transport.py)
+AGENT_TRANSPORT = {
+    'POOL_CONNECTIONS': 10,
+    'POOL_MAXSIZE': int(os.getenv('AGENT_POOL_MAXSIZE', '50')),
+    'KEEPALIVE_EXPIRY': 60,
+    'CONNECT_TIMEOUT': 5,
+    'READ_TIMEOUT': 30,
+    'HTTP2': os.getenv('AGENT_HTTP2', 'false').lower() == 'true',
+}
+
+# Opt-in cache for deterministic agent responses (low temperature text/code calls)
+AGENT_RESPONSE_CACHE = {
+    'ENABLED': os.getenv('AGENT_RESPONSE_CACHE', 'false').lower() == 'true',
+    'TTL': 600,
+    'MAX_ENTRIES': 1000,
+    'MAX_TEMPERATURE': 0.3,
+    'AGENTS': {},
+}
+
+# Coalesce identical in-flight agent calls; SHARED_DIR extends this across worker processes
+AGENT_SINGLE_FLIGHT = {
+    'ENABLED': True,
+    'SHARED_DIR': os.getenv('AGENT_SINGLE_FLIGHT_DIR', str(BASE_DIR / 'var' / 'singleflight')),
+    'WAIT_TIMEOUT': 120,
+    'POLL_INTERVAL': 0.1,
+    'RESULT_TTL': 5,
+}
+
+# Adaptive (AIMD) provider concurrency per API key and model; excess calls queue server-side
+AGENT_CONCURRENCY = {
+    'INITIAL': 2,
+    'MIN': 1,
+    'MAX': int(os.getenv('AGENT_MAX_CONCURRENCY', '8')),
+    'MAX_QUEUE': 100,
+    'QUEUE_TIMEOUT': 30,
+    'MODELS': {},
+}
+
+# Server-side usage quotas (tenants/quotas.py). Window counters live in the cache,
+# so use a shared cache backend when running more than one process.
+AGENT_QUOTAS = {
+    'ENABLED': True,
+    'FREE_ALLOWANCE': 3,
+    'WINDOW_SECONDS': 60,
+    'ANON_WINDOW_LIMIT': 10,
+    'USER_WINDOW_LIMIT': 30,
+    'TENANT_WINDOW_LIMIT': 300,
+    'CACHE_ALIAS': 'default',
+    # Reverse proxies (nginx, load balancer) in front of Django. Anonymous clients are told
+    # apart by IP: with 0, REMOTE_ADDR is used and everyone behind a proxy shares one quota
+    'TRUSTED_PROXIES': int(os.getenv('TRUSTED_PROXY_COUNT', '0')),
+}
+
+# Write-behind usage events for billing (payments/usage.py)
+AGENT_USAGE = {
+    'ENABLED': True,
+    'BATCH_SIZE': 200,
+    'FLUSH_INTERVAL': 2.0,
+    'MAX_BUFFER': 10000,
+    'SPOOL_PATH': os.getenv('AGENT_USAGE_SPOOL', str(BASE_DIR / 'var' / 'usage-spool.jsonl')),
+}
+
+# Background agent jobs, consumed by `python manage.py run_agent_jobs`
+AGENT_JOBS = {
+    'WORKERS': int(os.getenv('AGENT_JOB_WORKERS', '4')),
+    'POLL_INTERVAL': 1.0,
+    'MAX_ATTEMPTS': 3,
+    'HEARTBEAT_INTERVAL': 30,
+    'STALE_AFTER': 600,
+}
+
+# POST /api/agents/batch/
+AGENT_BATCH = {
+    'MAX_ITEMS': 50,
+    'PARALLELISM': 8,
+}
+
+# POST /api/agents/pipelines/ (agents/services/pipeline.py)
+AGENT_PIPELINES = {
+    'MAX_STEPS': 20,
+    'PARALLELISM': 4,
+    'CACHE_TTL': 3600,
+    'CACHE_MAX_ENTRIES': 500,
+    'CACHE_MAX_TEMPERATURE': 0.3,
+}
+
+# Retries, circuit breaker and hedged requests for provider calls (agents/services/resilience.py)
+AGENT_RESILIENCE = {
+    'RETRIES': 2,
+    'BREAKER_THRESHOLD': 5,
+    'BREAKER_COOLDOWN': 30,
+    'HEDGE': False,
+    'AGENTS': {
+        # 'BytezTextAgent': {'HEDGE': True},
+    },
+}
+
+# Model routing for text/code agents when the request does not name a model (agents/services/router.py)
+AGENT_ROUTER = {
+    'ENABLED': True,
+    'MAX_FALLBACKS': 2,
+    'POOLS': {
+        # Best quality first
+        'BytezTextAgent': os.getenv('AGENT_TEXT_MODELS', 'google/gemma-2b,Qwen/Qwen2-0.5B-Instruct').split(','),
+        'BytezCodeAgent': os.getenv('AGENT_CODE_MODELS', 'google/gemma-2b,Qwen/Qwen2-0.5B-Instruct').split(','),
+        'BytezChatAgent': os.getenv('AGENT_TEXT_MODELS', 'google/gemma-2b,Qwen/Qwen2-0.5B-Instruct').split(','),
+    },
+}
+
+# Marketplace listing (agents/services/catalog.py); clients revalidate cheaply with If-None-Match
+AGENT_CATALOG = {
+    'PAGE_SIZE': 24,
+    'MAX_PAGE_SIZE': 100,
+    'TTL': 60,
+}
+AGENT_CATALOG_CACHE_CONTROL = 'public, max-age=60, stale-while-revalidate=600'
+
+# Audio uploads for speech to text (agents/services/uploads.py); files are spooled to disk, never held in memory
+AGENT_UPLOADS = {
+    'MAX_BYTES': int(os.getenv('AGENT_UPLOAD_MAX_BYTES', str(25 * 1024 * 1024))),
+    'CHUNK_SIZE': 256 * 1024,
+    'TIMEOUT': 120,
+}
+
+# Generated speech kept on local disk and served with Range support (agents/services/audio_cache.py)
+AGENT_AUDIO_CACHE = {
+    'ENABLED': os.getenv('AGENT_AUDIO_CACHE', 'true').lower() == 'true',
+    'DIRECTORY': os.getenv('AGENT_AUDIO_CACHE_DIR', str(BASE_DIR / 'var' / 'audio-cache')),
+    'MAX_BYTES': int(os.getenv('AGENT_AUDIO_CACHE_MAX_BYTES', str(512 * 1024 * 1024))),
+    'SENDFILE_HEADER': os.getenv('AGENT_AUDIO_SENDFILE_HEADER') or None,
+}
+
+# Local copies and WebP variants of generated images (agents/services/image_store.py; variants need Pillow)
+AGENT_IMAGE_STORE = {
+    'ENABLED': os.getenv('AGENT_IMAGE_STORE', 'true').lower() == 'true',
+    'DIRECTORY': os.getenv('AGENT_IMAGE_STORE_DIR', str(BASE_DIR / 'var' / 'images')),
+    'VARIANTS': {'thumb': 256, 'medium': 512},
+    'RENDER_WORKERS': int(os.getenv('AGENT_IMAGE_RENDER_WORKERS', '2')),
+    'MAX_BYTES': int(os.getenv('AGENT_IMAGE_STORE_MAX_MB', '2048')) * 1024 * 1024,
+    'TTL': 30 * 24 * 3600,
+}
+
+# Image requests with n > 1 run as this many concurrent single-image calls (at most the provider limit)
+AGENT_IMAGE_PARALLELISM = int(os.getenv('AGENT_IMAGE_PARALLELISM', '4'))
+# Largest 'n' one image request may ask for (each image is a separate provider call)
+AGENT_IMAGE_MAX_N = int(os.getenv('AGENT_IMAGE_MAX_N', '4'))
+
+# Prompt budgets for text/code agents (agents/services/prompting.py): context windows in tokens per model
+AGENT_PROMPTS = {
+    'CONTEXT_WINDOWS': {
+        'google/gemma-2b': 8192,
+        'Qwen/Qwen2-0.5B-Instruct': 32768,
+    },
+    'OVERFLOW': os.getenv('AGENT_PROMPT_OVERFLOW', 'trim'),  # or 'reject'
+}
+
+# Server-side chat history for chat-bot (agents/services/conversations.py)
+AGENT_CONVERSATIONS = {
+    'CACHE_ALIAS': 'default',
+    'IDLE_TTL': int(os.getenv('AGENT_CONVERSATION_IDLE_TTL', '3600')),
+    'WINDOW_TURNS': 6,
+    'SUMMARY_BATCH': 4,
+}
+
+# Agent response shape: 'compact' drops the duplicate output/response/content fields (agents/services/rendering.py)
+# Clients opt in per request with X-Response-Format: compact or Accept: application/json; version=2
+AGENT_RESPONSES = {
+    'DEFAULT_FORMAT': os.getenv('AGENT_RESPONSE_FORMAT', 'full'),
+}
+
+# zstd/brotli/gzip for large API responses (aihub/compression.py); zstd needs zstandard, brotli needs Brotli
+RESPONSE_COMPRESSION = {
+    'ENABLED': os.getenv('RESPONSE_COMPRESSION', 'true').lower() == 'true',
+    'MIN_BYTES': 1024,
+    'OFFLOAD_BYTES': 64 * 1024,  # async views compress bodies this big in a worker thread
+    'PATH_PREFIXES': ['/api/agents/'],
 }
 
 # CORS Configuration
@@ -121,15 +309,50 @@ WSGI_APPLICATION = 'aihub.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
+# DB_ENGINE=sqlite runs on local files instead of PostgreSQL. DB_REPLICAS lists read
+# replicas: host[:port] entries for PostgreSQL, database files (opened read-only) for SQLite.
+if os.getenv('DB_ENGINE', 'postgresql') == 'sqlite':
+    _primary_db = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.getenv('DB_NAME', str(BASE_DIR / 'db.sqlite3')),
+    }
+    _replica_dbs = [
+        {**_primary_db, 'NAME': f'file:{path}?mode=ro'}
+        for path in filter(None, os.getenv('DB_REPLICAS', '').split(','))
+    ]
+else:
+    _primary_db = {
         'ENGINE': 'django.db.backends.postgresql',
-        'NAME': 'aihub_db',           # your database name
-        'USER': 'aihub_user',         # your PostgreSQL username
-        'PASSWORD': 'your_secure_password',  # your PostgreSQL password
-        'HOST': 'localhost',          # or the server IP if remote
-        'PORT': '5432',               # default PostgreSQL port
+        'NAME': os.getenv('DB_NAME', 'aihub_db'),                       # your database name
+        'USER': os.getenv('DB_USER', 'aihub_user'),                     # your PostgreSQL username
+        'PASSWORD': os.getenv('DB_PASSWORD', 'your_secure_password'),   # your PostgreSQL password
+        'HOST': os.getenv('DB_HOST', 'localhost'),                      # or the server IP if remote
+        'PORT': os.getenv('DB_PORT', '5432'),                           # default PostgreSQL port
+        'CONN_HEALTH_CHECKS': True,
     }
+    if os.getenv('DB_POOL', 'false').lower() == 'true':
+        # psycopg 3 connection pool (pip install "psycopg[pool]"); pooling replaces persistent connections
+        _primary_db['CONN_MAX_AGE'] = 0
+        _primary_db['OPTIONS'] = {'pool': {
+            'min_size': int(os.getenv('DB_POOL_MIN_SIZE', '2')),
+            'max_size': int(os.getenv('DB_POOL_MAX_SIZE', '10')),
+            'timeout': 10,
+        }}
+    else:
+        _primary_db['CONN_MAX_AGE'] = int(os.getenv('DB_CONN_MAX_AGE', '60'))
+    _replica_dbs = []
+    for _replica in filter(None, os.getenv('DB_REPLICAS', '').split(',')):
+        _host, _, _port = _replica.partition(':')
+        _replica_dbs.append({**_primary_db, 'HOST': _host, 'PORT': _port or _primary_db['PORT']})
+
+DATABASES = {'default': _primary_db}
+for _index, _replica_db in enumerate(_replica_dbs, 1):
+    DATABASES[f'replica_{_index}'] = {**_replica_db, 'TEST': {'MIRROR': 'default'}}
+
+# Request reads go to a replica unless the client wrote recently (aihub/db_router.py)
+DATABASE_ROUTERS = ['aihub.db_router.ReplicaRouter']
+DATABASE_REPLICATION = {
+    'STICKY_SECONDS': int(os.getenv('DB_STICKY_SECONDS', '5')),
 }
 
 
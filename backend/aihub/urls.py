@@ -5,4 +5,5 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/auth/', include('users.urls')),
     path('api/agents/', include('agents.urls')),
+    path('api/tenants/', include('tenants.urls')),
 ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:44
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('agents', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UsageEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('agent_name', models.CharField(max_length=100)),
+                ('model', models.CharField(blank=True, max_length=200)),
+                ('prompt_tokens', models.PositiveIntegerField(default=0)),
+                ('completion_tokens', models.PositiveIntegerField(default=0)),
+                ('latency_ms', models.PositiveIntegerField(default=0)),
+                ('status', models.CharField(choices=[('success', 'Success'), ('cached', 'Served from cache'), ('error', 'Error')], max_length=20)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='usage_events', to=settings.AUTH_USER_MODEL)),
+                ('workspace', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='usage_events', to='agents.workspace')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'created_at'], name='payments_us_user_id_503480_idx'), models.Index(fields=['workspace', 'created_at'], name='payments_us_workspa_c4167b_idx')],
+            },
+        ),
+    ]
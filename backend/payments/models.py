@@ -1,3 +1,32 @@
 from django.db import models
+from django.conf import settings
+from django.utils import timezone
 
-# Create your models here.
+
+class UsageEvent(models.Model):
+    """One agent call, recorded for billing. Written in batches by payments.usage"""
+    STATUS_CHOICES = [
+        ('success', 'Success'),
+        ('cached', 'Served from cache'),
+        ('error', 'Error'),
+    ]
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='usage_events')
+    workspace = models.ForeignKey('agents.Workspace', on_delete=models.SET_NULL, null=True, blank=True, related_name='usage_events')
+    agent_name = models.CharField(max_length=100)
+    model = models.CharField(max_length=200, blank=True)
+    prompt_tokens = models.PositiveIntegerField(default=0)
+    completion_tokens = models.PositiveIntegerField(default=0)
+    latency_ms = models.PositiveIntegerField(default=0)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES)
+    # Set when the call happens, not when the batch is inserted
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'created_at']),
+            models.Index(fields=['workspace', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.agent_name} {self.status} at {self.created_at}"
@@ -1,3 +1,64 @@
-from django.test import TestCase
+import json
+import os
+import tempfile
+from unittest import mock
 
-# Create your tests here.
+from django.db import DatabaseError
+from django.test import TransactionTestCase
+from django.utils import timezone
+
+from .models import UsageEvent
+from .usage import UsageRecorder
+
+
+def _event(**fields):
+    return {
+        'user_id': None, 'workspace_id': None, 'agent_name': 'writer', 'model': 'google/gemma-2b',
+        'prompt_tokens': 3, 'completion_tokens': 5, 'latency_ms': 120, 'status': 'success', **fields
+    }
+
+
+# The recorder touches the database from its own connection handling, so no wrapping transaction
+@mock.patch.object(UsageRecorder, '_ensure_thread')
+class UsageRecorderTests(TransactionTestCase):
+    def test_oversized_model_name_is_trimmed_not_fatal_to_the_batch(self, _):
+        recorder = UsageRecorder()
+        recorder.record(**_event(model='x' * 500))
+        recorder.record(**_event())
+        recorder.flush()
+
+        self.assertEqual(recorder.flushed, 2)
+        self.assertEqual(
+            sorted(len(model) for model in UsageEvent.objects.values_list('model', flat=True)),
+            [len('google/gemma-2b'), UsageEvent._meta.get_field('model').max_length],
+        )
+
+    def _spooling_recorder(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        return UsageRecorder({'SPOOL_PATH': os.path.join(directory.name, 'usage.jsonl')})
+
+    def test_failed_flush_is_spooled_and_replayed(self, _):
+        recorder = self._spooling_recorder()
+        recorder.record(**_event())
+        recorder.record(**_event(status='error'))
+        with mock.patch.object(UsageEvent.objects, 'bulk_create', side_effect=DatabaseError('database is down')), \
+                self.assertLogs('payments.usage', 'ERROR'):
+            recorder.flush()
+        self.assertEqual((recorder.spooled, UsageEvent.objects.count()), (2, 0))
+
+        recorder.record(**_event(agent_name='translator'))
+        recorder.flush()
+        self.assertEqual(recorder.flushed, 3)
+        self.assertCountEqual(UsageEvent.objects.values_list('status', flat=True), ['success', 'error', 'success'])
+        self.assertEqual(os.listdir(os.path.dirname(recorder.config['SPOOL_PATH'])), [])  # replayed claims are removed
+
+    def test_replay_sets_aside_rows_the_database_refuses(self, _):
+        recorder = self._spooling_recorder()
+        recorder._spool([{**_event(user_id=424242), 'created_at': timezone.now()}, {**_event(), 'created_at': timezone.now()}])
+        with self.assertLogs('payments.usage', 'ERROR'):
+            recorder.flush()
+
+        self.assertEqual((UsageEvent.objects.count(), recorder.rejected), (1, 1))
+        with open(f"{recorder.config['SPOOL_PATH']}.rejected", encoding='utf-8') as rejects:
+            self.assertEqual(json.loads(rejects.read())['user_id'], 424242)
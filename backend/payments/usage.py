@@ -0,0 +1,284 @@
+import atexit
+import glob
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Dict, Any, List, Optional
+
+from django.conf import settings
+from django.db import DatabaseError, DataError, IntegrityError, close_old_connections, connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'ENABLED': True,
+    'BATCH_SIZE': 200,          # flush as soon as this many events are buffered
+    'FLUSH_INTERVAL': 2.0,      # ...or after this many seconds
+    'MAX_BUFFER': 10000,        # events kept in memory; overflow goes straight to the spool file
+    'SPOOL_PATH': None,         # JSON-lines fallback when the database is unavailable; None = drop
+    'REPLAY_STALE_AFTER': 300,  # seconds before another process takes over a dead process's replay
+}
+
+EVENT_FIELDS = (
+    'user_id', 'workspace_id', 'agent_name', 'model', 'prompt_tokens',
+    'completion_tokens', 'latency_ms', 'status', 'created_at',
+)
+
+
+def _fit_columns(event: Dict[str, Any]):
+    """Trim strings to their column sizes; on PostgreSQL one over-long value (the model
+    name comes from the client's payload) would fail the whole batch it is in"""
+    from .models import UsageEvent
+
+    for field in ('agent_name', 'model', 'status'):
+        if event.get(field) is not None:
+            event[field] = str(event[field])[:UsageEvent._meta.get_field(field).max_length]
+
+
+def estimate_tokens(text: Any) -> int:
+    """Rough token count for billing when the provider does not report usage"""
+    if not text:
+        return 0
+    return max(1, len(str(text)) // 4)
+
+
+class UsageRecorder:
+    """Write-behind buffer for UsageEvent rows.
+
+    record() only appends to an in-memory deque; a daemon thread bulk-inserts
+    batches on size or time thresholds and on interpreter shutdown. Batches the
+    database rejects are appended to a spool file and replayed after the next
+    successful flush.
+    """
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        self.config = {**DEFAULTS, **(config or {})}
+        self.enabled = bool(self.config['ENABLED'])
+        self._buffer = deque()
+        self._lock = threading.Lock()
+        self._spool_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = False
+        self._thread = None
+        self.recorded = 0
+        self.flushed = 0
+        self.spooled = 0
+        self.dropped = 0
+        self.failed_flushes = 0
+        self.rejected = 0
+
+    def record(self, **event):
+        """Queue one event; never touches the database on the caller's thread"""
+        if not self.enabled:
+            return
+        event.setdefault('created_at', timezone.now())
+        _fit_columns(event)
+        overflow = None
+        with self._lock:
+            self._buffer.append(event)
+            self.recorded += 1
+            if len(self._buffer) > self.config['MAX_BUFFER']:
+                # Bounded memory: spill the oldest half rather than grow without limit
+                overflow = [self._buffer.popleft() for _ in range(len(self._buffer) // 2)]
+            buffered = len(self._buffer)
+        if overflow:
+            self._spool(overflow)
+        if buffered >= self.config['BATCH_SIZE']:
+            self._wake.set()
+        self._ensure_thread()
+
+    def _ensure_thread(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='usage-recorder', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while not self._stopped:
+            self._wake.wait(self.config['FLUSH_INTERVAL'])
+            self._wake.clear()
+            self.flush()
+
+    def _take_batch(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            size = min(len(self._buffer), self.config['BATCH_SIZE'])
+            return [self._buffer.popleft() for _ in range(size)]
+
+    def flush(self):
+        """Insert everything buffered so far"""
+        from .models import UsageEvent
+
+        close_old_connections()
+        try:
+            while True:
+                batch = self._take_batch()
+                if not batch:
+                    break
+                try:
+                    UsageEvent.objects.bulk_create([UsageEvent(**event) for event in batch])
+                except DatabaseError as e:
+                    self.failed_flushes += 1
+                    logger.error(f"Usage flush failed, spooling {len(batch)} events: {str(e)}")
+                    self._spool(batch)
+                    return
+                self.flushed += len(batch)
+            self._replay_spool()
+        finally:
+            close_old_connections()
+
+    def _spool(self, events: List[Dict[str, Any]]):
+        path = self.config['SPOOL_PATH']
+        if not path:
+            self.dropped += len(events)
+            logger.error(f"Dropped {len(events)} usage events (no AGENT_USAGE['SPOOL_PATH'] configured)")
+            return
+        lines = []
+        for event in events:
+            row = {field: event.get(field) for field in EVENT_FIELDS}
+            row['created_at'] = event['created_at'].isoformat()
+            lines.append(json.dumps(row))
+        try:
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            with self._spool_lock, open(path, 'a', encoding='utf-8') as spool:
+                spool.write('\n'.join(lines) + '\n')
+            self.spooled += len(events)
+        except OSError as e:
+            self.dropped += len(events)
+            logger.error(f"Could not spool {len(events)} usage events: {str(e)}")
+
+    def _claim_spool(self) -> List[str]:
+        """Move spooled events to files only this thread reads.
+
+        Other processes keep appending to SPOOL_PATH, so it is renamed away
+        (atomically) rather than truncated after reading. A claim is touched
+        whenever it is worked on; one left untouched for REPLAY_STALE_AFTER
+        belongs to a process that died mid-replay and is taken over.
+        """
+        path = self.config['SPOOL_PATH']
+        owner = f"{path}.{os.getpid()}-{threading.get_ident()}-"
+        claimed = []
+        for candidate in sorted(glob.glob(f"{glob.escape(path)}.*.replay")) + [path]:
+            try:
+                if candidate == path:
+                    if not os.path.getsize(path):
+                        continue
+                elif not candidate.startswith(owner):
+                    if time.time() - os.path.getmtime(candidate) < self.config['REPLAY_STALE_AFTER']:
+                        continue
+                else:
+                    claimed.append(candidate)
+                    continue
+                taken = f"{owner}{uuid.uuid4().hex[:8]}.replay"
+                os.replace(candidate, taken)
+                os.utime(taken)
+                claimed.append(taken)
+            except FileNotFoundError:
+                continue  # another process took it first
+        return claimed
+
+    def _replay_spool(self):
+        """Load spooled events back into the database once it accepts writes again"""
+        if not self.config['SPOOL_PATH']:
+            return
+        with self._spool_lock:
+            for claimed in self._claim_spool():
+                if not self._replay_file(claimed):
+                    return
+
+    def _replay_file(self, claimed: str) -> bool:
+        """Insert one claimed file in a single transaction; False to retry it later"""
+        from .models import UsageEvent
+
+        rows, rejected, refused = [], [], 0
+        try:
+            os.utime(claimed)
+            spool = open(claimed, encoding='utf-8')
+        except FileNotFoundError:
+            return True
+        with spool:
+            for line in spool:
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                    row['created_at'] = parse_datetime(row['created_at'])
+                    rows.append(UsageEvent(**row))
+                except (ValueError, TypeError, KeyError):
+                    rejected.append(line.rstrip('\n'))
+
+        # Foreign keys are checked at commit by default; check them inside the savepoint instead
+        tables = [UsageEvent._meta.db_table]
+        try:
+            with transaction.atomic():
+                try:
+                    with transaction.atomic():
+                        UsageEvent.objects.bulk_create(rows, batch_size=self.config['BATCH_SIZE'])
+                        connection.check_constraints(table_names=tables)
+                except (IntegrityError, DataError):
+                    # Find the rows the database refuses (e.g. a deleted user) and set them aside
+                    for row in rows:
+                        try:
+                            with transaction.atomic():
+                                row.save(force_insert=True)
+                                connection.check_constraints(table_names=tables)
+                        except (IntegrityError, DataError):
+                            refused += 1
+                            rejected.append(json.dumps({
+                                **{field: getattr(row, field) for field in EVENT_FIELDS if field != 'created_at'},
+                                'created_at': row.created_at.isoformat(),
+                            }))
+        except DatabaseError as e:
+            # Nothing was committed; the claimed file stays for the next replay
+            logger.warning(f"Spool replay deferred: {str(e)}")
+            return False
+
+        if rejected:
+            with open(f"{self.config['SPOOL_PATH']}.rejected", 'a', encoding='utf-8') as rejects:
+                rejects.write('\n'.join(rejected) + '\n')
+            self.rejected += len(rejected)
+            logger.error(f"{len(rejected)} spooled usage events rejected by the database, kept in .rejected")
+        os.remove(claimed)
+        self.flushed += len(rows) - refused
+        logger.info(f"Replayed {len(rows) - refused} spooled usage events")
+        return True
+
+    def shutdown(self):
+        """Stop the flusher and write out whatever is still buffered"""
+        self._stopped = True
+        self._wake.set()
+        if self._buffer:
+            self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'enabled': self.enabled,
+            'buffered': len(self._buffer),
+            'recorded': self.recorded,
+            'flushed': self.flushed,
+            'spooled': self.spooled,
+            'dropped': self.dropped,
+            'failed_flushes': self.failed_flushes,
+            'rejected': self.rejected,
+        }
+
+
+_recorder = None
+_recorder_lock = threading.Lock()
+
+
+def get_usage_recorder() -> UsageRecorder:
+    global _recorder
+    if _recorder is None:
+        with _recorder_lock:
+            if _recorder is None:
+                _recorder = UsageRecorder(getattr(settings, 'AGENT_USAGE', {}))
+                atexit.register(_recorder.shutdown)
+    return _recorder
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QuotaAllowance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('subject', models.CharField(max_length=80)),
+                ('agent_name', models.CharField(max_length=100)),
+                ('used', models.PositiveIntegerField(default=0)),
+                ('limit', models.PositiveIntegerField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('subject', 'agent_name'), name='unique_quota_subject_agent')],
+            },
+        ),
+    ]
@@ -1,3 +1,18 @@
 from django.db import models
 
-# Create your models here.
+
+class QuotaAllowance(models.Model):
+    """Fixed number of calls a subject (user or anonymous client) may make to one agent"""
+    subject = models.CharField(max_length=80)
+    agent_name = models.CharField(max_length=100)
+    used = models.PositiveIntegerField(default=0)
+    limit = models.PositiveIntegerField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['subject', 'agent_name'], name='unique_quota_subject_agent'),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} {self.agent_name}: {self.used}/{self.limit}"
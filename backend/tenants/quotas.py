@@ -0,0 +1,235 @@
+import hashlib
+import math
+import time
+from typing import Dict, Any, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+
+from .models import QuotaAllowance
+
+DEFAULTS = {
+    'ENABLED': True,
+    'FREE_ALLOWANCE': 3,        # lifetime calls per agent for anonymous clients
+    'WINDOW_SECONDS': 60,
+    'ANON_WINDOW_LIMIT': 10,    # calls per window per anonymous client
+    'USER_WINDOW_LIMIT': 30,    # calls per window per user
+    'TENANT_WINDOW_LIMIT': 300, # calls per window per workspace
+    'CACHE_ALIAS': 'default',   # point at a shared cache (Redis/Memcached) when running several processes
+    'TRUSTED_PROXIES': 0,       # reverse proxies in front of Django; 0 trusts REMOTE_ADDR, ignoring X-Forwarded-For
+}
+
+
+def get_config() -> Dict[str, Any]:
+    return {**DEFAULTS, **getattr(settings, 'AGENT_QUOTAS', {})}
+
+
+class QuotaDecision:
+    __slots__ = ('allowed', 'reason', 'retry_after', 'subject', 'agent_name', 'allowance_consumed',
+                 'user_id', 'workspace_id')
+
+    def __init__(self, allowed: bool, reason: str = '', retry_after: int = 0, subject: str = '',
+                 agent_name: str = '', allowance_consumed: bool = False, user_id: Optional[int] = None,
+                 workspace_id: Optional[int] = None):
+        self.allowed = allowed
+        self.reason = reason
+        self.retry_after = retry_after
+        self.subject = subject
+        self.agent_name = agent_name
+        self.allowance_consumed = allowance_consumed
+        # Resolved identity, reused for usage recording
+        self.user_id = user_id
+        self.workspace_id = workspace_id
+
+
+class SlidingWindowCounter:
+    """Approximate sliding window over two fixed buckets held in the cache.
+
+    One add + incr + get per hit; atomic wherever the cache backend's incr is
+    (Redis, Memcached, and LocMem within a process), so no database locks.
+    """
+
+    def __init__(self, cache, window: int, limit: int):
+        self.cache = cache
+        self.window = window
+        self.limit = limit
+
+    def _buckets(self, key: str) -> Tuple[str, str, float]:
+        now = time.time()
+        bucket = int(now // self.window)
+        elapsed = now - bucket * self.window
+        return f"quota:window:{key}:{bucket}", f"quota:window:{key}:{bucket - 1}", elapsed
+
+    def _estimate(self, previous: int, current: int, elapsed: float) -> float:
+        return previous * (self.window - elapsed) / self.window + current
+
+    def hit(self, key: str) -> Tuple[bool, int, str]:
+        """Count one call; returns (allowed, retry_after_seconds, bucket), bucket being what undo() takes back"""
+        current_key, previous_key, elapsed = self._buckets(key)
+        self.cache.add(current_key, 0, timeout=self.window * 2)
+        try:
+            current = self.cache.incr(current_key)
+        except ValueError:
+            # Evicted between add and incr
+            self.cache.set(current_key, 1, timeout=self.window * 2)
+            current = 1
+        previous = self.cache.get(previous_key, 0)
+
+        if self._estimate(previous, current, elapsed) > self.limit:
+            try:
+                self.cache.decr(current_key)  # rejected calls do not count
+            except ValueError:
+                pass
+            return False, max(1, math.ceil(self.window - elapsed)), current_key
+        return True, 0, current_key
+
+    def undo(self, bucket: str):
+        """Take back a counted call that a later check refused"""
+        try:
+            self.cache.decr(bucket)
+        except ValueError:
+            pass
+
+    def peek(self, key: str) -> int:
+        current_key, previous_key, elapsed = self._buckets(key)
+        values = self.cache.get_many([current_key, previous_key])
+        return math.ceil(self._estimate(values.get(previous_key, 0), values.get(current_key, 0), elapsed))
+
+
+def client_address(request, trusted_proxies: int) -> str:
+    """The caller's IP address as seen by the outermost of `trusted_proxies` reverse proxies.
+
+    Each proxy appends the address it was called from to X-Forwarded-For, so
+    only the last `trusted_proxies` entries can be trusted; anything further
+    left was sent by the client. Without proxies REMOTE_ADDR is the caller,
+    and behind an untrusted proxy every client would share its address.
+    """
+    if trusted_proxies > 0:
+        forwarded = [part.strip() for part in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',') if part.strip()]
+        if forwarded:
+            return forwarded[-min(trusted_proxies, len(forwarded))]
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def client_subject(request, user) -> str:
+    if user is not None and user.is_authenticated:
+        return f"user:{user.pk}"
+    address = client_address(request, get_config()['TRUSTED_PROXIES'])
+    return f"anon:{hashlib.sha256(address.encode('utf-8')).hexdigest()[:32]}"
+
+
+def _window(config: Dict[str, Any], limit_name: str) -> SlidingWindowCounter:
+    return SlidingWindowCounter(caches[config['CACHE_ALIAS']], config['WINDOW_SECONDS'], config[limit_name])
+
+
+def _workspace_subject(config: Dict[str, Any], user, workspace_id: Optional[str]) -> Optional[str]:
+    """Tenant subject for a workspace the user belongs to (membership cached briefly)"""
+    if not workspace_id or not str(workspace_id).isdigit():
+        return None
+    cache = caches[config['CACHE_ALIAS']]
+    member_key = f"quota:member:{workspace_id}:{user.pk}"
+    is_member = cache.get(member_key)
+    if is_member is None:
+        from agents.models import Workspace
+        is_member = Workspace.objects.filter(Q(owner=user) | Q(members=user), pk=workspace_id).exists()
+        cache.set(member_key, is_member, timeout=300)
+    return f"workspace:{workspace_id}" if is_member else None
+
+
+def consume_allowance(subject: str, agent_name: str, limit: int, cache) -> bool:
+    """Atomically take one call from a fixed allowance with a single conditional UPDATE"""
+    exhausted_key = f"quota:exhausted:{subject}:{agent_name}"
+    if limit <= 0 or cache.get(exhausted_key):
+        return False
+
+    allowance = QuotaAllowance.objects.filter(subject=subject, agent_name=agent_name, used__lt=F('limit'))
+    if allowance.update(used=F('used') + 1):
+        return True
+    try:
+        with transaction.atomic():
+            QuotaAllowance.objects.create(subject=subject, agent_name=agent_name, used=1, limit=limit)
+        return True
+    except IntegrityError:
+        # Row exists: either exhausted or created concurrently
+        if allowance.update(used=F('used') + 1):
+            return True
+    # Remember exhaustion so repeat attempts skip the database
+    cache.set(exhausted_key, True, timeout=300)
+    return False
+
+
+def check_quota(request, agent_name: str, user=None) -> QuotaDecision:
+    """Count one agent call against the caller's window and (for anonymous clients) allowance"""
+    config = get_config()
+    authenticated = user is not None and user.is_authenticated
+    if not config['ENABLED']:
+        return QuotaDecision(True, agent_name=agent_name, user_id=user.pk if authenticated else None)
+
+    subject = client_subject(request, user)
+
+    window = _window(config, 'USER_WINDOW_LIMIT' if authenticated else 'ANON_WINDOW_LIMIT')
+    allowed, retry_after, bucket = window.hit(subject)
+    if not allowed:
+        return QuotaDecision(False, 'Too many requests, please slow down.', retry_after, subject, agent_name)
+
+    # A call refused by a later check must not use up window capacity
+    if authenticated:
+        workspace_id = request.headers.get('X-Workspace-Id')
+        tenant = _workspace_subject(config, user, workspace_id)
+        if tenant:
+            allowed, retry_after, _ = _window(config, 'TENANT_WINDOW_LIMIT').hit(tenant)
+            if not allowed:
+                window.undo(bucket)
+                return QuotaDecision(False, 'Workspace request limit reached, please slow down.', retry_after, subject, agent_name)
+        return QuotaDecision(True, subject=subject, agent_name=agent_name, user_id=user.pk,
+                             workspace_id=int(workspace_id) if tenant else None)
+
+    if not consume_allowance(subject, agent_name, config['FREE_ALLOWANCE'], caches[config['CACHE_ALIAS']]):
+        window.undo(bucket)
+        return QuotaDecision(False, 'Free usage limit reached. Please sign up for unlimited access.', 0, subject, agent_name)
+    return QuotaDecision(True, subject=subject, agent_name=agent_name, allowance_consumed=True)
+
+
+def refund_quota(decision: QuotaDecision):
+    """Give back an allowance call when the agent failed to produce a result"""
+    if not decision.allowance_consumed:
+        return
+    config = get_config()
+    QuotaAllowance.objects.filter(
+        subject=decision.subject, agent_name=decision.agent_name, used__gt=0
+    ).update(used=F('used') - 1)
+    caches[config['CACHE_ALIAS']].delete(f"quota:exhausted:{decision.subject}:{decision.agent_name}")
+
+
+def usage_summary(request, user, agent_names) -> Dict[str, Any]:
+    """Current usage for the caller, as served by the quota endpoint"""
+    config = get_config()
+    authenticated = user is not None and user.is_authenticated
+    subject = client_subject(request, user)
+    window_limit = config['USER_WINDOW_LIMIT' if authenticated else 'ANON_WINDOW_LIMIT']
+    window_used = _window(config, 'USER_WINDOW_LIMIT' if authenticated else 'ANON_WINDOW_LIMIT').peek(subject)
+
+    agents = {}
+    if not authenticated:
+        used = dict(QuotaAllowance.objects.filter(subject=subject).values_list('agent_name', 'used'))
+        for name in agent_names:
+            agents[name] = {
+                'used': used.get(name, 0),
+                'limit': config['FREE_ALLOWANCE'],
+                'remaining': max(0, config['FREE_ALLOWANCE'] - used.get(name, 0)),
+            }
+
+    return {
+        'enabled': config['ENABLED'],
+        'authenticated': authenticated,
+        'free_allowance': None if authenticated else config['FREE_ALLOWANCE'],
+        'agents': agents,
+        'window': {
+            'seconds': config['WINDOW_SECONDS'],
+            'limit': window_limit,
+            'used': min(window_used, window_limit),
+            'remaining': max(0, window_limit - window_used),
+        },
+    }
@@ -1,3 +1,72 @@
-from django.test import TestCase
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import RequestFactory, TestCase, override_settings
 
-# Create your tests here.
+from .models import QuotaAllowance
+from .quotas import check_quota, client_address, client_subject, get_config, refund_quota, usage_summary
+
+
+def _quotas(**overrides):
+    return override_settings(AGENT_QUOTAS={**get_config(), **overrides})
+
+
+class ClientAddressTests(TestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    def test_forwarded_for_is_ignored_without_trusted_proxies(self):
+        request = self.factory.get('/', REMOTE_ADDR='10.0.0.1', HTTP_X_FORWARDED_FOR='1.2.3.4')
+        self.assertEqual(client_address(request, 0), '10.0.0.1')
+
+    def test_client_supplied_entries_are_skipped(self):
+        # The client forged 6.6.6.6; the one trusted proxy appended the address it saw
+        request = self.factory.get('/', REMOTE_ADDR='10.0.0.1', HTTP_X_FORWARDED_FOR='6.6.6.6, 203.0.113.7')
+        self.assertEqual(client_address(request, 1), '203.0.113.7')
+        self.assertEqual(client_address(request, 2), '6.6.6.6')
+
+    def test_clients_behind_one_proxy_get_their_own_quota(self):
+        first = self.factory.get('/', REMOTE_ADDR='10.0.0.1', HTTP_X_FORWARDED_FOR='203.0.113.7')
+        second = self.factory.get('/', REMOTE_ADDR='10.0.0.1', HTTP_X_FORWARDED_FOR='203.0.113.8')
+        with _quotas(TRUSTED_PROXIES=1):
+            self.assertNotEqual(client_subject(first, None), client_subject(second, None))
+        with _quotas(TRUSTED_PROXIES=0):
+            self.assertEqual(client_subject(first, None), client_subject(second, None))
+
+
+class QuotaTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.request = RequestFactory().post('/', REMOTE_ADDR='198.51.100.1')
+
+    def test_refund_gives_the_allowance_back(self):
+        with _quotas(FREE_ALLOWANCE=1):
+            decision = check_quota(self.request, 'writer')
+            self.assertTrue(decision.allowed)
+            self.assertFalse(check_quota(self.request, 'writer').allowed)
+            refund_quota(decision)
+            self.assertTrue(check_quota(self.request, 'writer').allowed)
+
+    def test_refused_allowance_does_not_use_window_capacity(self):
+        with _quotas(FREE_ALLOWANCE=1, ANON_WINDOW_LIMIT=100):
+            check_quota(self.request, 'writer')
+            for _ in range(5):
+                self.assertFalse(check_quota(self.request, 'writer').allowed)
+            self.assertEqual(usage_summary(self.request, None, ['writer'])['window']['used'], 1)
+
+    def test_window_limit(self):
+        with _quotas(FREE_ALLOWANCE=100, ANON_WINDOW_LIMIT=2):
+            self.assertTrue(check_quota(self.request, 'writer').allowed)
+            self.assertTrue(check_quota(self.request, 'writer').allowed)
+            decision = check_quota(self.request, 'writer')
+        self.assertFalse(decision.allowed)
+        self.assertGreater(decision.retry_after, 0)
+        self.assertEqual(QuotaAllowance.objects.get(agent_name='writer').used, 2)
+
+    def test_signed_in_users_have_no_allowance(self):
+        user = get_user_model().objects.create_user(username='quota-user', email='quota@example.com', password='x')
+        with _quotas(FREE_ALLOWANCE=0):
+            decision = check_quota(self.request, 'writer', user)
+        self.assertTrue(decision.allowed)
+        self.assertEqual(decision.user_id, user.pk)
+        refund_quota(decision)  # nothing was taken, nothing to give back
+        self.assertFalse(QuotaAllowance.objects.exists())
@@ -0,0 +1,6 @@
+from django.urls import path
+from . import views
+
+urlpatterns = [
+    path('quota/', views.quota_status, name='quota-status'),
+]
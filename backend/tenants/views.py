@@ -1,3 +1,11 @@
-from django.shortcuts import render
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import AllowAny
+from rest_framework.response import Response
+from agents.services import AgentFactory
+from .quotas import usage_summary
 
-# Create your views here.
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def quota_status(request):
+    """Server-side usage and remaining quota for the caller (replaces the localStorage counter)"""
+    return Response(usage_summary(request, request.user, AgentFactory.get_available_agents()))
@@ -0,0 +1,139 @@
+import copy
+import threading
+from typing import Dict, Any
+
+from django.conf import settings
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from agents.services.lru import LRUCache
+from .revocation import RevokedTokens
+
+DEFAULTS = {
+    'USER_TTL': 60,                 # seconds other processes may see a user after an edit (signals clear this one)
+    'USER_MAX_ENTRIES': 10000,
+    'REVOCATION_REFRESH': 30,       # seconds between rebuilds of the revoked-token filter
+    'REVOCATION_CAPACITY': 100000,
+    'REVOCATION_ERROR_RATE': 0.001,
+}
+
+
+def get_config() -> Dict[str, Any]:
+    return {**DEFAULTS, **getattr(settings, 'AUTH_CACHE', {})}
+
+
+class UserCache:
+    """Users by token user id, so authenticated requests skip the user query.
+
+    Saving or deleting a User drops its entry (see users.signals); the TTL
+    bounds staleness in other processes and after queryset.update() calls,
+    which send no signals.
+    """
+
+    def __init__(self, config: Dict[str, Any]):
+        self._users = LRUCache(config['USER_MAX_ENTRIES'], ttl=config['USER_TTL'])
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_model, user_id):
+        user = self._users.get(str(user_id))
+        with self._lock:
+            if user is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+        if user is None:
+            user = user_model.objects.get(**{api_settings.USER_ID_FIELD: user_id})
+            self._users.set(str(user_id), user)
+        # Each request gets its own instance; the cached one is never handed out
+        return copy.copy(user)
+
+    def invalidate(self, user_id):
+        self._users.pop(str(user_id))
+
+    def clear(self):
+        self._users.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {'entries': len(self._users), 'hits': self.hits, 'misses': self.misses}
+
+
+_user_cache = None
+_revoked_tokens = None
+_cache_lock = threading.Lock()
+
+
+def get_user_cache() -> UserCache:
+    global _user_cache
+    if _user_cache is None:
+        with _cache_lock:
+            if _user_cache is None:
+                _user_cache = UserCache(get_config())
+    return _user_cache
+
+
+def get_revoked_tokens() -> RevokedTokens:
+    global _revoked_tokens
+    if _revoked_tokens is None:
+        with _cache_lock:
+            if _revoked_tokens is None:
+                _revoked_tokens = RevokedTokens(get_config())
+    return _revoked_tokens
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """JWTAuthentication that resolves users from an in-process cache.
+
+    Same checks as simplejwt (active user, password-change revocation) plus
+    the token blacklist when that app is installed, without a query per
+    request in the common case.
+    """
+
+    def get_validated_token(self, raw_token: bytes):
+        validated_token = super().get_validated_token(raw_token)
+        if get_revoked_tokens().is_revoked(validated_token.get(api_settings.JTI_CLAIM)):
+            raise InvalidToken(_("Token is blacklisted"))
+        return validated_token
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as e:
+            raise InvalidToken(_("Token contained no recognizable user identification")) from e
+
+        try:
+            user = get_user_cache().get(self.user_model, user_id)
+        except self.user_model.DoesNotExist as e:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found") from e
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+
+        return user
+
+
+def authenticate_request(request):
+    """Resolve the JWT user for a plain Django view, or None for anonymous/invalid tokens.
+
+    DRF views get this from DEFAULT_AUTHENTICATION_CLASSES; the agent endpoints
+    are plain (async) Django views, so they call this from a worker thread.
+    """
+    try:
+        authenticated = CachedJWTAuthentication().authenticate(request)
+    except (InvalidToken, AuthenticationFailed):
+        return None
+    return authenticated[0] if authenticated else None
+
+
+def auth_cache_stats() -> Dict[str, Any]:
+    return {'users': get_user_cache().stats(), 'revoked_tokens': get_revoked_tokens().stats()}
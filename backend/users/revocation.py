@@ -0,0 +1,111 @@
+import hashlib
+import math
+import threading
+import time
+from typing import Dict, Any, Iterable, Optional
+
+from django.apps import apps
+from django.utils import timezone
+
+BLACKLIST_APP = 'rest_framework_simplejwt.token_blacklist'
+
+
+class BloomFilter:
+    """Fixed-size set membership with no false negatives.
+
+    `jti in bloom` may wrongly say True at roughly `error_rate` once
+    `capacity` keys are added, but never says False for an added key.
+    """
+
+    def __init__(self, capacity: int, error_rate: float = 0.001):
+        capacity = max(int(capacity), 1)
+        self.size = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.count = 0
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key: str):
+        digest = hashlib.sha256(key.encode('utf-8')).digest()
+        h1 = int.from_bytes(digest[:8], 'big')
+        h2 = int.from_bytes(digest[8:16], 'big') | 1
+        for i in range(self.hashes):
+            yield (h1 + i * h2) % self.size
+
+    def add(self, key: str):
+        for position in self._positions(key):
+            self._bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+class RevokedTokens:
+    """Blacklisted token ids fronted by a Bloom filter.
+
+    Only active when simplejwt's token_blacklist app is installed. The filter
+    is rebuilt from the blacklist every REVOCATION_REFRESH seconds (tokens
+    blacklisted in this process are added at once, see users.signals), so a
+    token that is not in the filter is accepted without a query and only the
+    rare filter hit is confirmed against the table.
+    """
+
+    def __init__(self, config: Dict[str, Any]):
+        self.config = config
+        self._filter: Optional[BloomFilter] = None
+        self._built_at = 0.0
+        self._lock = threading.Lock()
+        self.checks = 0
+        self.confirmations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return apps.is_installed(BLACKLIST_APP)
+
+    def _blacklisted_jtis(self) -> Iterable[str]:
+        from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+
+        return BlacklistedToken.objects.filter(token__expires_at__gt=timezone.now()).values_list(
+            'token__jti', flat=True
+        )
+
+    def _is_blacklisted(self, jti: str) -> bool:
+        from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+
+        return BlacklistedToken.objects.filter(token__jti=jti).exists()
+
+    def _current_filter(self) -> BloomFilter:
+        if self._filter is not None and time.monotonic() - self._built_at < self.config['REVOCATION_REFRESH']:
+            return self._filter
+        with self._lock:
+            if self._filter is None or time.monotonic() - self._built_at >= self.config['REVOCATION_REFRESH']:
+                jtis = list(self._blacklisted_jtis())
+                bloom = BloomFilter(max(self.config['REVOCATION_CAPACITY'], 2 * len(jtis)),
+                                    self.config['REVOCATION_ERROR_RATE'])
+                for jti in jtis:
+                    bloom.add(jti)
+                self._filter, self._built_at = bloom, time.monotonic()
+        return self._filter
+
+    def add(self, jti: str):
+        if self._filter is not None:
+            with self._lock:
+                self._filter.add(jti)
+
+    def is_revoked(self, jti: Optional[str]) -> bool:
+        if not jti or not self.enabled:
+            return False
+        self.checks += 1
+        if jti not in self._current_filter():
+            return False
+        self.confirmations += 1
+        return self._is_blacklisted(jti)
+
+    def stats(self) -> Dict[str, Any]:
+        bloom = self._filter
+        return {
+            'enabled': self.enabled,
+            'entries': bloom.count if bloom else 0,
+            'checks': self.checks,
+            'confirmations': self.confirmations,
+        }
@@ -0,0 +1,23 @@
+from django.apps import apps
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from rest_framework_simplejwt.settings import api_settings
+
+from .authentication import get_user_cache, get_revoked_tokens
+from .models import User
+from .revocation import BLACKLIST_APP
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_cached_user(sender, instance, **kwargs):
+    get_user_cache().invalidate(getattr(instance, api_settings.USER_ID_FIELD))
+
+
+if apps.is_installed(BLACKLIST_APP):
+    from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+
+    @receiver(post_save, sender=BlacklistedToken)
+    def remember_revoked_token(sender, instance, created, **kwargs):
+        if created:
+            get_revoked_tokens().add(instance.token.jti)
@@ -1,3 +1,125 @@
-from django.test import TestCase
+from unittest import mock
 
-# Create your tests here.
+from django.db import DEFAULT_DB_ALIAS
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase
+from rest_framework_simplejwt.tokens import AccessToken
+
+from aihub.db_router import ReplicaRouter, replica_routing_middleware, use_primary
+from .authentication import authenticate_request, get_config
+from .models import User
+from .revocation import BloomFilter, RevokedTokens
+
+
+class BloomFilterTests(SimpleTestCase):
+    def test_added_keys_are_always_found(self):
+        bloom = BloomFilter(1000)
+        keys = [f"jti-{n}" for n in range(1000)]
+        for key in keys:
+            bloom.add(key)
+        self.assertTrue(all(key in bloom for key in keys))
+        false_positives = sum(f"other-{n}" in bloom for n in range(10000))
+        self.assertLess(false_positives, 50)
+
+
+class _RevokedTokens(RevokedTokens):
+    """RevokedTokens over an in-memory blacklist; the blacklist app is optional and not installed here"""
+    enabled = True
+
+    def __init__(self, config):
+        super().__init__(config)
+        self.blacklist = set()
+        self.lookups = 0
+
+    def _blacklisted_jtis(self):
+        self.lookups += 1
+        return list(self.blacklist)
+
+    def _is_blacklisted(self, jti):
+        self.lookups += 1
+        return jti in self.blacklist
+
+
+class TokenRevocationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='revoked', email='revoked@example.com', password='x')
+        self.token = AccessToken.for_user(self.user)
+        self.request = RequestFactory().get('/', HTTP_AUTHORIZATION=f"Bearer {self.token}")
+
+    def _revoked_tokens(self, **config):
+        revoked = _RevokedTokens({**get_config(), **config})
+        patcher = mock.patch('users.authentication._revoked_tokens', revoked)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return revoked
+
+    def test_blacklisted_token_is_rejected_once_the_filter_refreshes(self):
+        revoked = self._revoked_tokens(REVOCATION_REFRESH=0)
+        self.assertEqual(authenticate_request(self.request), self.user)
+        revoked.blacklist.add(self.token['jti'])
+        self.assertIsNone(authenticate_request(self.request))
+
+    def test_token_revoked_in_this_process_is_rejected_at_once(self):
+        revoked = self._revoked_tokens(REVOCATION_REFRESH=3600)
+        self.assertEqual(authenticate_request(self.request), self.user)
+        revoked.blacklist.add(self.token['jti'])
+        self.assertEqual(authenticate_request(self.request), self.user)  # the filter is not due for a rebuild
+        revoked.add(self.token['jti'])  # what users.signals does when a token is blacklisted
+        self.assertIsNone(authenticate_request(self.request))
+
+    def test_valid_tokens_skip_the_blacklist(self):
+        revoked = self._revoked_tokens(REVOCATION_REFRESH=3600)
+        revoked.blacklist.add(AccessToken.for_user(self.user)['jti'])
+        for _ in range(5):
+            self.assertFalse(revoked.is_revoked(self.token['jti']))
+        self.assertEqual(revoked.lookups, 1)  # the one filter build
+        self.assertEqual(revoked.stats()['confirmations'], 0)
+
+
+class ReplicaRoutingTests(SimpleTestCase):
+    def setUp(self):
+        self.router = ReplicaRouter()
+        self.factory = RequestFactory()
+
+    def _middleware(self, write=False):
+        reads = []
+
+        def view(request):
+            reads.append(self.router.db_for_read(User))
+            if write:
+                self.router.db_for_write(User)
+                reads.append(self.router.db_for_read(User))
+            return HttpResponse()
+
+        with mock.patch('aihub.db_router.replica_aliases', return_value=['replica_1']):
+            return replica_routing_middleware(view), reads
+
+    def test_reads_go_to_a_replica(self):
+        middleware, reads = self._middleware()
+        response = middleware(self.factory.get('/'))
+        self.assertEqual(reads, ['replica_1'])
+        self.assertNotIn('db_primary', response.cookies)
+
+    def test_writer_reads_its_own_writes(self):
+        middleware, reads = self._middleware(write=True)
+        response = middleware(self.factory.post('/'))
+        self.assertEqual(reads, ['replica_1', DEFAULT_DB_ALIAS])
+        self.assertIn('db_primary', response.cookies)
+
+        # The next request from the same client stays on the primary while the cookie lives
+        middleware, reads = self._middleware()
+        middleware(self.factory.get('/', HTTP_COOKIE='db_primary=1'))
+        self.assertEqual(reads, [DEFAULT_DB_ALIAS])
+
+    def test_use_primary_and_code_outside_requests_read_the_primary(self):
+        self.assertEqual(self.router.db_for_read(User), DEFAULT_DB_ALIAS)
+        reads = []
+
+        def view(request):
+            with use_primary():
+                reads.append(self.router.db_for_read(User))
+            return HttpResponse()
+
+        with mock.patch('aihub.db_router.replica_aliases', return_value=['replica_1']):
+            replica_routing_middleware(view)(self.factory.get('/'))
+        self.assertEqual(reads, [DEFAULT_DB_ALIAS])
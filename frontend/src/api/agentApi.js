@@ -1,11 +1,17 @@
 import axios from "axios";
 
 // Use relative /api paths so Vite dev server can proxy them to Django.
-export const fetchAgents = async () => {
-  const response = await axios.get("/api/agents/");
+// One marketplace page: { results, next_cursor }. params: q, category, sort, cursor, limit
+export const fetchAgentPage = async (params = {}) => {
+  const response = await axios.get("/api/agents/", { params });
   return response.data;
 };
 
+export const fetchAgents = async (params = {}) => {
+  const data = await fetchAgentPage(params);
+  return data.results;
+};
+
 export const callAgent = async (agentIdOrName, payload = {}) => {
   try {
     console.log(`Calling agent ${agentIdOrName} with payload:`, payload);
@@ -18,6 +24,62 @@ export const callAgent = async (agentIdOrName, payload = {}) => {
   }
 };
 
+// Stream an agent's output over Server-Sent Events. onToken receives each
+// visible chunk as soon as the backend produces it; onEvent receives any other
+// progress event (e.g. "image" for each finished image); resolves with the
+// final "done" event data.
+export const streamAgent = async (agentIdOrName, payload = {}, onToken = () => {}, onEvent = () => {}) => {
+  const headers = { "Content-Type": "application/json" };
+  const token = localStorage.getItem("access_token");
+  if (token) headers.Authorization = `Bearer ${token}`;
+
+  const response = await fetch(`/api/agents/${agentIdOrName}/stream/`, {
+    method: "POST",
+    headers,
+    body: JSON.stringify(payload),
+  });
+  if (!response.ok) {
+    const data = await response.json().catch(() => ({}));
+    const error = new Error(data.error || `Stream failed with status ${response.status}`);
+    error.response = { status: response.status, data };
+    throw error;
+  }
+
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = "";
+  let result = null;
+
+  while (true) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+
+    let boundary;
+    while ((boundary = buffer.indexOf("\n\n")) >= 0) {
+      const rawEvent = buffer.slice(0, boundary);
+      buffer = buffer.slice(boundary + 2);
+
+      let event = "message";
+      let data = "";
+      for (const line of rawEvent.split("\n")) {
+        if (line.startsWith("event: ")) event = line.slice(7);
+        else if (line.startsWith("data: ")) data += line.slice(6);
+      }
+      const parsed = data ? JSON.parse(data) : {};
+
+      if (event === "token") onToken(parsed.text);
+      else if (event === "done") result = parsed;
+      else if (event === "error") {
+        const error = new Error(parsed.error || "Generation failed");
+        error.response = { status: 502, data: parsed };
+        throw error;
+      } else onEvent(event, parsed);
+    }
+  }
+  return result;
+};
+
 export const getAgentDetails = async (agentIdOrName) => {
   try {
     const response = await axios.get(`/api/agents/${agentIdOrName}/details/`);
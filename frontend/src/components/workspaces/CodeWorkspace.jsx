@@ -1,5 +1,5 @@
 import { useState } from "react";
-import { callAgent } from "../../api/agentApi";
+import { streamAgent } from "../../api/agentApi";
 import { useAuth } from "../../contexts/AuthContext";
 import { useUsage } from "../../contexts/UsageContext";
 import { useWorkspace } from "../../contexts/WorkspaceContext";
@@ -40,8 +40,14 @@ export default function CodeWorkspace() {
         temperature: 0.1
       };
 
-      const result = await callAgent('code-assistant', payload);
-      setResponse(result);
+      // Render tokens as they arrive instead of waiting for the full completion
+      let text = "";
+      setResponse(null);
+      const result = await streamAgent('code-assistant', payload, (chunk) => {
+        text += chunk;
+        setResponse({ code: text, response: text, output: text });
+      });
+      setResponse({ ...result, code: text, response: text, output: text });
       
       if (!isAuthenticated) {
         incrementUsage('code-assistant');
@@ -211,7 +217,7 @@ export default function CodeWorkspace() {
               lineHeight: 1.5,
               overflow: "auto"
             }}>
-              {loading && (
+              {loading && !response && (
                 <div style={{ textAlign: "center", padding: 40, color: "white" }}>
                   <div style={{ fontSize: 32, marginBottom: 16 }}>💻</div>
                   <p>AI is writing your code...</p>
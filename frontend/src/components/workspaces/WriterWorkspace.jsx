@@ -1,5 +1,5 @@
 import { useState } from "react";
-import { callAgent } from "../../api/agentApi";
+import { streamAgent } from "../../api/agentApi";
 import { useAuth } from "../../contexts/AuthContext";
 import { useUsage } from "../../contexts/UsageContext";
 import { useWorkspace } from "../../contexts/WorkspaceContext";
@@ -36,8 +36,14 @@ export default function WriterWorkspace() {
         temperature: temperature
       };
 
-      const result = await callAgent('writer', payload);
-      setResponse(result);
+      // Render tokens as they arrive instead of waiting for the full completion
+      let text = "";
+      setResponse(null);
+      const result = await streamAgent('writer', payload, (chunk) => {
+        text += chunk;
+        setResponse({ response: text, content: text, output: text });
+      });
+      setResponse({ ...result, response: text, content: text, output: text });
       
       if (!isAuthenticated) {
         incrementUsage('writer');
@@ -218,7 +224,7 @@ export default function WriterWorkspace() {
               lineHeight: 1.6,
               overflow: "auto"
             }}>
-              {loading && (
+              {loading && !response && (
                 <div style={{ textAlign: "center", padding: 40 }}>
                   <div style={{ fontSize: 32, marginBottom: 16 }}>✍️</div>
                   <p>AI is crafting your content...</p>
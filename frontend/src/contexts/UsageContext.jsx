@@ -1,4 +1,5 @@
-import { createContext, useContext, useState, useEffect } from 'react';
+import { createContext, useContext, useState, useEffect, useCallback } from 'react';
+import axios from 'axios';
 
 const UsageContext = createContext();
 
@@ -12,28 +13,36 @@ export const useUsage = () => {
 
 export const UsageProvider = ({ children }) => {
   const [usage, setUsage] = useState({});
-  const FREE_LIMIT = 3; // 3 free tests per agent
+  const [freeLimit, setFreeLimit] = useState(3); // 3 free tests per agent until the server says otherwise
 
-  useEffect(() => {
-    // Load usage from localStorage
-    const savedUsage = localStorage.getItem('agent_usage');
-    if (savedUsage) {
-      setUsage(JSON.parse(savedUsage));
+  // Usage is counted and enforced by the backend; this only mirrors it for the UI
+  const refreshUsage = useCallback(async () => {
+    try {
+      const response = await axios.get('/api/tenants/quota/');
+      const counts = {};
+      Object.entries(response.data.agents || {}).forEach(([agentId, quota]) => {
+        counts[agentId] = quota.used;
+      });
+      setUsage(counts);
+      if (response.data.free_allowance != null) {
+        setFreeLimit(response.data.free_allowance);
+      }
+    } catch (err) {
+      console.error('Usage fetch error:', err);
     }
   }, []);
 
-  const saveUsage = (newUsage) => {
-    setUsage(newUsage);
-    localStorage.setItem('agent_usage', JSON.stringify(newUsage));
-  };
+  useEffect(() => {
+    localStorage.removeItem('agent_usage'); // Legacy client-side counter
+    refreshUsage();
+  }, [refreshUsage]);
 
   const incrementUsage = (agentId) => {
-    const newUsage = {
-      ...usage,
-      [agentId]: (usage[agentId] || 0) + 1
-    };
-    saveUsage(newUsage);
-    return newUsage[agentId];
+    // Optimistic update, then sync with the server's count
+    const count = (usage[agentId] || 0) + 1;
+    setUsage({ ...usage, [agentId]: count });
+    refreshUsage();
+    return count;
   };
 
   const getUsageCount = (agentId) => {
@@ -42,17 +51,16 @@ export const UsageProvider = ({ children }) => {
 
   const canUseAgent = (agentId, isAuthenticated) => {
     if (isAuthenticated) return true;
-    return getUsageCount(agentId) < FREE_LIMIT;
+    return getUsageCount(agentId) < freeLimit;
   };
 
   const getRemainingUses = (agentId, isAuthenticated) => {
     if (isAuthenticated) return Infinity;
-    return Math.max(0, FREE_LIMIT - getUsageCount(agentId));
+    return Math.max(0, freeLimit - getUsageCount(agentId));
   };
 
   const resetUsage = () => {
-    setUsage({});
-    localStorage.removeItem('agent_usage');
+    refreshUsage();
   };
 
   return (
@@ -63,9 +71,10 @@ export const UsageProvider = ({ children }) => {
       canUseAgent,
       getRemainingUses,
       resetUsage,
-      FREE_LIMIT
+      refreshUsage,
+      FREE_LIMIT: freeLimit
     }}>
       {children}
     </UsageContext.Provider>
   );
-};
\ No newline at end of file
+};
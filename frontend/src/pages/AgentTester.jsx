@@ -21,7 +21,7 @@ export default function AgentTester() {
   useEffect(() => {
     const loadAgents = async () => {
       try {
-        const data = await fetchAgents();
+        const data = await fetchAgents({ limit: 100 });
         setAgents(data);
         
         // Check if agent is specified in URL
@@ -1,28 +1,44 @@
 import { useEffect, useState } from "react";
-import { fetchAgents } from "../api/agentApi";
+import { fetchAgentPage } from "../api/agentApi";
 import AgentCard from "../components/AgentCard";
 import Navbar from "../components/Navbar";
+import SearchBar from "../components/SearchBar";
 
 export default function Marketplace() {
   const [agents, setAgents] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [query, setQuery] = useState("");
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState(null);
 
+  // Search runs on the server; wait for typing to pause before asking
   useEffect(() => {
-    const loadAgents = async () => {
+    const timer = setTimeout(async () => {
       try {
-        const data = await fetchAgents();
-        setAgents(data);
+        setLoading(true);
+        const data = await fetchAgentPage({ q: query || undefined });
+        setAgents(data.results);
+        setNextCursor(data.next_cursor);
+        setError(null);
       } catch (err) {
         setError("Failed to load agents.");
       } finally {
         setLoading(false);
       }
-    };
-    loadAgents();
-  }, []);
+    }, query ? 250 : 0);
+    return () => clearTimeout(timer);
+  }, [query]);
+
+  const loadMore = async () => {
+    try {
+      const data = await fetchAgentPage({ q: query || undefined, cursor: nextCursor });
+      setAgents((current) => [...current, ...data.results]);
+      setNextCursor(data.next_cursor);
+    } catch (err) {
+      setError("Failed to load agents.");
+    }
+  };
 
-  if (loading) return <p>Loading agents...</p>;
   if (error) return <p style={{ color: "red" }}>{error}</p>;
 
   return (
@@ -30,11 +46,19 @@ export default function Marketplace() {
       <Navbar />
       <div style={{ padding: 20 }}>
         <h2>🤖 AI Agent Marketplace</h2>
-        <div style={{ display: "flex", flexWrap: "wrap" }}>
-          {agents.map((agent) => (
-            <AgentCard key={agent.id} agent={agent} />
-          ))}
-        </div>
+        <SearchBar value={query} onChange={setQuery} />
+        {loading ? (
+          <p>Loading agents...</p>
+        ) : (
+          <div style={{ display: "flex", flexWrap: "wrap" }}>
+            {agents.map((agent) => (
+              <AgentCard key={agent.id} agent={agent} />
+            ))}
+          </div>
+        )}
+        {!loading && nextCursor && (
+          <button onClick={loadMore} style={{ marginTop: 20 }}>Load more</button>
+        )}
       </div>
     </div>
   );